@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +47,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -80,6 +82,25 @@ DATABASES = {
     }
 }
 
+# PostgreSQL when POSTGRES_DB is set (e.g. a local `docker run -e
+# POSTGRES_PASSWORD=... -p 5432:5432 postgres:16` for `manage.py test`).
+# Ingest then uses COPY and dashboards DISTINCT ON, see core/db_backend.py.
+if os.environ.get('POSTGRES_DB'):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['POSTGRES_DB'],
+        'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+    }
+
+# Pragmas run on every new SQLite connection are DEFAULT_SQLITE_PRAGMAS in
+# core/db_tuning.py (WAL, so dashboard reads proceed while an upload writes).
+# Entries here override them; None drops one and keeps SQLite's default,
+# e.g. {'mmap_size': None, 'busy_timeout': 10000}.
+SQLITE_PRAGMAS = {}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -117,7 +138,78 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
-STATIC_ROOT = BASE_DIR / 'staticfiles'  
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Uploaded batches, BOT reports and clean XML are stored by content hash so
+# identical re-uploads share one file. Run `manage.py gc_blobs` to prune
+# blobs no batch, cached validation result or error archive references.
+# Blobs are compressed on write: 'gzip', 'zstd' (needs zstandard) or None.
+BLOB_COMPRESSION = 'gzip'
+STORAGES = {
+    'default': {
+        'BACKEND': 'core.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Memoised coop_validator results for re-uploaded customer/report pairs
+VALIDATION_CACHE_TTL = 7 * 24 * 3600  # seconds, None keeps entries forever
+VALIDATION_CACHE_MAX_ENTRIES = 500
+VALIDATION_CACHE_EVICTION = 'lru'  # 'lru' or 'fifo'
+
+# Resubmissions of a batch (same Header/Identifier) only reconcile commands
+# whose content or BOT report result changed since the previous submission;
+# the results of the others are copied
+INCREMENTAL_REVALIDATION = True
+
+# Dashboard statistics and recent-upload blocks are cached in DASHBOARD_CACHE
+# until a signal says errors, batches or uploads changed (core/dashboard_cache.py).
+# File-based so invalidations from ingest workers and management commands
+# reach the web process; None turns the cache off.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'dashboard': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'dashboard',
+    },
+}
+DASHBOARD_CACHE = 'dashboard'
+DASHBOARD_CACHE_TIMEOUT = 300  # seconds, a safety net: entries are invalidated on change
+
+# Per-request profiling (wall time, queries, parse/validation time, peak
+# memory). Off by default; staff can profile a single request by sending
+# 'X-Profile: 1'. Totals per view are at /profiling/ (staff only).
+REQUEST_PROFILING = False
+REQUEST_PROFILING_MEMORY = True  # tracemalloc peak, one request at a time; slows profiled requests
+SLOW_REQUEST_MS = 1000  # profiled requests slower than this are logged with their top queries
+
+# Clients allowed to scrape /metrics/ (Prometheus text) without logging in
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+METRICS_WINDOW_BATCHES = 100  # phase metrics are summed over the newest N reconciled batches
+
+# Watch-folder ingest (manage.py ingest_watch): customer batches and BOT
+# reports dropped here are paired by Header/Identifier and reconciled
+INGEST_WATCH_DIRS = []
+INGEST_ARCHIVE_DIR = BASE_DIR / 'ingest' / 'archive'
+INGEST_FAILED_DIR = BASE_DIR / 'ingest' / 'failed'
+INGEST_WORKERS = 2  # pairs reconciled at once; further pairs wait in the folder
+
+# Errors of batches resolved more than this many days ago are moved to
+# per-batch archive files by `manage.py archive_errors` (core/archive.py)
+ERROR_ARCHIVE_AFTER_DAYS = 90
+
+# BOT reports of at least this many bytes are indexed in one streaming pass
+# (BOTValidator.stream_report) that keeps a small record per command instead
+# of the whole element tree. 0 streams every report, None never does.
+REPORT_STREAM_THRESHOLD = 32 * 1024 * 1024
+
+# Memory budget of `manage.py reconcile_large` (core/external_reconcile.py),
+# which spills both files to a temporary SQLite database instead
+EXTERNAL_RECONCILE_MEMORY_MB = 256
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -1,11 +1,23 @@
 from django.contrib import admin
-from .models import CustomerError, RecentUpload, CleanEntry, ErrorHistory,BatchHistory
+from .models import Customer, CustomerError, ErrorCode, RecentUpload, CleanEntry, ErrorHistory,BatchHistory, ValidationResult, CommandFingerprint, ErrorArchive
+
+@admin.register(Customer)
+class CustomerAdmin(admin.ModelAdmin):
+    list_display = ('identifier', 'name', 'customer_code', 'phone', 'updated_at')
+    search_fields = ('identifier', 'name', 'customer_code', 'phone')
+
+@admin.register(ErrorCode)
+class ErrorCodeAdmin(admin.ModelAdmin):
+    list_display = ('code', 'severity', 'category', 'template', 'created_at')
+    list_filter = ('severity', 'category')
+    search_fields = ('code', 'template')
 
 @admin.register(CustomerError)
 class CustomerErrorAdmin(admin.ModelAdmin):
-    list_display = ('identifier', 'customer_name', 'error_code', 'severity', 'status', 'created_at')
+    list_display = ('identifier', 'customer', 'error_code', 'severity', 'status', 'created_at')
     list_filter = ('severity', 'status', 'created_at')
-    search_fields = ('customer_name', 'account_number', 'error_code', 'national_id')
+    list_select_related = ('customer',)
+    search_fields = ('customer__name', 'account_number', 'error_code', 'national_id')
     date_hierarchy = 'created_at'
 
 @admin.register(RecentUpload)
@@ -21,9 +33,11 @@ class RecentUploadAdmin(admin.ModelAdmin):
 
 @admin.register(CleanEntry)
 class CleanEntryAdmin(admin.ModelAdmin):
-    list_display = ('identifier', 'customer_name', 'account_number', 'amount', 'batch_identifier', 'created_at')
+    list_display = ('identifier', 'customer', 'account_number', 'amount', 'batch_identifier', 'created_at')
     list_filter = ('status', 'created_at')
-    search_fields = ('identifier', 'customer_name', 'account_number', 'national_id', 'customer_code', 'batch_identifier')
+    list_select_related = ('customer',)
+    search_fields = ('identifier', 'customer__name', 'account_number', 'national_id', 'customer__customer_code',
+                     'batch_identifier')
     date_hierarchy = 'created_at'
 
 @admin.register(ErrorHistory)
@@ -49,4 +63,24 @@ class BatchHistoryAdmin(admin.ModelAdmin):
     date_hierarchy = 'upload_date'
     def uploaded_by(self, obj):
         return obj.uploaded_by.username
-    uploaded_by.admin_order_field = 'uploaded_by__username'
\ No newline at end of file
+    uploaded_by.admin_order_field = 'uploaded_by__username'
+
+@admin.register(ValidationResult)
+class ValidationResultAdmin(admin.ModelAdmin):
+    list_display = ('batch', 'rules_version', 'hit_count', 'created_at', 'last_hit_at')
+    list_filter = ('rules_version', 'created_at')
+    search_fields = ('batch__batch_identifier', 'customer_sha256', 'report_sha256')
+    date_hierarchy = 'created_at'
+
+@admin.register(CommandFingerprint)
+class CommandFingerprintAdmin(admin.ModelAdmin):
+    list_display = ('identifier', 'customer_code', 'batch_identifier', 'outcome', 'created_at')
+    list_filter = ('outcome', 'created_at')
+    search_fields = ('identifier', 'customer_code', 'batch_identifier')
+    date_hierarchy = 'created_at'
+
+@admin.register(ErrorArchive)
+class ErrorArchiveAdmin(admin.ModelAdmin):
+    list_display = ('batch', 'error_count', 'size', 'archived_at')
+    search_fields = ('batch__batch_identifier',)
+    date_hierarchy = 'archived_at'
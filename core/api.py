@@ -0,0 +1,253 @@
+# core/api.py
+"""
+Read-only JSON API over errors, batches and clean entries.
+
+  GET /api/errors/         CustomerError
+  GET /api/batches/        BatchHistory
+  GET /api/clean-entries/  CleanEntry
+
+Query parameters:
+  <filter>  the resource's FILTERS, e.g. ?batch=TZ0230653&status=pending.
+            `__in` filters take comma-separated values, `_after`/`_before`
+            an ISO date or datetime.
+  fields    comma-separated subset of the resource's FIELDS (default: all).
+  limit     page size, default 100, at most 1000.
+  after     keyset cursor: rows come newest id first and a page continues
+            below the `id` given here (the response's `next` link).
+
+Every response has an ETag made from the newest update time and the row
+count of the filtered rows, and the query. A client polling with
+If-None-Match gets a 304 from one aggregate query, without any rows being
+read or serialised.
+
+Requests without a logged-in session get a JSON 401 rather than the
+redirect to the HTML login page the rest of the site uses.
+"""
+import hashlib
+import logging
+from datetime import datetime, time
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.http import condition, require_GET
+
+from .models import BatchHistory, CleanEntry, CustomerError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+class Resource:
+    """
+    One API collection. `fields` maps output names to ORM paths, `filters`
+    maps query parameters to lookups and `version_field` is the timestamp
+    the ETag is taken from.
+    """
+
+    def __init__(self, model, fields, filters, version_field):
+        self.model = model
+        self.fields = fields
+        self.filters = filters
+        self.version_field = version_field
+
+    def queryset(self, params):
+        """Filtered queryset for the request's query parameters. Raises ValueError on bad input."""
+        lookups = {}
+        for name, value in params.items():
+            if name not in self.filters or value == '':
+                continue
+            lookup = self.filters[name]
+            if name.endswith('__in'):
+                value = [v for v in value.split(',') if v]
+            elif name.endswith(('_after', '_before')):
+                value = parse_timestamp(name, value)
+            lookups[lookup] = value
+        return self.model.objects.filter(**lookups)
+
+    def selected_fields(self, params):
+        if not params.get('fields'):
+            return list(self.fields)
+        names = [name.strip() for name in params['fields'].split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}. "
+                             f"Available: {', '.join(self.fields)}")
+        return names
+
+
+def parse_timestamp(name, value):
+    """Aware datetime from an ISO datetime, or midnight of an ISO date."""
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            parsed = datetime.combine(day, time.min) if day else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f"{name} must be an ISO date or datetime, got {value!r}")
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def parse_int(params, name, default, minimum, maximum=None):
+    try:
+        value = int(params.get(name, default))
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+    if value < minimum or (maximum is not None and value > maximum):
+        raise ValueError(f"{name} must be between {minimum} and {maximum}" if maximum
+                         else f"{name} must be at least {minimum}")
+    return value
+
+
+RESOURCES = {
+    'errors': Resource(
+        CustomerError,
+        fields={
+            'id': 'id',
+            'batch': 'batch__batch_identifier',
+            'identifier': 'identifier',
+            'customer_name': 'customer__name',
+            'customer_code': 'customer__customer_code',
+            'phone': 'customer__phone',
+            'account_number': 'account_number',
+            'amount': 'amount',
+            'error_code': 'error_code',
+            'category': 'code__category',
+            'severity': 'severity',
+            'message': 'message',
+            'line_number': 'line_number',
+            'status': 'status',
+            'notes': 'notes',
+            'uploaded_by': 'uploaded_by__username',
+            'created_at': 'created_at',
+            'updated_at': 'updated_at',
+            'resolved_at': 'resolved_at',
+        },
+        filters={
+            'batch': 'batch__batch_identifier',
+            'status': 'status',
+            'status__in': 'status__in',
+            'severity': 'severity',
+            'error_code': 'code__code',
+            'error_code__in': 'code__code__in',
+            'category': 'code__category',
+            'identifier': 'identifier',
+            'created_after': 'created_at__gte',
+            'created_before': 'created_at__lt',
+            'updated_after': 'updated_at__gte',
+        },
+        version_field='updated_at',
+    ),
+    'batches': Resource(
+        BatchHistory,
+        fields={
+            'id': 'id',
+            'batch': 'batch_identifier',
+            'status': 'status',
+            'error_count': 'error_count',
+            'filename': 'filename',
+            'uploaded_by': 'uploaded_by__username',
+            'upload_date': 'upload_date',
+            'resolved_date': 'resolved_date',
+            'updated_at': 'updated_at',
+        },
+        filters={
+            'batch': 'batch_identifier',
+            'status': 'status',
+            'uploaded_by': 'uploaded_by__username',
+            'uploaded_after': 'upload_date__gte',
+            'uploaded_before': 'upload_date__lt',
+        },
+        version_field='updated_at',
+    ),
+    'clean-entries': Resource(
+        CleanEntry,
+        fields={
+            'id': 'id',
+            'batch': 'batch_identifier',
+            'identifier': 'identifier',
+            'customer_name': 'customer__name',
+            'customer_code': 'customer__customer_code',
+            'account_number': 'account_number',
+            'amount': 'amount',
+            'national_id': 'national_id',
+            'status': 'status',
+            'created_at': 'created_at',
+        },
+        filters={
+            'batch': 'batch_identifier',
+            'status': 'status',
+            'identifier': 'identifier',
+            'customer_code': 'customer__customer_code',
+            'created_after': 'created_at__gte',
+            'created_before': 'created_at__lt',
+        },
+        # Clean entries are never updated, only added and deleted
+        version_field='created_at',
+    ),
+}
+
+
+def collection_etag(request, resource_name):
+    """ETag of a filtered collection: newest update time, row count and the query itself."""
+    resource = RESOURCES[resource_name]
+    try:
+        queryset = resource.queryset(request.GET)
+    except ValueError:
+        return None
+    state = queryset.order_by().aggregate(version=Max(resource.version_field), count=Count('id'))
+    query = sorted(request.GET.items())
+    digest = hashlib.sha1(f"{resource_name}|{query}|{state['version']}|{state['count']}".encode())
+    return digest.hexdigest()
+
+
+def api_login_required(view):
+    """login_required for API clients: a JSON 401 instead of a redirect."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+@api_login_required
+@require_GET
+@condition(etag_func=collection_etag)
+def collection(request, resource_name):
+    resource = RESOURCES[resource_name]
+    try:
+        queryset = resource.queryset(request.GET)
+        names = resource.selected_fields(request.GET)
+        limit = parse_int(request.GET, 'limit', DEFAULT_LIMIT, 1, MAX_LIMIT)
+        after = parse_int(request.GET, 'after', 0, 0) if request.GET.get('after') else None
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    if after is not None:
+        queryset = queryset.filter(id__lt=after)
+    paths = ['id'] + [resource.fields[name] for name in names if name != 'id']
+    # One row more than asked tells whether there is a next page
+    rows = list(queryset.order_by('-id').values(*paths)[:limit + 1])
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_url = None
+    if more:
+        query = request.GET.copy()
+        query['after'] = rows[-1]['id']
+        next_url = f"{request.path}?{query.urlencode()}"
+    return JsonResponse(
+        {
+            'results': [{name: row[resource.fields[name]] for name in names} for row in rows],
+            'next': next_url,
+        },
+        encoder=DjangoJSONEncoder,
+    )
@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import dashboard_cache
+        from .db_tuning import apply_sqlite_pragmas
+        from .models import BatchHistory, CustomerError, RecentUpload
+
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid='core.apply_sqlite_pragmas')
+        for signal in (post_save, post_delete):
+            for model in (CustomerError, BatchHistory):
+                signal.connect(dashboard_cache.on_error_change, sender=model,
+                               dispatch_uid=f'core.dashboard_cache.{signal is post_save}.{model.__name__}')
+            signal.connect(dashboard_cache.on_upload_change, sender=RecentUpload,
+                           dispatch_uid=f'core.dashboard_cache.{signal is post_save}.RecentUpload')
@@ -0,0 +1,219 @@
+# core/archive.py
+"""
+Archival of CustomerError rows from old, resolved batches.
+
+archive_batch() writes every error of a batch, with its ErrorHistory and
+ErrorParameter rows, as one JSON object per line to a file in default
+storage. It records an ErrorArchive row and then deletes the errors from
+the hot tables in chunks, so dashboard queries only scan active data. With
+the content-addressed storage the file is compressed by the storage
+itself, otherwise it is gzipped before saving.
+
+Archived errors stay readable: archived_errors() streams the file back
+into unsaved CustomerError instances, which is what the error dashboard
+and the /archive/<batch>/ view do for an archived batch. restore_batch()
+puts a batch back into the hot tables.
+"""
+import gzip
+import io
+import json
+import logging
+import tempfile
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .batch_deletion import delete_in_chunks
+from .customers import assign_customers
+from .dashboard_cache import errors_changed
+from .error_codes import link_codes
+from .error_parameters import save_parameters
+from .models import BatchHistory, CustomerError, ErrorArchive, ErrorHistory, ErrorParameter
+from .storage import ContentAddressedStorage
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = 'archive'
+READ_CHUNK_SIZE = 2000
+
+
+class ArchiveEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder that keeps microseconds, so restored timestamps match the originals."""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def field_names(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def archivable_batches(days=None):
+    """Resolved batches, resolved more than `days` ago, with errors and none pending."""
+    if days is None:
+        days = getattr(settings, 'ERROR_ARCHIVE_AFTER_DAYS', 90)
+    cutoff = timezone.now() - timedelta(days=days)
+    errors = CustomerError.objects.filter(batch=OuterRef('pk'))
+    return (BatchHistory.objects
+            .filter(status='resolved', resolved_date__lt=cutoff, error_archive__isnull=True)
+            .filter(Exists(errors))
+            .exclude(Exists(errors.filter(status='pending')))
+            .order_by('resolved_date'))
+
+
+def iter_error_records(batch):
+    """
+    Yield one dict per error of a batch, with its history under 'history'
+    and its Exception parameters under 'parameters'.
+    """
+    errors = (CustomerError.objects.filter(batch=batch).order_by('id')
+              .values(*field_names(CustomerError)).iterator(chunk_size=READ_CHUNK_SIZE))
+    history = (ErrorHistory.objects.filter(error__batch=batch).order_by('error_id', 'id')
+               .values(*field_names(ErrorHistory)).iterator(chunk_size=READ_CHUNK_SIZE))
+    parameters = (ErrorParameter.objects.filter(error__batch=batch).order_by('error_id', 'id')
+                  .values_list('error_id', 'key__name', 'value').iterator(chunk_size=READ_CHUNK_SIZE))
+    # All streams are ordered by error id: merge them without loading any
+    pending = next(history, None)
+    pending_parameter = next(parameters, None)
+    for record in errors:
+        record['history'] = []
+        while pending is not None and pending['error_id'] <= record['id']:
+            if pending['error_id'] == record['id']:
+                record['history'].append(pending)
+            pending = next(history, None)
+        record['parameters'] = {}
+        while pending_parameter is not None and pending_parameter[0] <= record['id']:
+            error_id, key, value = pending_parameter
+            if error_id == record['id']:
+                record['parameters'][key] = value
+            pending_parameter = next(parameters, None)
+        yield record
+
+
+def archive_batch(batch):
+    """Move the errors of one batch to an archive file. Returns the ErrorArchive."""
+    compression = None if (isinstance(default_storage, ContentAddressedStorage)
+                           and default_storage.compression) else 'gzip'
+    counts = {}
+    error_count = 0
+    with tempfile.TemporaryFile() as tmp:
+        raw = gzip.GzipFile(fileobj=tmp, mode='wb', mtime=0) if compression == 'gzip' else tmp
+        for record in iter_error_records(batch):
+            raw.write(json.dumps(record, cls=ArchiveEncoder).encode('utf-8') + b'\n')
+            counts[record['status']] = counts.get(record['status'], 0) + 1
+            error_count += 1
+        if raw is not tmp:
+            raw.close()
+        tmp.seek(0)
+        suffix = '.jsonl.gz' if compression == 'gzip' else '.jsonl'
+        name = default_storage.save(f'{ARCHIVE_PREFIX}/errors_{batch.batch_identifier}{suffix}', File(tmp))
+    # Bytes on disk, after the storage's own compression
+    size = default_storage.size(name)
+
+    archive = ErrorArchive.objects.create(
+        batch=batch,
+        archive_file=name,
+        compression=compression,
+        error_count=error_count,
+        status_counts=counts,
+        size=size,
+    )
+
+    def clear_history(pks):
+        ErrorHistory.objects.filter(error_id__in=pks).delete()
+
+    delete_in_chunks(CustomerError.objects.filter(batch=batch), before_chunk=clear_history)
+    logger.info(f"Archived {error_count} errors of batch {batch.batch_identifier} to {name}")
+    return archive
+
+
+def iter_archive(archive):
+    """Yield the stored error dicts of an ErrorArchive, one at a time."""
+    with default_storage.open(archive.archive_file, 'rb') as f:
+        stream = gzip.GzipFile(fileobj=f) if archive.compression == 'gzip' else f
+        for line in io.TextIOWrapper(stream, encoding='utf-8'):
+            if line.strip():
+                yield json.loads(line)
+
+
+def to_instance(model, record):
+    """Unsaved model instance from a stored dict (values converted back from JSON)."""
+    values = {}
+    for field in model._meta.concrete_fields:
+        if field.attname in record:
+            value = record[field.attname]
+            values[field.attname] = value if value is None else field.to_python(value)
+    return model(**values)
+
+
+def archived_errors(archive, identifier=None, error_code=None, status=None, offset=0, limit=None):
+    """
+    Read-through access to an archive: unsaved CustomerError instances,
+    optionally filtered, each with its ErrorHistory instances in
+    `archived_history`.
+    """
+    errors = []
+    matched = 0
+    for record in iter_archive(archive):
+        if ((identifier and record['identifier'] != identifier)
+                or (error_code and record['error_code'] != error_code)
+                or (status and record['status'] != status)):
+            continue
+        matched += 1
+        if matched <= offset:
+            continue
+        error = to_instance(CustomerError, record)
+        error.archived_history = [to_instance(ErrorHistory, h) for h in record.get('history', [])]
+        error.archived_parameters = record.get('parameters', {})
+        errors.append(error)
+        if limit is not None and len(errors) >= limit:
+            break
+    return errors
+
+
+def restore_batch(archive):
+    """Put the errors of an archived batch back into the hot tables and drop the archive."""
+    errors, history, parameters = [], [], []
+    details = {}
+    for record in iter_archive(archive):
+        error = to_instance(CustomerError, record)
+        errors.append(error)
+        if error.customer_id is None:
+            # Archives written before customers existed carry their details instead
+            details.setdefault(error.identifier, (record.get('customer_code') or '', record.get('customer_name') or '',
+                                                  record.get('phone') or ''))
+        history.extend(to_instance(ErrorHistory, h) for h in record.get('history', []))
+        parameters.append((error, record.get('parameters', {})))
+
+    with transaction.atomic():
+        # bulk_create stamps auto_now/auto_now_add fields; put the originals back after
+        stamps = [(e.created_at, e.updated_at) for e in errors]
+        changed = [h.changed_at for h in history]
+        assign_customers(errors, details)
+        CustomerError.objects.bulk_create(errors, batch_size=500)
+        errors_changed()
+        ErrorHistory.objects.bulk_create(history, batch_size=500)
+        save_parameters(parameters)
+        for error, (created_at, updated_at) in zip(errors, stamps):
+            error.created_at, error.updated_at = created_at, updated_at
+        for entry, changed_at in zip(history, changed):
+            entry.changed_at = changed_at
+        CustomerError.objects.bulk_update(errors, ['created_at', 'updated_at'], batch_size=500)
+        ErrorHistory.objects.bulk_update(history, ['changed_at'], batch_size=500)
+        # Archives written before the code catalogue existed carry no code_id
+        link_codes(CustomerError.objects.filter(batch=archive.batch))
+        name = archive.archive_file
+        archive.delete()
+
+    if not ErrorArchive.objects.filter(archive_file=name).exists():
+        default_storage.delete(name)
+    logger.info(f"Restored {len(errors)} errors of batch {archive.batch.batch_identifier}")
+    return len(errors)
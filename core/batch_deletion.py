@@ -0,0 +1,107 @@
+# core/batch_deletion.py
+"""
+Delete a BatchHistory with everything that hangs off it.
+
+Rows are removed through indexed lookups (the batch FK and
+CleanEntry.batch_identifier) in chunks of DELETE_CHUNK_SIZE, each chunk in
+its own transaction, so SQLite's write lock is released between chunks and
+uploads or dashboard updates can interleave with a 100k-error delete. The
+stored customer XML, BOT report and clean XML are removed last, unless
+another batch still points at the same content-addressed blob.
+"""
+import logging
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+
+from .models import (
+    BatchHistory, CleanEntry, CommandFingerprint, CustomerError, ErrorArchive, ErrorHistory, ValidationResult,
+)
+
+logger = logging.getLogger(__name__)
+
+DELETE_CHUNK_SIZE = 2000
+
+
+def delete_in_chunks(queryset, chunk_size=DELETE_CHUNK_SIZE, before_chunk=None):
+    """
+    Delete the rows of `queryset` chunk_size primary keys at a time, one
+    transaction per chunk. `before_chunk(pks)` runs inside the chunk's
+    transaction first (to clear dependent rows). Returns the number of
+    rows deleted.
+    """
+    model = queryset.model
+    deleted = 0
+    while True:
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return deleted
+        with transaction.atomic():
+            if before_chunk is not None:
+                before_chunk(pks)
+            count, _by_model = model.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
+        if count == 0:
+            # Nothing left that matches (rows were removed concurrently)
+            return deleted
+
+
+def stored_files(batch):
+    """Storage names written for a batch: uploads, report, clean XML, error archive."""
+    names = {batch.xml_file.name, batch.report_file.name if batch.report_file else None, batch.clean_xml_file}
+    names.update(ValidationResult.objects.filter(batch=batch).values_list('clean_xml_file', flat=True))
+    names.update(ErrorArchive.objects.filter(batch=batch).values_list('archive_file', flat=True))
+    return {name for name in names if name}
+
+
+def delete_stored_files(names, exclude_batch_id):
+    """Delete files no other batch references. Returns the names removed."""
+    removed = []
+    for name in sorted(names):
+        shared = (BatchHistory.objects.exclude(pk=exclude_batch_id)
+                  .filter(Q(xml_file=name) | Q(report_file=name) | Q(clean_xml_file=name)).exists()
+                  or ValidationResult.objects.exclude(batch_id=exclude_batch_id)
+                  .filter(clean_xml_file=name).exists()
+                  or ErrorArchive.objects.exclude(batch_id=exclude_batch_id)
+                  .filter(archive_file=name).exists())
+        if shared:
+            logger.debug(f"Keeping {name}, still referenced by another batch")
+            continue
+        try:
+            if default_storage.exists(name):
+                default_storage.delete(name)
+                removed.append(name)
+        except OSError as e:
+            logger.warning(f"Could not delete stored file {name}: {e}")
+    return removed
+
+
+def purge_batch(batch, chunk_size=DELETE_CHUNK_SIZE, delete_files=True):
+    """
+    Delete a batch, its errors (and their history), clean entries,
+    fingerprints, cached validation results and error archive. Returns a
+    dict of counts.
+    """
+    summary = {'batch_identifier': batch.batch_identifier}
+    names = stored_files(batch) if delete_files else set()
+
+    def clear_history(pks):
+        ErrorHistory.objects.filter(error_id__in=pks).delete()
+
+    summary['errors'] = delete_in_chunks(
+        CustomerError.objects.filter(batch=batch), chunk_size, before_chunk=clear_history)
+    summary['clean_entries'] = delete_in_chunks(
+        CleanEntry.objects.filter(batch_identifier=batch.batch_identifier), chunk_size)
+    summary['fingerprints'] = delete_in_chunks(
+        CommandFingerprint.objects.filter(batch=batch), chunk_size)
+    with transaction.atomic():
+        ValidationResult.objects.filter(batch=batch).delete()
+        ErrorArchive.objects.filter(batch=batch).delete()
+        BatchHistory.objects.filter(pk=batch.pk).delete()
+
+    summary['files'] = delete_stored_files(names, batch.pk) if names else []
+    logger.info(f"Deleted batch {batch.batch_identifier}: {summary['errors']} errors, "
+                f"{summary['clean_entries']} clean entries, {summary['fingerprints']} fingerprints, "
+                f"{len(summary['files'])} files")
+    return summary
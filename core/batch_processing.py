@@ -0,0 +1,194 @@
+# core/batch_processing.py
+"""
+Headless reconciliation of customer XML / BOT report pairs.
+
+Used by `manage.py process_batches`: files are found on disk, classified as
+customer batches or BOT reports, paired by their Header/Identifier and run
+through the same steps as coop_validator (store both files, create a
+BatchHistory, BOTValidator.process_xml_pair, store the clean XML, memoise
+the result).
+"""
+import glob
+import logging
+import os
+import time
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .bot_validator import BOTValidator
+from .header_probe import CUSTOMER, REPORT, probe_header
+from .models import BatchHistory
+from .result_cache import ValidationResultCache
+
+logger = logging.getLogger(__name__)
+
+XML_EXTENSIONS = ('.xml', '.txt')
+
+
+def strip_bom(content):
+    if content.startswith(b'\xef\xbb\xbf'):
+        return content[3:]
+    return content
+
+
+def discover(patterns):
+    """Expand directories (recursively) and glob patterns into a sorted list of files."""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for dirpath, _dirnames, filenames in os.walk(pattern):
+                for filename in filenames:
+                    if filename.lower().endswith(XML_EXTENSIONS):
+                        paths.add(os.path.join(dirpath, filename))
+        else:
+            paths.update(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+    return sorted(paths)
+
+
+def classify(path):
+    """
+    Return (kind, header identifier) for a file: kind is CUSTOMER for a
+    namespaced <Batch>, REPORT for a <BatchResponse>, or None if neither.
+    Only the Header is read.
+    """
+    header = probe_header(path)
+    return header.kind, header.identifier
+
+
+def pair_files(paths):
+    """
+    Pair customer files with reports by Header/Identifier.
+
+    Returns (pairs, unpaired): pairs maps identifier -> (customer path, report
+    path); when several files share an identifier the most recently modified
+    one wins. unpaired lists (path, reason) for everything left over.
+    """
+    found = {CUSTOMER: {}, REPORT: {}}
+    unpaired = []
+    for path in paths:
+        kind, identifier = classify(path)
+        if kind is None:
+            unpaired.append((path, 'not a customer batch or BOT report'))
+            continue
+        if not identifier:
+            unpaired.append((path, 'no Header/Identifier'))
+            continue
+        current = found[kind].get(identifier)
+        if current is None or os.path.getmtime(path) > os.path.getmtime(current):
+            if current is not None:
+                unpaired.append((current, f'superseded by {path}'))
+            found[kind][identifier] = path
+        else:
+            unpaired.append((path, f'superseded by {current}'))
+
+    pairs = {}
+    for identifier, customer_path in found[CUSTOMER].items():
+        report_path = found[REPORT].get(identifier)
+        if report_path is None:
+            unpaired.append((customer_path, f'no BOT report for {identifier}'))
+        else:
+            pairs[identifier] = (customer_path, report_path)
+    for identifier, report_path in found[REPORT].items():
+        if identifier not in found[CUSTOMER]:
+            unpaired.append((report_path, f'no customer batch for {identifier}'))
+    return dict(sorted(pairs.items())), unpaired
+
+
+def process_pair(identifier, customer_path, report_path, username,
+                 incremental=True, use_cache=True, output_dir=None):
+    """
+    Reconcile one pair of files. Returns a summary dict; failures are
+    reported in its 'error' key rather than raised, so one bad pair does
+    not stop a bulk run.
+    """
+    start = time.perf_counter()
+    summary = {
+        'identifier': identifier,
+        'customer_file': customer_path,
+        'report_file': report_path,
+        'batch_id': None,
+        'commands': 0,
+        'clean': 0,
+        'bytes': 0,
+        'cached': False,
+        'clean_xml': None,
+        'error': None,
+    }
+    try:
+        with open(customer_path, 'rb') as f:
+            customer_content = strip_bom(f.read())
+        with open(report_path, 'rb') as f:
+            report_content = strip_bom(f.read())
+        summary['bytes'] = len(customer_content) + len(report_content)
+        user = User.objects.get(username=username)
+
+        result_cache = ValidationResultCache()
+        customer_sha256, report_sha256 = result_cache.key_for(customer_content, report_content)
+        if use_cache:
+            cached = result_cache.get(customer_sha256, report_sha256)
+            if cached:
+                summary.update(
+                    batch_id=cached.batch_id,
+                    commands=cached.corrections.get('total_input_commands', 0),
+                    clean=cached.corrections.get('total_clean_commands', 0),
+                    cached=True,
+                    clean_xml=cached.clean_xml_file,
+                )
+                return summary
+
+        timestamp = timezone.now().strftime('%Y%m%d_%H%M%S_%f')
+        customer_name = os.path.basename(customer_path)
+        stored_customer = default_storage.save(
+            f'xml_uploads/original_{timestamp}_{customer_name}', ContentFile(customer_content))
+        stored_report = default_storage.save(
+            f'bot_reports/bot_report_{timestamp}_{os.path.basename(report_path)}', ContentFile(report_content))
+        batch = BatchHistory.objects.create(
+            batch_identifier=f'{identifier}_{timestamp}',
+            xml_file=stored_customer,
+            report_file=stored_report,
+            uploaded_by=user,
+            filename=customer_name,
+            status='pending'
+        )
+        summary['batch_id'] = batch.id
+
+        clean_xml, corrections = BOTValidator().process_xml_pair(
+            customer_content, report_content, batch=batch, incremental=incremental)
+        summary['commands'] = corrections.get('total_input_commands', 0)
+        summary['clean'] = corrections.get('total_clean_commands', 0)
+        summary['error'] = corrections.get('error')
+
+        clean_xml_path = None
+        if clean_xml:
+            clean_xml_path = default_storage.save(f'clean_xml/clean_data_{timestamp}.xml', ContentFile(clean_xml))
+            batch.clean_xml_file = clean_xml_path
+            batch.status = 'completed'
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+                summary['clean_xml'] = os.path.join(output_dir, f'clean_{identifier}.xml')
+                with open(summary['clean_xml'], 'wb') as f:
+                    f.write(clean_xml)
+            else:
+                summary['clean_xml'] = clean_xml_path
+        else:
+            batch.status = 'failed'
+        batch.save()
+        result_cache.put(customer_sha256, report_sha256, batch, corrections, clean_xml_path)
+    except Exception as e:
+        logger.error(f"Error processing {identifier}: {str(e)}", exc_info=True)
+        summary['error'] = str(e)
+    finally:
+        summary['seconds'] = time.perf_counter() - start
+    return summary
+
+
+def init_worker():
+    """ProcessPoolExecutor initializer: set Django up and drop inherited DB connections."""
+    import django
+    from django.db import connections
+
+    django.setup()
+    connections.close_all()
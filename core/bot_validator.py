@@ -1,108 +1,428 @@
 # core/bot_validator.py
 import xml.etree.ElementTree as ET
 from io import BytesIO, StringIO
+import codecs
+import io
 import logging
 import re
+import sys
 import chardet
-from .models import CustomerError, CleanEntry
+from django.conf import settings
+from .models import BatchHistory, CustomerError, CleanEntry
+from .fingerprints import command_hash, fingerprint_for, previous_fingerprints, result_hash, save_fingerprints
+from .metrics import PipelineMetrics
+from .db_backend import bulk_insert
+from .customers import assign_customers
+from .error_codes import assign_codes, get_error_code
+from .dashboard_cache import errors_changed
 
 logger = logging.getLogger(__name__)
 
+BATCH_NAMESPACE = 'http://cb4.creditinfosolutions.com/BatchUploader/Batch'
+XML_DECL_PATTERN = re.compile(r'<\?xml[^>]+?\?>')
+
+# stream_report() feeds the parser this many bytes at a time, and guesses
+# the encoding from the first REPORT_SNIFF_BYTES
+REPORT_CHUNK_SIZE = 64 * 1024
+REPORT_SNIFF_BYTES = 64 * 1024
+# (encoding, errors) tried in turn, after the detected encoding, as parse_report() does
+REPORT_FALLBACK_ENCODINGS = (
+    ('utf-8', 'ignore'),
+    ('utf-16', 'strict'),
+    ('utf-16-le', 'strict'),
+    ('utf-16-be', 'strict'),
+    ('latin-1', 'strict'),
+)
+
+# CustomerError fields copied when an unchanged command's result is carried over
+CARRIED_ERROR_FIELDS = (
+    'identifier', 'customer_id', 'account_number', 'amount', 'national_id',
+    'full_error_code', 'error_message', 'loan_amount', 'error_code', 'message',
+    'line_number', 'severity', 'customer_details',
+)
+
+
+def report_chunks(source, chunk_size=REPORT_CHUNK_SIZE):
+    """Byte chunks of a report given as bytes or as a binary file object (read from the start)."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        for start in range(0, len(source), chunk_size):
+            yield bytes(source[start:start + chunk_size])
+    else:
+        source.seek(0)
+        yield from iter(lambda: source.read(chunk_size), b'')
+
+
+def report_size(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    return source.seek(0, io.SEEK_END)
+
+
+class ReportRecord:
+    """
+    What reconciliation uses of one report Command, without its XML: the
+    ResultCode, the first ErrorMessage ('Unknown error' if there is none,
+    None if it is empty) and an (ErrorCode, FullErrorCode) pair per Exception.
+    """
+    __slots__ = ('result_code', 'error_message', 'exceptions')
+
+    def __init__(self, result_code, error_message, exceptions=()):
+        self.result_code = result_code
+        self.error_message = error_message
+        self.exceptions = exceptions
+
+    def __repr__(self):
+        return f"ReportRecord({self.result_code!r}, {self.error_message!r}, {self.exceptions!r})"
+
+
 class BOTValidator:
-    def process_xml_pair(self, customer_content, bot_content, batch=None):
+    # Bump whenever reconciliation rules change so memoised results
+    # (see core/result_cache.py) from older rules are not reused.
+    RULES_VERSION = '1'
+
+    namespaces = {'batch': BATCH_NAMESPACE}
+
+    def decode(self, content, label):
+        """Decode XML bytes using chardet, strip the XML declaration."""
+        detected = chardet.detect(content)
+        encoding = detected['encoding'] if detected['encoding'] else 'utf-8'
+        try:
+            xml_str = content.decode(encoding)
+            logger.debug(f"{label} decoded as {encoding}")
+        except UnicodeDecodeError:
+            xml_str = content.decode('utf-8', errors='ignore')
+            logger.warning(f"{label} decoded with UTF-8 ignore fallback")
+
+        logger.debug(f"{label} first 100 chars: {xml_str[:100]}")
+        # Strip XML declaration to avoid encoding mismatches
+        return XML_DECL_PATTERN.sub('', xml_str).strip()
+
+    def parse_report(self, bot_content, metrics=None):
         """
-        Process customer XML and BOT report to generate clean XML and corrections.
-        customer_content: bytes (source XML)
-        bot_content: bytes (report XML or TXT)
-        batch: BatchHistory instance
-        Returns: (clean_xml_bytes, corrections_dict)
+        Parse the BOT report, retrying common encodings if chardet guessed wrong.
+        Returns the root element, raises ET.ParseError if nothing works.
         """
+        metrics = metrics or PipelineMetrics()
+        with metrics.phase('decode', items=1, nbytes=len(bot_content)):
+            bot_xml_str = self.decode(bot_content, 'BOT report')
         try:
-            # Detect encoding using chardet
-            customer_result = chardet.detect(customer_content)
-            bot_result = chardet.detect(bot_content)
-            
-            customer_encoding = customer_result['encoding'] if customer_result['encoding'] else 'utf-8'
-            bot_encoding = bot_result['encoding'] if bot_result['encoding'] else 'utf-8'
-            
-            try:
-                customer_xml_str = customer_content.decode(customer_encoding)
-                logger.debug(f"Customer XML decoded as {customer_encoding}")
-            except UnicodeDecodeError:
-                customer_xml_str = customer_content.decode('utf-8', errors='ignore')
-                logger.warning("Customer XML decoded with UTF-8 ignore fallback")
+            with metrics.phase('parse_report', nbytes=len(bot_content)):
+                bot_root = ET.parse(StringIO(bot_xml_str)).getroot()
+            logger.debug(f"BOT report XML parsed successfully. Root tag: {bot_root.tag}")
+            return bot_root
+        except ET.ParseError as e:
+            logger.error(f"BOT report XML parsing error: {str(e)}")
+            for enc in ['utf-16', 'utf-16-le', 'utf-16-be', 'latin-1']:
+                try:
+                    with metrics.phase('parse_report'):
+                        bot_xml_str = XML_DECL_PATTERN.sub('', bot_content.decode(enc)).strip()
+                        bot_root = ET.parse(StringIO(bot_xml_str)).getroot()
+                    logger.debug(f"BOT report parsed successfully with {enc} fallback")
+                    return bot_root
+                except (UnicodeDecodeError, ET.ParseError):
+                    continue
+            raise
+
+    def find_commands(self, customer_root):
+        """Return (command elements, tag used) from the customer XML Commands block."""
+        namespaces = self.namespaces
+        commands_elem = customer_root.find('.//batch:Commands', namespaces)
+        if commands_elem is None:
+            logger.warning("No Commands element found in customer XML")
+            return [], None
+
+        # Try different variations of the Command tag
+        command_variations = [
+            ('batch:Command', './/batch:Command'),
+            ('batch:command', './/batch:command'),
+            ('batch:COMMAND', './/batch:COMMAND'),
+            ('batch:Request', './/batch:Request'),
+            ('batch:Transaction', './/batch:Transaction')
+        ]
+        for tag_name, tag_path in command_variations:
+            commands = commands_elem.findall(tag_path, namespaces)
+            if commands:
+                logger.debug(f"Found commands using tag: {tag_name}")
+                return commands, tag_name
+
+        # If no specific tag is found, try any direct children of Commands
+        commands = [child for child in commands_elem if child.tag.startswith('{' + BATCH_NAMESPACE + '}')]
+        if commands:
+            logger.debug(f"Found commands as direct children of Commands: {[child.tag for child in commands]}")
+            return commands, "direct children of Commands"
+        return [], None
+
+    def header_identifier(self, customer_root):
+        """Header/Identifier of the customer XML (e.g. TZ0230653), or None."""
+        identifier = customer_root.findtext('batch:Header/batch:Identifier', None, self.namespaces)
+        return identifier.strip() if identifier else None
+
+    def index_report(self, bot_root):
+        """Map identifier -> ReportRecord of its first report Command (report has no namespace)."""
+        index = {}
+        for result in bot_root.findall('.//Commands/Command'):
+            identifier = result.get('identifier')
+            if identifier is not None and identifier.strip() not in index:
+                index[identifier.strip()] = self.report_record(result)
+        logger.debug(f"Identifiers found in report.xml: {len(index)}")
+        return index
+
+    def stream_report(self, bot_content, metrics=None, index=None):
+        """
+        Same index as index_report(parse_report(bot_content)), built in one
+        incremental pass: every Command is turned into a ReportRecord and
+        dropped from the tree as soon as it has been read, so memory grows
+        with the number of commands rather than the size of the report.
 
+        bot_content may also be a binary file object. `index` replaces the
+        dict that is filled and returned; anything with setdefault(),
+        clear() and len() will do (see core/external_reconcile.py).
+        Raises ET.ParseError if no encoding parses.
+        """
+        metrics = metrics or PipelineMetrics()
+        index = {} if index is None else index
+        head = next(report_chunks(bot_content, REPORT_SNIFF_BYTES), b'')
+        detected = chardet.detect(head)['encoding'] or 'utf-8'
+        attempts = ((detected, 'strict'),) + REPORT_FALLBACK_ENCODINGS
+        parse_error = ET.ParseError('BOT report could not be decoded')
+        for number, (encoding, errors) in enumerate(attempts):
+            index.clear()
             try:
-                bot_xml_str = bot_content.decode(bot_encoding)
-                logger.debug(f"BOT report decoded as {bot_encoding}")
-            except UnicodeDecodeError:
-                bot_xml_str = bot_content.decode('utf-8', errors='ignore')
-                logger.warning("BOT report decoded with UTF-8 ignore fallback")
+                with metrics.phase('parse_report', nbytes=report_size(bot_content) if number == 0 else 0):
+                    for identifier, record in self.iter_report_records(bot_content, encoding, errors):
+                        index.setdefault(identifier, record)
+                logger.debug(f"BOT report streamed as {encoding}: {len(index)} identifiers")
+                return index
+            except (UnicodeError, LookupError) as e:
+                logger.warning(f"BOT report could not be decoded as {encoding}: {e}")
+            except ET.ParseError as e:
+                logger.error(f"BOT report XML parsing error ({encoding}): {str(e)}")
+                parse_error = e
+        raise parse_error
+
+    def iter_report_records(self, bot_content, encoding, errors='strict'):
+        """Yield (identifier, ReportRecord) for every Commands/Command of the report, in order."""
+        decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        # Open elements from the root down
+        path = []
+
+        def records(events):
+            for event, element in events:
+                if event == 'start':
+                    path.append(element)
+                    continue
+                path.pop()
+                # Commands/Command below the root, as './/Commands/Command' finds them
+                if element.tag == 'Command' and len(path) > 1 and path[-1].tag == 'Commands':
+                    identifier = element.get('identifier')
+                    if identifier is not None:
+                        yield identifier.strip(), self.report_record(element)
+                    path[-1].remove(element)
+
+        first = True
+        for chunk in report_chunks(bot_content):
+            text = decoder.decode(chunk)
+            if first:
+                # Declared encodings are not trusted, as in decode()
+                text = XML_DECL_PATTERN.sub('', text.lstrip('\ufeff'), count=1).lstrip()
+                first = False
+            parser.feed(text)
+            yield from records(parser.read_events())
+        parser.feed(decoder.decode(b'', final=True))
+        parser.close()
+        yield from records(parser.read_events())
+
+    def report_record(self, result):
+        """ReportRecord of a report Command element."""
+        error_message_elem = result.find('.//ErrorMessage')
+        exceptions = tuple(
+            (sys.intern(exception.findtext('ErrorCode') or ''), exception.findtext('FullErrorCode') or '')
+            for exception in result.iter('Exception')
+        )
+        return ReportRecord(
+            sys.intern(self.result_code(result)),
+            error_message_elem.text if error_message_elem is not None else 'Unknown error',
+            exceptions,
+        )
+
+    def extract_fields(self, command):
+        """Customer fields from a Command's Instalment and ConnectedSubject."""
+        namespaces = self.namespaces
+        instalment = command.find('.//batch:Instalment', namespaces)
+        connected_subject = command.find('.//batch:ConnectedSubject', namespaces)
+        company = connected_subject.find('.//batch:Company', namespaces) if connected_subject is not None else None
+
+        fields = {
+            'customer_name': '',
+            'customer_code': '',
+            'account_number': '',
+            'amount': 0,
+            'national_id': '',
+            'phone': '',
+        }
+        if company is not None:
+            fields['customer_name'] = company.findtext('batch:CompanyData/batch:TradeName', '', namespaces)
+            fields['customer_code'] = company.findtext('batch:CustomerCode', '', namespaces)
+            fields['phone'] = company.findtext('batch:ContactsCompany/batch:CellularPhone', '', namespaces)
+            fields['national_id'] = company.findtext('batch:CompanyData/batch:RegistrationNumber', '', namespaces)
+
+        if instalment is not None:
+            fields['amount'] = instalment.findtext('batch:TotalLoanAmount', 0, namespaces)
+            # Account number might not be present; set to empty if not found
+            fields['account_number'] = instalment.findtext('batch:AccountNumber', '', namespaces)
+        return fields
 
-            # Log first few characters of decoded content for debugging
-            logger.debug(f"Customer XML first 100 chars: {customer_xml_str[:100]}")
-            logger.debug(f"BOT report first 100 chars: {bot_xml_str[:100]}")
+    @staticmethod
+    def customer_of(fields):
+        """(customer_code, name, phone) of a Command's fields, as ensure_customers() takes them."""
+        return fields['customer_code'], fields['customer_name'], fields['phone']
 
-            # Strip XML declaration to avoid encoding mismatches
-            xml_decl_pattern = re.compile(r'<\?xml[^>]+?\?>')
-            customer_xml_str = xml_decl_pattern.sub('', customer_xml_str).strip()
-            bot_xml_str = xml_decl_pattern.sub('', bot_xml_str).strip()
+    def result_code(self, result):
+        """ResultCode of a report Command, 'UNKNOWN' if it has none."""
+        # Path 1: Lookups.ResultCode
+        result_code_elem = result.find('.//Lookups.ResultCode')
+        if result_code_elem is not None and result_code_elem.text is not None:
+            return result_code_elem.text
+        # Path 2: Lookups/ResultCode
+        lookups = result.find('.//Lookups')
+        if lookups is not None:
+            result_code_elem = lookups.find('ResultCode')
+            if result_code_elem is not None and result_code_elem.text is not None:
+                return result_code_elem.text
+        return 'UNKNOWN'
 
+    def reconcile(self, identifier, fields, result, batch):
+        """
+        Match one customer command against the ReportRecord of its report result.
+        Returns an unsaved CleanEntry for ResultCode.OK, otherwise an unsaved CustomerError.
+        """
+        batch_name = batch.batch_identifier if batch else 'unknown_batch'
+        if result is not None:
+            result_code = result.result_code
+            logger.debug(f"ResultCode for identifier {identifier}: {result_code}")
+
+            # Check for ResultCode.OK (case-insensitive)
+            if result_code.lower() == 'resultcode.ok':
+                return CleanEntry(
+                    identifier=identifier,
+                    account_number=fields['account_number'],
+                    amount=float(fields['amount']),
+                    national_id=fields['national_id'],
+                    batch_identifier=batch_name,
+                    status='ok',
+                    xml_file_name=batch_name
+                )
+
+            error_message = result.error_message
+            if error_message is None:
+                error_message = f"ResultCode {result_code} is not OK"
+            error_code = result_code
+        else:
+            logger.debug(f"No Result found in report.xml for identifier: {identifier}")
+            error_code = 'NO_RESULT'
+            error_message = 'No matching result found in BOT report'
+
+        return CustomerError(
+            batch=batch,
+            xml_file_name=batch_name,
+            identifier=identifier,
+            account_number=fields['account_number'],
+            amount=float(fields['amount']),
+            national_id=fields['national_id'],
+            error_code=error_code,
+            message=error_message,
+            uploaded_by=batch.uploaded_by if batch else None,
+            status='pending',
+            severity='error'
+        )
+
+    def no_commands_error(self, batch):
+        """Unsaved CustomerError recorded for a customer file without commands."""
+        return CustomerError(
+            batch=batch,
+            xml_file_name=batch.batch_identifier if batch else 'unknown_batch',
+            identifier='N/A',
+            account_number='',
+            amount=0,
+            national_id='',
+            error_code='NO_COMMANDS',
+            code=get_error_code('NO_COMMANDS'),
+            message='No command elements found in source XML',
+            uploaded_by=batch.uploaded_by if batch else None,
+            status='pending',
+            severity='error'
+        )
+
+    def previous_results(self, previous_batch_id):
+        """
+        Results of an earlier submission, keyed by identifier:
+        {identifier: CleanEntry} for clean commands and {identifier: [CustomerError]} for failures.
+        """
+        previous_batch = BatchHistory.objects.filter(id=previous_batch_id).first()
+        if previous_batch is None:
+            return {}, {}
+        clean = {}
+        entries = CleanEntry.objects.filter(batch_identifier=previous_batch.batch_identifier).select_related('customer')
+        for entry in entries:
+            clean.setdefault(entry.identifier, entry)
+        errors = {}
+        for error in CustomerError.objects.filter(batch_id=previous_batch_id).select_related('customer').order_by('id'):
+            errors.setdefault(error.identifier, []).append(error)
+        return clean, errors
+
+    def carry_over_clean(self, previous, batch):
+        batch_name = batch.batch_identifier if batch else 'unknown_batch'
+        return CleanEntry(
+            identifier=previous.identifier,
+            customer_id=previous.customer_id,
+            account_number=previous.account_number,
+            amount=previous.amount,
+            national_id=previous.national_id,
+            batch_identifier=batch_name,
+            status='ok',
+            xml_file_name=batch_name
+        )
+
+    def carry_over_error(self, previous, batch):
+        # Carried-over errors start pending again, as a full re-validation would
+        copied = {field: getattr(previous, field) for field in CARRIED_ERROR_FIELDS}
+        return CustomerError(
+            batch=batch,
+            xml_file_name=batch.batch_identifier if batch else 'unknown_batch',
+            uploaded_by=batch.uploaded_by if batch else None,
+            status='pending',
+            **copied
+        )
+
+    def process_xml_pair(self, customer_content, bot_content, batch=None, incremental=False,
+                         stream_report=None):
+        """
+        Process customer XML and BOT report to generate clean XML and corrections.
+        customer_content: bytes (source XML)
+        bot_content: bytes (report XML or TXT)
+        batch: BatchHistory instance; phase timings are saved to its phase_metrics
+        incremental: reuse the results of commands whose content and report
+            result are both unchanged since the previous submission of the
+            same Header/Identifier, and only reconcile the others
+        stream_report: index the report with stream_report() instead of
+            parsing it into a tree; by default reports of at least
+            settings.REPORT_STREAM_THRESHOLD bytes are streamed
+        Returns: (clean_xml_bytes, corrections_dict)
+        """
+        metrics = PipelineMetrics()
+        try:
             # Parse XML
             try:
-                customer_tree = ET.parse(StringIO(customer_xml_str))
-                customer_root = customer_tree.getroot()
+                with metrics.phase('decode', items=1, nbytes=len(customer_content)):
+                    customer_xml_str = self.decode(customer_content, 'Customer XML')
+                with metrics.phase('parse_customer', nbytes=len(customer_content)):
+                    customer_root = ET.parse(StringIO(customer_xml_str)).getroot()
                 logger.debug(f"Customer XML parsed successfully. Root tag: {customer_root.tag}")
-                # Log the structure of the XML up to 2 levels deep
-                child_tags = []
-                for child in customer_root:
-                    child_tags.append(child.tag)
-                    for grandchild in child:
-                        child_tags.append(f"{child.tag}/{grandchild.tag}")
-                logger.debug(f"Customer XML structure (up to 2 levels): {child_tags}")
             except ET.ParseError as e:
                 logger.error(f"Customer XML parsing error: {str(e)}")
                 return None, {'error': f'XML parsing error in source file: {str(e)}'}
 
-            try:
-                bot_tree = ET.parse(StringIO(bot_xml_str))
-                bot_root = bot_tree.getroot()
-                logger.debug(f"BOT report XML parsed successfully. Root tag: {bot_root.tag}")
-                # Log the structure of the BOT report up to 3 levels deep
-                bot_child_tags = []
-                for child in bot_root:
-                    bot_child_tags.append(child.tag)
-                    for grandchild in child:
-                        bot_child_tags.append(f"{child.tag}/{grandchild.tag}")
-                        for greatgrandchild in grandchild:
-                            bot_child_tags.append(f"{child.tag}/{grandchild.tag}/{greatgrandchild.tag}")
-                logger.debug(f"BOT report structure (up to 3 levels): {bot_child_tags}")
-            except ET.ParseError as e:
-                logger.error(f"BOT report XML parsing error: {str(e)}")
-                encodings = ['utf-16', 'utf-16-le', 'utf-16-be', 'latin-1']
-                for enc in encodings:
-                    try:
-                        bot_xml_str = bot_content.decode(enc)
-                        bot_xml_str = xml_decl_pattern.sub('', bot_xml_str).strip()
-                        bot_tree = ET.parse(StringIO(bot_xml_str))
-                        bot_root = bot_tree.getroot()
-                        logger.debug(f"BOT report parsed successfully with {enc} fallback")
-                        bot_child_tags = [child.tag for child in bot_root]
-                        logger.debug(f"BOT report root children: {bot_child_tags}")
-                        break
-                    except (UnicodeDecodeError, ET.ParseError):
-                        continue
-                else:
-                    return None, {'error': f'XML parsing error in report file: {str(e)}'}
-
-            # Log the raw XML of the Commands section in report.xml (no namespace)
-            report_commands = bot_root.find('.//Commands')
-            if report_commands is not None:
-                report_commands_xml = ET.tostring(report_commands, encoding='unicode')
-                logger.debug(f"Raw XML of Commands in report.xml: {report_commands_xml[:1000]}")  # Limit to 1000 chars
-            else:
-                logger.debug("No Commands element found in report.xml")
-
             # Initialize corrections
             corrections = {
                 'total_input_commands': 0,
@@ -111,207 +431,125 @@ class BOTValidator:
                 'error': None
             }
 
-            # Handle XML namespace for customer XML only
-            namespaces = {
-                'batch': 'http://cb4.creditinfosolutions.com/BatchUploader/Batch'
-            }
-            # Register the namespace
-            ET.register_namespace('batch', 'http://cb4.creditinfosolutions.com/BatchUploader/Batch')
-
-            # Find the Commands element in customer XML
-            commands_elem = customer_root.find('.//batch:Commands', namespaces)
-            if commands_elem is not None:
-                # Log the children of Commands
-                commands_children = [child.tag for child in commands_elem]
-                logger.debug(f"Children of Commands element: {commands_children}")
-                # Log the raw XML of the Commands element for debugging
-                commands_xml = ET.tostring(commands_elem, encoding='unicode')
-                logger.debug(f"Raw XML of Commands element: {commands_xml[:500]}")  # Limit to 500 chars for readability
-
-                # Try different variations of the Command tag
-                command_variations = [
-                    ('batch:Command', './/batch:Command'),
-                    ('batch:command', './/batch:command'),
-                    ('batch:COMMAND', './/batch:COMMAND'),
-                    ('batch:Request', './/batch:Request'),
-                    ('batch:Transaction', './/batch:Transaction')
-                ]
-                commands = []
-                command_tag_used = None
-                for tag_name, tag_path in command_variations:
-                    commands = commands_elem.findall(tag_path, namespaces)
-                    if commands:
-                        command_tag_used = tag_name
-                        logger.debug(f"Found commands using tag: {tag_name}")
-                        break
-
-                # If no specific tag is found, try any direct children of Commands
-                if not commands:
-                    commands = [child for child in commands_elem if child.tag.startswith('{http://cb4.creditinfosolutions.com/BatchUploader/Batch}')]
-                    if commands:
-                        command_tag_used = "direct children of Commands"
-                        logger.debug(f"Found commands as direct children of Commands: {[child.tag for child in commands]}")
-            else:
-                logger.warning("No Commands element found in customer XML")
-                commands = []
-                command_tag_used = None
+            # Register the namespace for the clean XML output
+            ET.register_namespace('batch', BATCH_NAMESPACE)
 
+            commands, command_tag_used = self.find_commands(customer_root)
             corrections['total_input_commands'] = len(commands)
             if corrections['total_input_commands'] == 0:
                 logger.warning(f"No command elements found in customer XML under Commands element")
-                CustomerError.objects.create(
-                    batch=batch,
-                    xml_file_name=batch.batch_identifier if batch else 'unknown_batch',
-                    identifier='N/A',
-                    customer_name='',
-                    customer_code='',
-                    account_number='',
-                    amount=0,
-                    national_id='',
-                    phone='',
-                    error_code='NO_COMMANDS',
-                    message='No command elements found in source XML',
-                    uploaded_by=batch.uploaded_by if batch else None,
-                    status='pending',
-                    severity='error'
-                )
+                self.no_commands_error(batch).save()
                 logger.debug(f"Corrections: {corrections}")
                 return None, corrections
 
             logger.debug(f"Found {len(commands)} commands using tag: {command_tag_used}")
 
-            # Extract all identifiers from report.xml for debugging (no namespace)
-            report_identifiers = []
-            result_elements = bot_root.findall('.//Commands/Command')
+            # Fingerprint every command so the next submission can be diffed
+            metrics.add('parse_customer', items=len(commands))
+            header_identifier = self.header_identifier(customer_root)
+            with metrics.phase('index', items=len(commands)):
+                identifiers = [command.get('identifier', '').strip() for command in commands]
+                hashes = [command_hash(command) for command in commands]
+            seen = {}
+            for identifier in identifiers:
+                seen[identifier] = seen.get(identifier, 0) + 1
 
-            for result in result_elements:
-                identifier_attr = result.get('identifier')
-                if identifier_attr is not None:
-                    report_identifiers.append(identifier_attr.strip())
-            logger.debug(f"Identifiers found in report.xml: {report_identifiers}")
+            previous_clean, previous_errors = {}, {}
+            previous_hashes = {}
+            if incremental and batch is not None:
+                previous_batch_id, previous_hashes = previous_fingerprints(header_identifier, exclude_batch=batch)
+                if previous_batch_id is not None:
+                    previous_clean, previous_errors = self.previous_results(previous_batch_id)
+                    corrections['previous_batch_id'] = previous_batch_id
+
+            # The report is always read: a new report can change the outcome
+            # of a command whose content did not change
+            if stream_report is None:
+                threshold = getattr(settings, 'REPORT_STREAM_THRESHOLD', None)
+                stream_report = threshold is not None and len(bot_content) >= threshold
+            try:
+                if stream_report:
+                    report_index = self.stream_report(bot_content, metrics)
+                else:
+                    bot_root = self.parse_report(bot_content, metrics)
+                    with metrics.phase('index'):
+                        report_index = self.index_report(bot_root)
+                    # Only the records are needed from here on
+                    del bot_root
+            except ET.ParseError as e:
+                return None, {'error': f'XML parsing error in report file: {str(e)}'}
+            metrics.add('parse_report', items=len(report_index))
+            metrics.add('index', items=len(report_index))
+            with metrics.phase('index', items=len(identifiers)):
+                report_hashes = [result_hash(report_index.get(identifier)) for identifier in identifiers]
+
+            def unchanged(identifier, content_hash, report_hash):
+                # Duplicated identifiers are always re-validated
+                return (seen[identifier] == 1
+                        and previous_hashes.get(identifier) == (content_hash, report_hash)
+                        and (identifier in previous_clean or identifier in previous_errors))
+
+            changed = [not unchanged(*hashed) for hashed in zip(identifiers, hashes, report_hashes)]
 
             # Process XML
             clean_commands = []
-            for command in commands:
-                # Extract Identifier from the Command attribute (not StorHeader)
-                identifier = command.get('identifier', '').strip()
-                logger.debug(f"Extracted identifier for command: {identifier}")
-
-                # Extract other fields from Instalment and ConnectedSubject
-                instalment = command.find('.//batch:Instalment', namespaces)
-                connected_subject = command.find('.//batch:ConnectedSubject', namespaces)
-                company = connected_subject.find('.//batch:Company', namespaces) if connected_subject is not None else None
-
-                # Extract fields with defaults
-                customer_name = ''
-                customer_code = ''
-                account_number = ''
-                amount = 0
-                national_id = ''
-                phone = ''
-
-                if company is not None:
-                    customer_name = company.find('batch:CompanyData/batch:TradeName', namespaces).text if company.find('batch:CompanyData/batch:TradeName', namespaces) is not None else ''
-                    customer_code = company.find('batch:CustomerCode', namespaces).text if company.find('batch:CustomerCode', namespaces) is not None else ''
-                    phone = company.find('batch:ContactsCompany/batch:CellularPhone', namespaces).text if company.find('batch:ContactsCompany/batch:CellularPhone', namespaces) is not None else ''
-                    national_id = company.find('batch:CompanyData/batch:RegistrationNumber', namespaces).text if company.find('batch:CompanyData/batch:RegistrationNumber', namespaces) is not None else ''
-
-                if instalment is not None:
-                    amount = instalment.find('batch:TotalLoanAmount', namespaces).text if instalment.find('batch:TotalLoanAmount', namespaces) is not None else 0
-                    # Account number might not be present; set to empty if not found
-                    account_number = instalment.find('batch:AccountNumber', namespaces).text if instalment.find('batch:AccountNumber', namespaces) is not None else ''
-
-                # Find the matching Command in report.xml (no namespace)
-                result = bot_root.find(f".//Commands/Command[@identifier='{identifier}']")
-
-                if result is not None:
-                    # Log the Result element for debugging
-                    result_xml = ET.tostring(result, encoding='unicode')
-                    logger.debug(f"Result for identifier {identifier}: {result_xml[:200]}")  # Limit to 200 chars
-
-                    # Try different paths for ResultCode (no namespace on Lookups)
-                    result_code = None
-                    # Path 1: Lookups.ResultCode
-                    result_code_elem = result.find('.//Lookups.ResultCode')
-                    if result_code_elem is not None:
-                        result_code = result_code_elem.text
-                    # Path 2: Lookups/ResultCode
-                    if result_code is None:
-                        lookups = result.find('.//Lookups')
-                        if lookups is not None:
-                            result_code_elem = lookups.find('ResultCode')
-                            result_code = result_code_elem.text if result_code_elem is not None else None
-
-                    result_code = result_code if result_code is not None else 'UNKNOWN'
-                    logger.debug(f"ResultCode for identifier {identifier}: {result_code}")
-
-                    # Check for ResultCode.OK (case-insensitive)
-                    if result_code and result_code.lower() == 'resultcode.ok':
-                        clean_commands.append(command)
-                        corrections['clean_identifiers'].append(identifier)
-                        # Store clean entry in CleanEntry model
-                        CleanEntry.objects.create(
-                            identifier=identifier,
-                            customer_name=customer_name,
-                            customer_code=customer_code,
-                            account_number=account_number,
-                            amount=float(amount),
-                            national_id=national_id,
-                            batch_identifier=batch.batch_identifier if batch else 'unknown_batch',
-                            status='ok',
-                            xml_file_name=batch.batch_identifier if batch else 'unknown_batch'
-                        )
+            clean_entries = []
+            customer_errors = []
+            fingerprints = []
+            details = {}
+            with metrics.phase('match', items=len(commands)):
+                for command, identifier, content_hash, report_hash, is_changed in zip(
+                        commands, identifiers, hashes, report_hashes, changed):
+                    logger.debug(f"Extracted identifier for command: {identifier}")
+                    if is_changed:
+                        fields = self.extract_fields(command)
+                        details.setdefault(identifier, self.customer_of(fields))
+                        customer_code = fields['customer_code']
+                        outcome = [self.reconcile(identifier, fields, report_index.get(identifier), batch)]
                     else:
-                        error_message = result.find('.//ErrorMessage').text if result.find('.//ErrorMessage') is not None else 'Unknown error'
-                        if error_message is None:
-                            error_message = f"ResultCode {result_code} is not OK"
-                        CustomerError.objects.create(
-                            batch=batch,
-                            xml_file_name=batch.batch_identifier if batch else 'unknown_batch',
-                            identifier=identifier,
-                            customer_name=customer_name,
-                            customer_code=customer_code,
-                            account_number=account_number,
-                            amount=float(amount),
-                            national_id=national_id,
-                            phone=phone,
-                            error_code=result_code,
-                            message=error_message,
-                            uploaded_by=batch.uploaded_by if batch else None,
-                            status='pending',
-                            severity='error'
-                        )
-                else:
-                    logger.debug(f"No Result found in report.xml for identifier: {identifier}")
-                    CustomerError.objects.create(
-                        batch=batch,
-                        xml_file_name=batch.batch_identifier if batch else 'unknown_batch',
-                        identifier=identifier,
-                        customer_name=customer_name,
-                        customer_code=customer_code,
-                        account_number=account_number,
-                        amount=float(amount),
-                        national_id=national_id,
-                        phone=phone,
-                        error_code='NO_RESULT',
-                        message='No matching result found in BOT report',
-                        uploaded_by=batch.uploaded_by if batch else None,
-                        status='pending',
-                        severity='error'
-                    )
+                        if identifier in previous_clean:
+                            previous = [previous_clean[identifier]]
+                            outcome = [self.carry_over_clean(previous[0], batch)]
+                        else:
+                            previous = previous_errors[identifier]
+                            outcome = [self.carry_over_error(error, batch) for error in previous]
+                        customer_code = previous[0].customer.customer_code if previous[0].customer else ''
+
+                    for row in outcome:
+                        if isinstance(row, CleanEntry):
+                            clean_commands.append(command)
+                            corrections['clean_identifiers'].append(identifier)
+                            clean_entries.append(row)
+                        else:
+                            customer_errors.append(row)
+                    fingerprints.append(fingerprint_for(identifier, content_hash, outcome, report_hash, customer_code))
+
+            with metrics.phase('persist', items=len(clean_entries) + len(customer_errors)):
+                assign_customers(clean_entries + customer_errors, details)
+                assign_codes(customer_errors)
+                bulk_insert(CleanEntry, clean_entries)
+                bulk_insert(CustomerError, customer_errors)
+                errors_changed()
+                if batch is not None:
+                    save_fingerprints(batch, header_identifier, fingerprints)
 
             corrections['total_clean_commands'] = len(clean_commands)
+            if incremental:
+                corrections['changed_commands'] = sum(changed)
+                corrections['carried_over_commands'] = len(changed) - sum(changed)
             logger.debug(f"Corrections: {corrections}")
 
             # Generate clean XML
             if clean_commands:
-                clean_root = ET.Element(customer_root.tag, attrib=customer_root.attrib)
-                for command in clean_commands:
-                    clean_root.append(command)
-                clean_tree = ET.ElementTree(clean_root)
-                output = BytesIO()
-                clean_tree.write(output, encoding='utf-8', xml_declaration=True)
-                clean_xml = output.getvalue()
+                with metrics.phase('serialise', items=len(clean_commands)) as serialise:
+                    clean_root = ET.Element(customer_root.tag, attrib=customer_root.attrib)
+                    for command in clean_commands:
+                        clean_root.append(command)
+                    clean_tree = ET.ElementTree(clean_root)
+                    output = BytesIO()
+                    clean_tree.write(output, encoding='utf-8', xml_declaration=True)
+                    clean_xml = output.getvalue()
+                    serialise['bytes'] += len(clean_xml)
                 return clean_xml, corrections
             else:
                 logger.debug("No clean commands found to generate clean XML")
@@ -319,4 +557,8 @@ class BOTValidator:
 
         except Exception as e:
             logger.error(f"Unexpected error in process_xml_pair: {str(e)}")
-            return None, {'error': str(e)}
\ No newline at end of file
+            return None, {'error': str(e)}
+        finally:
+            if batch is not None and batch.pk and metrics.phases:
+                batch.phase_metrics = metrics.as_dict()
+                BatchHistory.objects.filter(pk=batch.pk).update(phase_metrics=batch.phase_metrics)
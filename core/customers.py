@@ -0,0 +1,87 @@
+# core/customers.py
+"""
+The Customer entity behind errors, clean entries and submitted data.
+
+Rows used to be tied together only by copying the Command identifier (and
+customer code, phone and name) into each of them and joining with
+filter(identifier=...). They now carry a `customer` foreign key and the
+name, code and phone live on the Customer only:
+
+  - ensure_customers() creates the Customer rows for a set of identifiers
+    in one bulk statement and returns their ids;
+  - assign_customers() sets customer_id on unsaved rows before they are
+    inserted (bot_validator, external_reconcile, the upload views,
+    upsert_submitted_customers, restored archives).
+
+Dashboards then use select_related('customer__submission') instead of one
+SubmittedCustomerData lookup per error, see submission_of().
+"""
+import logging
+
+from .models import Customer, SubmittedCustomerData
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+# Details refreshed when a customer is submitted again
+CUSTOMER_UPDATE_FIELDS = ['customer_code', 'name', 'phone', 'updated_at']
+
+
+def customer_details(row):
+    """(customer_code, name, phone) of a SubmittedCustomerData row."""
+    return (row.customer_code or '', row.birth_surname or row.trade_name or '', row.phone or '')
+
+
+def ensure_customers(details, update=False, using='default'):
+    """
+    Create missing Customer rows. `details` maps identifier to
+    (customer_code, name, phone). Existing customers are left alone unless
+    `update` is set, then their details are overwritten (submitted data is
+    the authoritative source). Returns {identifier: customer id}.
+    """
+    details = {identifier: values for identifier, values in details.items() if identifier}
+    if not details:
+        return {}
+    customers = [
+        Customer(identifier=identifier, customer_code=code, name=name[:255], phone=phone[:20])
+        for identifier, (code, name, phone) in details.items()
+    ]
+    manager = Customer.objects.using(using)
+    if update:
+        manager.bulk_create(customers, batch_size=BATCH_SIZE, update_conflicts=True,
+                            unique_fields=['identifier'], update_fields=CUSTOMER_UPDATE_FIELDS)
+    else:
+        manager.bulk_create(customers, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    ids = {}
+    identifiers = list(details)
+    for start in range(0, len(identifiers), BATCH_SIZE):
+        chunk = identifiers[start:start + BATCH_SIZE]
+        ids.update(manager.filter(identifier__in=chunk).values_list('identifier', 'id'))
+    return ids
+
+
+def assign_customers(rows, details=None, update=False, using='default'):
+    """
+    Set customer_id on unsaved rows, creating their customers. `details`
+    maps identifier to (customer_code, name, phone); by default they are
+    read from the rows themselves, which must then be submitted data.
+    Rows that already have a customer keep it. Returns the rows.
+    """
+    if details is None:
+        details = {row.identifier: customer_details(row) for row in rows}
+    ids = ensure_customers(details, update=update, using=using)
+    for row in rows:
+        if row.customer_id is None:
+            row.customer_id = ids.get(row.identifier)
+    return rows
+
+
+def submission_of(row):
+    """SubmittedCustomerData of a row's customer, or None (use select_related('customer__submission'))."""
+    if row.customer is None:
+        return None
+    try:
+        return row.customer.submission
+    except SubmittedCustomerData.DoesNotExist:
+        return None
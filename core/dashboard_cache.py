@@ -0,0 +1,240 @@
+# core/dashboard_cache.py
+"""
+Cached statistics and recent-upload block for customer_error_dashboard.
+
+Both are kept in the cache named by settings.DASHBOARD_CACHE (a
+file-based cache by default, so invalidations made by ingest workers and
+management commands reach the web process too). Keys embed generation
+numbers, and invalidating bumps a generation instead of hunting for keys:
+
+  - the 'errors' generation changes whenever a CustomerError is created,
+    saved or deleted, a batch changes, or a bulk path (BOTValidator
+    ingest, bulk status changes, archive restore) says so through
+    errors_changed();
+  - the 'uploads:<user id>' generation changes with that user's
+    RecentUpload rows.
+
+Signals raised inside a transaction are folded into one bump when it
+commits, so deleting 100k errors in chunks costs one bump per chunk, and a
+rolled back change does not invalidate anything (at worst its scopes are
+bumped with the next commit). Cached values are plain dicts, never model
+instances. Hit/miss counters per block are kept in memory and shown on
+/profiling/ and /metrics/.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .customers import submission_of
+from .error_translator_utils import process_dashboard_error
+from .models import CustomerError, RecentUpload
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'dashboard'
+MISSING = object()
+
+
+class CacheStats:
+    """Thread-safe hit/miss/invalidation counters per cached block."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._blocks = {}
+            self.invalidations = 0
+
+    def record(self, block, hit):
+        with self._lock:
+            counts = self._blocks.setdefault(block, {'hits': 0, 'misses': 0})
+            counts['hits' if hit else 'misses'] += 1
+
+    def invalidated(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self):
+        with self._lock:
+            blocks = {}
+            for block, counts in self._blocks.items():
+                lookups = counts['hits'] + counts['misses']
+                blocks[block] = {**counts, 'hit_rate': counts['hits'] / lookups if lookups else None}
+            return {'blocks': blocks, 'invalidations': self.invalidations}
+
+
+stats = CacheStats()
+
+
+def get_cache():
+    alias = getattr(settings, 'DASHBOARD_CACHE', 'dashboard')
+    return caches[alias] if alias else None
+
+
+def generation(cache, scope):
+    key = f'{KEY_PREFIX}:gen:{scope}'
+    value = cache.get(key)
+    if value is None:
+        # Start from the clock, not 0, so entries left by an earlier
+        # database (tests, a restored dump) are never mistaken for current
+        cache.add(key, time.time_ns(), timeout=None)
+        value = cache.get(key)
+    return value
+
+
+def bump(scopes):
+    cache = get_cache()
+    if cache is None:
+        return
+    for scope in scopes:
+        key = f'{KEY_PREFIX}:gen:{scope}'
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+        stats.invalidated()
+    logger.debug(f"Dashboard cache invalidated: {', '.join(sorted(scopes))}")
+
+
+def invalidate(*scopes):
+    """Bump the given generations now, or once when the current transaction commits."""
+    if get_cache() is None:
+        return
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        bump(set(scopes))
+        return
+    pending = getattr(connection, 'dashboard_pending', None)
+    if pending is None:
+        pending = connection.dashboard_pending = set()
+    pending.update(scopes)
+
+    # Every call registers a flush, as a rolled back block drops the ones
+    # registered in it; the first flush to run on commit bumps everything
+    # pending and the others find nothing left
+    def flush():
+        if pending:
+            scopes = set(pending)
+            pending.clear()
+            bump(scopes)
+
+    transaction.on_commit(flush)
+
+
+def errors_changed():
+    """For bulk paths that bypass model signals (bulk_create, COPY, queryset.update)."""
+    invalidate('errors')
+
+
+def cached(block, key_scopes, compute):
+    """compute() through the cache, keyed by the current generations of key_scopes."""
+    cache = get_cache()
+    if cache is None:
+        return compute()
+    timeout = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+    key = ':'.join([KEY_PREFIX, block] + [str(generation(cache, scope)) for scope in key_scopes])
+    value = cache.get(key, MISSING)
+    # Counted per kind of block ('recent', not 'recent:<user id>')
+    stats.record(block.split(':')[0], hit=value is not MISSING)
+    if value is MISSING:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
+
+
+def compute_error_stats():
+    return CustomerError.objects.aggregate(
+        total=Count('id'),
+        pending=Count('id', filter=Q(status='pending')),
+        resolved=Count('id', filter=Q(status='resolved')),
+        ignored=Count('id', filter=Q(status='ignored')),
+    )
+
+
+def error_stats():
+    """{'total', 'pending', 'resolved', 'ignored'} error counts."""
+    return cached('stats', ['errors'], compute_error_stats)
+
+
+def error_row(error):
+    """What the recent-upload block shows of one error, as plain values."""
+    customer = error.customer
+    submitted = submission_of(error)
+    return {
+        'error': {
+            'id': error.id,
+            'identifier': error.identifier,
+            'amount': error.amount,
+            'error_code': error.error_code,
+            'message': error.message,
+            'status': error.status,
+            'status_display': error.get_status_display(),
+            'customer': {
+                'name': customer.name,
+                'phone': customer.phone,
+                'customer_code': customer.customer_code,
+            } if customer else None,
+        },
+        'submitted': {
+            'trade_name': submitted.trade_name,
+            'phone': submitted.phone,
+            'total_loan_amount': submitted.total_loan_amount,
+        } if submitted else None,
+        'friendly_message': process_dashboard_error(error.error_code, error.message),
+    }
+
+
+def compute_recent_upload(user_id):
+    recent_upload = RecentUpload.objects.filter(user_id=user_id, is_active=True).first()
+    if recent_upload is None:
+        return None
+    errors = recent_upload.errors().select_related('customer__submission')
+    return {
+        'id': recent_upload.id,
+        'timestamp': recent_upload.timestamp,
+        'customer_count': recent_upload.customer_count,
+        'error_count': recent_upload.error_count,
+        'filename': recent_upload.filename,
+        # Empty once none of its errors exist any more; the view then deletes it
+        'recent_errors': [error_row(error) for error in errors],
+    }
+
+
+def recent_upload(user):
+    """
+    The user's active upload and its errors as dicts, or None. A stale
+    upload comes back with no recent_errors: deleting it is up to the caller.
+    """
+    return cached(f'recent:{user.pk}', ['errors', f'uploads:{user.pk}'],
+                  lambda: compute_recent_upload(user.pk))
+
+
+def render_prometheus():
+    """Prometheus text lines for the hit/miss/invalidation counters of this process."""
+    snapshot = stats.snapshot()
+    lines = []
+    for field in ('hits', 'misses'):
+        metric = f'cbt_dashboard_cache_{field}_total'
+        lines.append(f'# HELP {metric} Dashboard cache {field} per block (this process).')
+        lines.append(f'# TYPE {metric} counter')
+        for block, counts in sorted(snapshot['blocks'].items()):
+            lines.append(f'{metric}{{block="{block}"}} {counts[field]}')
+    lines.append('# HELP cbt_dashboard_cache_invalidations_total Dashboard cache generations bumped (this process).')
+    lines.append('# TYPE cbt_dashboard_cache_invalidations_total counter')
+    lines.append(f'cbt_dashboard_cache_invalidations_total {snapshot["invalidations"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def on_error_change(sender, **kwargs):
+    invalidate('errors')
+
+
+def on_upload_change(sender, instance, **kwargs):
+    invalidate(f'uploads:{instance.user_id}')
@@ -0,0 +1,214 @@
+# core/db_backend.py
+"""
+Backend-specific fast paths for bulk ingest and dashboard queries.
+
+On PostgreSQL:
+  - bulk_insert() streams rows into the table with COPY ... FROM STDIN
+    (CSV) instead of multi-row INSERTs of 500 rows;
+  - upsert_submitted_customers() COPYs into a temporary table and merges
+    with one INSERT ... ON CONFLICT (identifier) DO UPDATE;
+  - distinct_errors() de-duplicates identifier/error_code with DISTINCT ON.
+
+Every other backend (SQLite) falls back to bulk_create, bulk_create with
+update_conflicts and a GROUP BY subquery, so callers never need to know
+which database is configured. Rows are produced lazily: a 100k-command
+batch is never rendered into one big buffer.
+"""
+import datetime
+import io
+import json
+import logging
+
+from django.db import connections, models, transaction
+from django.db.models import Max
+
+from .customers import assign_customers
+from .models import SubmittedCustomerData
+
+logger = logging.getLogger(__name__)
+
+COPY_BUFFER_ROWS = 1000
+FALLBACK_BATCH_SIZE = 500
+
+# Fields refreshed when a customer is submitted again
+SUBMITTED_UPDATE_FIELDS = [
+    'trade_name', 'registration_number', 'customer_code', 'phone',
+    'birth_surname', 'total_loan_amount', 'submitted_by',
+]
+
+
+def is_postgresql(using='default'):
+    return connections[using].vendor == 'postgresql'
+
+
+def copy_fields(model):
+    """Concrete columns written by COPY: everything but an auto primary key."""
+    return [f for f in model._meta.concrete_fields if not isinstance(f, models.AutoField)]
+
+
+def copy_value(field, obj, connection):
+    """Text form of one field for COPY CSV; None is written as an unquoted empty field (NULL)."""
+    value = field.pre_save(obj, add=True)
+    if value is None:
+        return None
+    if isinstance(field, models.JSONField):
+        return json.dumps(value, cls=field.encoder)
+    if isinstance(field, models.ForeignKey):
+        return str(value)
+    value = field.get_db_prep_save(value, connection)
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+class CopyStream(io.RawIOBase):
+    """
+    Read-only file object producing CSV rows on demand, for psycopg2's
+    copy_expert(). Rows are rendered COPY_BUFFER_ROWS at a time.
+    """
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = b''
+
+    def readable(self):
+        return True
+
+    def render(self):
+        out = io.StringIO()
+        for _ in range(COPY_BUFFER_ROWS):
+            row = next(self.rows, None)
+            if row is None:
+                break
+            out.write(csv_line(row))
+        return out.getvalue().encode('utf-8')
+
+    def readinto(self, target):
+        while len(self.buffer) < len(target):
+            chunk = self.render()
+            if not chunk:
+                break
+            self.buffer += chunk
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+
+def csv_line(values):
+    """
+    One CSV record: NULL is an unquoted empty field, every other value is
+    quoted so an empty string stays an empty string.
+    """
+    return ','.join('' if v is None else '"' + str(v).replace('"', '""') + '"' for v in values) + '\n'
+
+
+def copy_rows(model, columns, rows, using='default', table=None):
+    """COPY an iterable of value lists into a table (default: the model's)."""
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    sql = (f"COPY {quote(table or model._meta.db_table)} "
+           f"({', '.join(quote(c) for c in columns)}) FROM STDIN WITH (FORMAT csv)")
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy'):
+            # psycopg 3: stream rows straight into the COPY
+            with raw.copy(sql) as copy:
+                for row in rows:
+                    copy.write(csv_line(row))
+        else:
+            raw.copy_expert(sql, CopyStream(rows))
+
+
+def bulk_insert(model, objs, using='default'):
+    """
+    Insert unsaved model instances: COPY on PostgreSQL, bulk_create
+    elsewhere. Primary keys are not set on the instances by COPY.
+    Returns the number of rows written.
+    """
+    objs = list(objs)
+    if not objs:
+        return 0
+    if not is_postgresql(using):
+        model.objects.using(using).bulk_create(objs, batch_size=FALLBACK_BATCH_SIZE)
+        return len(objs)
+
+    connection = connections[using]
+    fields = copy_fields(model)
+    rows = ([copy_value(field, obj, connection) for field in fields] for obj in objs)
+    copy_rows(model, [f.column for f in fields], rows, using=using)
+    logger.debug(f"COPY {len(objs)} rows into {model._meta.db_table}")
+    return len(objs)
+
+
+def upsert_submitted_customers(customers, update_fields=SUBMITTED_UPDATE_FIELDS, using='default'):
+    """
+    Insert or update SubmittedCustomerData rows by identifier (the last one
+    wins when an identifier repeats), like update_or_create with
+    `update_fields` as defaults. `customers` are unsaved instances; their
+    Customer rows are created or refreshed and linked too.
+    Returns the number of distinct identifiers written.
+    """
+    by_identifier = {}
+    for customer in customers:
+        by_identifier[customer.identifier] = customer
+    customers = list(by_identifier.values())
+    if not customers:
+        return 0
+    assign_customers(customers, update=True, using=using)
+    update_fields = [*update_fields, 'customer']
+
+    if not is_postgresql(using):
+        SubmittedCustomerData.objects.using(using).bulk_create(
+            customers,
+            batch_size=FALLBACK_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['identifier'],
+            update_fields=update_fields,
+        )
+        return len(customers)
+
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    table = SubmittedCustomerData._meta.db_table
+    staging = f'{table}_staging'
+    fields = copy_fields(SubmittedCustomerData)
+    columns = [f.column for f in fields]
+    update_columns = [SubmittedCustomerData._meta.get_field(name).column for name in update_fields]
+    column_list = ', '.join(quote(c) for c in columns)
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            # Only the copied columns, with their types but no constraints:
+            # LIKE would bring the NOT NULL id without its identity default
+            cursor.execute(f"CREATE TEMPORARY TABLE {quote(staging)} AS "
+                           f"SELECT {column_list} FROM {quote(table)} WITH NO DATA")
+        rows = ([copy_value(field, customer, connection) for field in fields] for customer in customers)
+        copy_rows(SubmittedCustomerData, columns, rows, using=using, table=staging)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(table)} ({column_list}) "
+                f"SELECT {column_list} FROM {quote(staging)} "
+                f"ON CONFLICT ({quote('identifier')}) DO UPDATE SET "
+                + ', '.join(f'{quote(c)} = EXCLUDED.{quote(c)}' for c in update_columns)
+            )
+            cursor.execute(f"DROP TABLE {quote(staging)}")
+    return len(customers)
+
+
+def distinct_errors(queryset):
+    """
+    The most recent error per (identifier, error_code) in `queryset`,
+    newest first. DISTINCT ON on PostgreSQL, a GROUP BY on max(id) elsewhere.
+    """
+    if is_postgresql(queryset.db):
+        latest = (queryset.order_by('identifier', 'error_code', '-created_at', '-id')
+                  .distinct('identifier', 'error_code')
+                  .values('id'))
+    else:
+        latest = (queryset.order_by()
+                  .values('identifier', 'error_code')
+                  .annotate(latest_id=Max('id'))
+                  .values('latest_id'))
+    return queryset.filter(id__in=latest).order_by('-created_at', '-id')
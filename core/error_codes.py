@@ -0,0 +1,108 @@
+# core/error_codes.py
+"""
+The ErrorCode catalogue.
+
+Codes are interned on first sight at ingest: code_ids() creates the
+missing ErrorCode rows in one bulk statement, with the severity, category
+and friendly template worked out once per code instead of once per error
+row, and CustomerError points at them through its `code` foreign key.
+Grouping and filtering errors by code is then an integer index lookup:
+filter_errors() and the API filter on code__code, so every saved error
+needs its code_id (link_codes() fills it for rows saved without one).
+
+CustomerError.error_code is written alongside the FK for the templates,
+exports, archives and fingerprints, which show the string. The friendly
+message for a code is its ErrorCode.template, worked out when the code is
+catalogued rather than per error.
+"""
+import logging
+
+from django.db.models import OuterRef, Subquery
+
+from .error_translator_utils import ERROR_CODE_TRANSLATIONS
+from .models import ErrorCode
+
+logger = logging.getLogger(__name__)
+
+# Code prefix -> severity, as the upload views have always assigned it
+SEVERITY_PREFIXES = (
+    ('E', 'high'),
+    ('W', 'low'),
+    ('C', 'critical'),
+)
+DEFAULT_SEVERITY = 'medium'
+# Codes raised by the reconciliation itself rather than found in a report
+INTERNAL_CODES = {'NO_RESULT', 'NO_COMMANDS', 'UNKNOWN'}
+
+
+def severity_for(code):
+    for prefix, severity in SEVERITY_PREFIXES:
+        if code.startswith(prefix):
+            return severity
+    return DEFAULT_SEVERITY
+
+
+def category_for(code):
+    """
+    'internal' for codes raised by the reconciliation, 'schema' for XSD
+    (cvc-*) codes, 'result' for BOT ResultCodes, 'bot' for the rest.
+    """
+    if code in INTERNAL_CODES:
+        return 'internal'
+    if code.startswith('cvc-'):
+        return 'schema'
+    if code.startswith('ResultCode.'):
+        return 'result'
+    return 'bot'
+
+
+def template_for(code):
+    """Friendly message of a code: exact translation, else its prefix's, else ''."""
+    if code in ERROR_CODE_TRANSLATIONS:
+        return ERROR_CODE_TRANSLATIONS[code]
+    return ERROR_CODE_TRANSLATIONS.get(code.split('-')[0], '')
+
+
+def catalogue_entry(code):
+    return ErrorCode(code=code, severity=severity_for(code), category=category_for(code),
+                     template=template_for(code))
+
+
+def code_ids(codes, using='default'):
+    """{code: ErrorCode id} for `codes`, adding unseen codes to the catalogue."""
+    codes = {code for code in codes if code}
+    if not codes:
+        return {}
+    manager = ErrorCode.objects.using(using)
+    manager.bulk_create([catalogue_entry(code) for code in codes], ignore_conflicts=True)
+    return dict(manager.filter(code__in=codes).values_list('code', 'id'))
+
+
+def assign_codes(errors, using='default'):
+    """Set code_id on unsaved CustomerErrors. Returns the errors."""
+    ids = code_ids({error.error_code for error in errors}, using)
+    for error in errors:
+        error.code_id = ids.get(error.error_code)
+    return errors
+
+
+def get_error_code(code, using='default'):
+    """The ErrorCode of one code, created if unseen."""
+    entry = ErrorCode.objects.using(using).filter(code=code).first()
+    if entry is None:
+        code_ids([code], using)
+        entry = ErrorCode.objects.using(using).get(code=code)
+    return entry
+
+
+def link_codes(queryset):
+    """
+    Point the saved errors of `queryset` without a code at theirs, adding
+    unseen codes to the catalogue first. Returns the number of errors linked.
+    """
+    queryset = queryset.filter(code__isnull=True)
+    code_ids(set(queryset.values_list('error_code', flat=True).distinct()), using=queryset.db)
+    code = ErrorCode.objects.filter(code=OuterRef('error_code')).values('id')[:1]
+    linked = queryset.update(code_id=Subquery(code))
+    logger.debug(f"Linked {linked} errors to their codes")
+    return linked
@@ -0,0 +1,63 @@
+# core/error_parameters.py
+"""
+Typed storage for the Exception Parameters of BOT report errors.
+
+The report's <Parameters> (LineNumber, Field, Rule, ...) used to be copied
+into each CustomerError.customer_details JSON, repeating every key name in
+every row and leaving "all errors for field X" to parse JSON row by row.
+They are now ErrorParameter rows: the key names live once in ParameterKey
+and (key, value) is indexed. The customer's name, code and phone are read
+from its Customer, so customer_details no longer repeats them either.
+
+CustomerError.get_parameters() rebuilds the old {key: value} dict.
+"""
+import logging
+
+from .models import CustomerError, ErrorParameter, ParameterKey
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+# Parameters with a CustomerError column of their own
+SKIPPED_KEYS = {'Message'}
+
+
+def key_ids(names, using='default'):
+    """{name: ParameterKey id} for `names`, creating missing keys."""
+    names = set(names)
+    if not names:
+        return {}
+    manager = ParameterKey.objects.using(using)
+    manager.bulk_create([ParameterKey(name=name) for name in names], ignore_conflicts=True)
+    return dict(manager.filter(name__in=names).values_list('name', 'id'))
+
+
+def parameter_rows(error_id, params, ids):
+    return [
+        ErrorParameter(error_id=error_id, key_id=ids[key], value='' if value is None else str(value))
+        for key, value in params.items() if key not in SKIPPED_KEYS
+    ]
+
+
+def save_parameters(pairs, using='default'):
+    """
+    Store the parameters of saved errors. `pairs` is an iterable of
+    (CustomerError, {key: value}). Returns the number of rows created.
+    """
+    pairs = [(error, params) for error, params in pairs if params]
+    ids = key_ids({key for _, params in pairs for key in params if key not in SKIPPED_KEYS}, using)
+    rows = []
+    for error, params in pairs:
+        rows.extend(parameter_rows(error.pk, params, ids))
+    ErrorParameter.objects.using(using).bulk_create(rows, batch_size=BATCH_SIZE)
+    return len(rows)
+
+
+def errors_with_parameter(key, value=None, queryset=None):
+    """Errors of `queryset` having parameter `key` (equal to `value` if given), via the (key, value) index."""
+    if queryset is None:
+        queryset = CustomerError.objects.all()
+    params = ErrorParameter.objects.filter(key__name=key)
+    if value is not None:
+        params = params.filter(value=value)
+    return queryset.filter(id__in=params.values('error_id'))
@@ -0,0 +1,169 @@
+# core/error_status.py
+"""
+Set-based status changes for CustomerError rows.
+
+transition_errors() moves every error in a queryset to a new status with
+one SELECT of (id, status), one UPDATE and a batched bulk_create of
+ErrorHistory rows, so resolving a 100k-error batch costs a handful of
+queries instead of one save() per error. The status distribution returned
+to the caller is worked out from the same SELECT.
+"""
+import logging
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from .dashboard_cache import errors_changed
+from .models import BatchHistory, CustomerError, ErrorHistory
+
+logger = logging.getLogger(__name__)
+
+# Statuses a user can move errors to
+TARGET_STATUSES = ('pending', 'resolved', 'ignored')
+HISTORY_BATCH_SIZE = 1000
+
+# Filter expression keys accepted by filter_errors() -> ORM lookup
+ERROR_FILTERS = {
+    'status': 'status',
+    'status__in': 'status__in',
+    'batch': 'batch__batch_identifier',
+    'batch_id': 'batch_id',
+    'identifier': 'identifier',
+    'identifier__in': 'identifier__in',
+    'error_code': 'code__code',
+    'error_code__in': 'code__code__in',
+    'category': 'code__category',
+    'severity': 'severity',
+    'uploaded_by': 'uploaded_by__username',
+    'created_after': 'created_at__gte',
+    'created_before': 'created_at__lt',
+}
+
+
+class TransitionResult:
+    """Outcome of a bulk status change: how many errors moved and the status distribution around it."""
+
+    def __init__(self, new_status, before, moved):
+        self.new_status = new_status
+        # status -> count over the whole scope, before the change
+        self.before = dict(before)
+        # previous status -> count of errors that moved to new_status
+        self.moved = dict(moved)
+        self.updated = sum(moved.values())
+        after = Counter(before)
+        after.subtract(moved)
+        after[new_status] += self.updated
+        self.after = {status: count for status, count in after.items() if count}
+
+    @property
+    def total(self):
+        return sum(self.before.values())
+
+    def as_dict(self):
+        return {
+            'status': self.new_status,
+            'updated': self.updated,
+            'total': self.total,
+            'before': self.before,
+            'after': self.after,
+        }
+
+    @staticmethod
+    def display(counts):
+        return ', '.join(f'{status}: {count}' for status, count in sorted(counts.items()))
+
+
+def filter_errors(filters, queryset=None):
+    """
+    Apply a filter expression, e.g. {"batch": "TZ0000001_...", "error_code":
+    "BOT-E-0030"}, to CustomerError. Only the keys in ERROR_FILTERS are
+    accepted; anything else raises ValueError. An empty expression would
+    select every error and is refused too.
+    """
+    if not isinstance(filters, dict) or not filters:
+        raise ValueError("The filter expression must be a non-empty object")
+    unknown = sorted(set(filters) - set(ERROR_FILTERS))
+    if unknown:
+        raise ValueError(f"Unknown filter field(s): {', '.join(unknown)}")
+    for key, value in filters.items():
+        if key.endswith('__in') and not isinstance(value, list):
+            raise ValueError(f"{key} must be a list")
+    if queryset is None:
+        queryset = CustomerError.objects.all()
+    return queryset.filter(**{ERROR_FILTERS[key]: value for key, value in filters.items()})
+
+
+def transition_errors(queryset, new_status, user=None, notes='', from_statuses=None):
+    """
+    Move the errors in `queryset` to `new_status` and record an
+    ErrorHistory row for each one that changed.
+
+    Only errors whose status is in `from_statuses` move (default: any
+    status other than `new_status`); the rest of the queryset still counts
+    towards the returned distribution. Resolving stamps
+    resolved_at/resolved_by, any other status clears them. `notes`, when
+    given, replaces the error notes and is written to the history rows.
+    Returns a TransitionResult.
+    """
+    if new_status not in TARGET_STATUSES:
+        raise ValueError(f"Unknown error status: {new_status}")
+    movable = set(from_statuses or [status for status, _label in CustomerError.STATUS_CHOICES])
+    movable.discard(new_status)
+    queryset = queryset.order_by()
+
+    with transaction.atomic():
+        # Lock the scope first so the history matches what the UPDATE changes
+        rows = list(queryset.select_for_update().values_list('id', 'status'))
+        before = Counter(status for _id, status in rows)
+        changed = [(error_id, status) for error_id, status in rows if status in movable]
+        if not changed:
+            return TransitionResult(new_status, before, {})
+
+        now = timezone.now()
+        fields = {
+            'status': new_status,
+            'updated_at': now,
+            'resolved_at': now if new_status == 'resolved' else None,
+            'resolved_by': user if new_status == 'resolved' else None,
+        }
+        if notes:
+            fields['notes'] = notes
+        # Same filter as the SELECT rather than a 100k-element IN list
+        queryset.filter(status__in=movable).update(**fields)
+        errors_changed()
+
+        ErrorHistory.objects.bulk_create(
+            (ErrorHistory(error_id=error_id,
+                          previous_status=status,
+                          new_status=new_status,
+                          notes=notes,
+                          changed_by=user)
+             for error_id, status in changed),
+            batch_size=HISTORY_BATCH_SIZE,
+        )
+
+    result = TransitionResult(new_status, before, Counter(status for _id, status in changed))
+    logger.info(f"Moved {result.updated} error(s) to {new_status}"
+                + (f" for {user}" if user is not None else ''))
+    return result
+
+
+def transition_batch(batch, new_status, user=None, notes=''):
+    """
+    Move the pending errors of a BatchHistory to `new_status`
+    ('resolved' or 'ignored'). The returned distribution covers every
+    error of the batch; the batch itself is marked resolved once none of
+    them is pending.
+    """
+    with transaction.atomic():
+        result = transition_errors(
+            CustomerError.objects.filter(batch=batch),
+            new_status, user=user, notes=notes, from_statuses=['pending'],
+        )
+        if result.total and not result.after.get('pending') and batch.status != 'resolved':
+            batch.status = 'resolved'
+            batch.resolved_date = timezone.now()
+            BatchHistory.objects.filter(pk=batch.pk).update(
+                status=batch.status, resolved_date=batch.resolved_date, updated_at=batch.resolved_date)
+    return result
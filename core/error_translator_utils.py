@@ -3,6 +3,7 @@ Utility functions for translating technical error messages to user-friendly form
 This module provides translation dictionaries and helper functions to convert regex validation errors
 and other technical messages into business-friendly language.
 """
+from functools import lru_cache
 
 # Dictionary mapping error codes to user-friendly messages
 ERROR_CODE_TRANSLATIONS = {
@@ -322,7 +323,11 @@ def translate_error_message(error):
     # Extract key information from the error object
     error_code = getattr(error, 'error_code', None)
     message = getattr(error, 'message', '')
-    customer_details = getattr(error, 'customer_details', None)
+    # Exception parameters (Field, Rule, ...) live in ErrorParameter rows
+    if hasattr(error, 'get_parameters'):
+        customer_details = error.get_parameters()
+    else:
+        customer_details = getattr(error, 'customer_details', None)
     
     # Start with error code translation if available
     if error_code:
@@ -367,6 +372,8 @@ def get_friendly_error_message(error):
 
 
 # Additional function to handle specific error message formats seen in your screenshot
+# Memoised: dashboards translate the same code/message pairs on every row
+@lru_cache(maxsize=4096)
 def process_dashboard_error(error_code, error_message):
     """
     Special processing for the error dashboard format messages.
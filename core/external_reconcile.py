@@ -0,0 +1,302 @@
+# core/external_reconcile.py
+"""
+Reconciliation of batches too large to hold in memory.
+
+BOTValidator.process_xml_pair keeps every customer command, the report
+index and all result rows in memory. reconcile_files() does the same work
+with a fixed memory budget, for re-processing very large archived batches:
+
+  1. the customer file is read with iterparse and each command is spilled
+     to a temporary SQLite database (its identifier, extracted fields,
+     content hash and serialised XML) before being dropped;
+  2. the BOT report is streamed by BOTValidator.stream_report() into a
+     second table keyed by identifier (first result wins, as in
+     index_report());
+  3. one LEFT JOIN, read in command order, yields every command with its
+     result. SQLite sorts and joins on disk, with its page cache limited
+     to half the budget;
+  4. the pairs are reconciled a chunk at a time. Each chunk's rows and
+     fingerprints are persisted and its clean commands are appended to the
+     clean XML file before the next chunk is read.
+
+The other half of the budget sizes the chunks. Only the spill database
+and the clean XML file grow with the batch, and both are on disk.
+Incremental re-validation and the corrections' clean_identifiers list are
+not available in this mode.
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import xml.etree.ElementTree as ET
+
+from django.conf import settings
+
+from .bot_validator import BATCH_NAMESPACE, BOTValidator, ReportRecord
+from .customers import assign_customers
+from .dashboard_cache import errors_changed
+from .db_backend import bulk_insert
+from .error_codes import assign_codes
+from .fingerprints import command_hash, fingerprint_for, result_hash, save_fingerprints
+from .metrics import PipelineMetrics
+from .models import BatchHistory, CleanEntry, CustomerError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_MB = 256
+# Rough memory held per command of a chunk: its fields, result row,
+# fingerprint and clean XML text
+ROW_ESTIMATE_BYTES = 8 * 1024
+MIN_CHUNK_SIZE = 100
+MAX_CHUNK_SIZE = 5000
+
+SCHEMA = """
+CREATE TABLE commands (
+    seq INTEGER PRIMARY KEY,
+    identifier TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    xml TEXT NOT NULL
+);
+CREATE TABLE results (
+    identifier TEXT PRIMARY KEY,
+    result_code TEXT NOT NULL,
+    error_message TEXT,
+    exceptions TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+PAIRS_SQL = """
+SELECT c.identifier, c.fields, c.content_hash, c.xml,
+       r.result_code, r.error_message, r.exceptions
+FROM commands c LEFT JOIN results r ON r.identifier = c.identifier
+ORDER BY c.seq
+"""
+
+
+def chunk_size_for(memory_budget):
+    return max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, memory_budget // 2 // ROW_ESTIMATE_BYTES))
+
+
+def open_spill(directory, memory_budget):
+    """Spill database in `directory`, with its page cache limited to half the budget."""
+    db = sqlite3.connect(os.path.join(directory, 'reconcile.sqlite3'))
+    db.executescript(SCHEMA)
+    db.execute(f'PRAGMA cache_size = -{max(1024, memory_budget // 2 // 1024)}')
+    # Throwaway database: no journal, no fsync, sorts spill to files
+    db.execute('PRAGMA journal_mode = OFF')
+    db.execute('PRAGMA synchronous = OFF')
+    db.execute('PRAGMA temp_store = FILE')
+    return db
+
+
+class SpilledReports:
+    """Index for BOTValidator.stream_report() that writes ReportRecords to the spill database."""
+
+    def __init__(self, db, batch_size):
+        self.db = db
+        self.batch_size = batch_size
+        self.pending = []
+
+    def setdefault(self, identifier, record):
+        self.pending.append((identifier, record.result_code, record.error_message,
+                             json.dumps(record.exceptions)))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # INSERT OR IGNORE keeps the first result of an identifier
+        self.db.executemany('INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?)', self.pending)
+        self.pending = []
+
+    def clear(self):
+        self.pending = []
+        self.db.execute('DELETE FROM results')
+
+    def __len__(self):
+        self.flush()
+        return self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+
+def clean_tags(root_tag, root_attrib):
+    """Opening and closing tag of the clean XML root, namespace declarations included."""
+    empty = ET.tostring(ET.Element(root_tag, root_attrib), encoding='unicode')
+    name = re.match(r'<([^\s/>]+)', empty).group(1)
+    return empty[:-len(' />')] + '>', f'</{name}>'
+
+
+def spill_commands(validator, customer_path, db, batch_size, metrics):
+    """
+    Store every command of the customer file in the spill database.
+    Returns (command count, Header/Identifier, root tag, root attributes).
+    """
+    commands_tag = f'{{{BATCH_NAMESPACE}}}Commands'
+    header_tag = f'{{{BATCH_NAMESPACE}}}Header'
+    identifier_tag = f'{{{BATCH_NAMESPACE}}}Identifier'
+    namespace_declaration = f' xmlns:batch="{BATCH_NAMESPACE}"'
+    count = 0
+    header_identifier = root_tag = None
+    root_attrib = {}
+    pending = []
+    path = []
+
+    with metrics.phase('parse_customer', nbytes=os.path.getsize(customer_path)):
+        for event, element in ET.iterparse(customer_path, events=('start', 'end')):
+            if event == 'start':
+                if not path:
+                    root_tag, root_attrib = element.tag, dict(element.attrib)
+                path.append(element)
+                continue
+            path.pop()
+            # Batch/Header/Identifier, as header_identifier() reads it
+            if len(path) == 2 and element.tag == identifier_tag and path[1].tag == header_tag:
+                header_identifier = (element.text or '').strip() or None
+            # Namespaced direct children of Commands, whatever their tag
+            # (Command, Request, Transaction...), as find_commands() accepts
+            if not path or path[-1].tag != commands_tag or not element.tag.startswith(f'{{{BATCH_NAMESPACE}}}'):
+                continue
+            element.tail = None
+            xml = ET.tostring(element, encoding='unicode').replace(namespace_declaration, '', 1)
+            pending.append((element.get('identifier', '').strip(),
+                            json.dumps(validator.extract_fields(element)),
+                            command_hash(element), xml))
+            path[-1].remove(element)
+            count += 1
+            if len(pending) >= batch_size:
+                db.executemany('INSERT INTO commands (identifier, fields, content_hash, xml) '
+                               'VALUES (?, ?, ?, ?)', pending)
+                pending = []
+        db.executemany('INSERT INTO commands (identifier, fields, content_hash, xml) '
+                       'VALUES (?, ?, ?, ?)', pending)
+    metrics.add('parse_customer', items=count)
+    return count, header_identifier, root_tag, root_attrib
+
+
+def persist_chunk(batch, header_identifier, clean_entries, customer_errors, fingerprints, details):
+    assign_customers(clean_entries + customer_errors, details)
+    assign_codes(customer_errors)
+    bulk_insert(CleanEntry, clean_entries)
+    bulk_insert(CustomerError, customer_errors)
+    save_fingerprints(batch, header_identifier, fingerprints)
+
+
+def reconcile_files(customer_path, report_path, batch, clean_output=None, memory_budget=None):
+    """
+    Reconcile a customer file against its BOT report, both given as paths,
+    within `memory_budget` bytes (default settings.EXTERNAL_RECONCILE_MEMORY_MB).
+    `batch` is the saved BatchHistory the error rows and fingerprints
+    belong to; unlike process_xml_pair it is required, as every chunk is
+    persisted as it is reconciled.
+
+    Clean commands are written to `clean_output` (a path), which is removed
+    again if there are none. Returns (clean_output or None, corrections),
+    with the same corrections keys as process_xml_pair, without
+    clean_identifiers.
+    """
+    if memory_budget is None:
+        memory_budget = getattr(settings, 'EXTERNAL_RECONCILE_MEMORY_MB', DEFAULT_MEMORY_MB) * 1024 * 1024
+    if batch is None or batch.pk is None:
+        raise ValueError("reconcile_files needs a saved BatchHistory to persist into")
+    chunk_size = chunk_size_for(memory_budget)
+    validator = BOTValidator()
+    metrics = PipelineMetrics()
+    corrections = {
+        'total_input_commands': 0,
+        'total_clean_commands': 0,
+        'error': None,
+    }
+    ET.register_namespace('batch', BATCH_NAMESPACE)
+
+    try:
+        with tempfile.TemporaryDirectory(prefix='reconcile-') as directory:
+            db = open_spill(directory, memory_budget)
+            try:
+                try:
+                    count, header_identifier, root_tag, root_attrib = spill_commands(
+                        validator, customer_path, db, chunk_size, metrics)
+                except ET.ParseError as e:
+                    return None, {'error': f'XML parsing error in source file: {str(e)}'}
+                corrections['total_input_commands'] = count
+                if count == 0:
+                    logger.warning(f"No command elements found in {customer_path}")
+                    validator.no_commands_error(batch).save()
+                    return None, corrections
+
+                reports = SpilledReports(db, chunk_size)
+                try:
+                    with open(report_path, 'rb') as report:
+                        validator.stream_report(report, metrics, index=reports)
+                except ET.ParseError as e:
+                    return None, {'error': f'XML parsing error in report file: {str(e)}'}
+                reports.flush()
+                metrics.add('parse_report', items=len(reports))
+
+                clean_count = write_pairs(validator, db.execute(PAIRS_SQL), batch, header_identifier,
+                                          clean_output, clean_tags(root_tag, root_attrib),
+                                          chunk_size, metrics)
+            finally:
+                db.close()
+        corrections['total_clean_commands'] = clean_count
+        logger.debug(f"Corrections: {corrections}")
+        if clean_count == 0:
+            if clean_output and os.path.exists(clean_output):
+                os.remove(clean_output)
+            return None, corrections
+        return clean_output, corrections
+
+    except Exception as e:
+        logger.error(f"Unexpected error in reconcile_files: {str(e)}", exc_info=True)
+        return None, {'error': str(e)}
+    finally:
+        if metrics.phases:
+            batch.phase_metrics = metrics.as_dict()
+            BatchHistory.objects.filter(pk=batch.pk).update(phase_metrics=batch.phase_metrics)
+
+
+def write_pairs(validator, pairs, batch, header_identifier, clean_output, tags, chunk_size, metrics):
+    """Reconcile and persist the joined (command, result) rows a chunk at a time. Returns the clean count."""
+    clean_count = 0
+    output = open(clean_output, 'w', encoding='utf-8') if clean_output else None
+    try:
+        if output:
+            output.write("<?xml version='1.0' encoding='utf-8'?>\n" + tags[0])
+        while True:
+            clean_entries, customer_errors, fingerprints, clean_xml = [], [], [], []
+            details = {}
+            with metrics.phase('match') as match:
+                rows = pairs.fetchmany(chunk_size)
+                for identifier, fields, content_hash, xml, result_code, error_message, exceptions in rows:
+                    result = None
+                    if result_code is not None:
+                        result = ReportRecord(result_code, error_message,
+                                              tuple(tuple(pair) for pair in json.loads(exceptions)))
+                    fields = json.loads(fields)
+                    details.setdefault(identifier, validator.customer_of(fields))
+                    row = validator.reconcile(identifier, fields, result, batch)
+                    if isinstance(row, CleanEntry):
+                        clean_entries.append(row)
+                        clean_xml.append(xml)
+                    else:
+                        customer_errors.append(row)
+                    fingerprints.append(fingerprint_for(identifier, content_hash, [row], result_hash(result),
+                                                        fields['customer_code']))
+                match['items'] += len(rows)
+            if not rows:
+                break
+            with metrics.phase('persist', items=len(clean_entries) + len(customer_errors)):
+                persist_chunk(batch, header_identifier, clean_entries, customer_errors, fingerprints, details)
+            if output:
+                with metrics.phase('serialise', items=len(clean_xml)) as serialise:
+                    text = ''.join(clean_xml)
+                    output.write(text)
+                    serialise['bytes'] += len(text)
+            clean_count += len(clean_entries)
+        if output:
+            output.write(tags[1])
+    finally:
+        if output:
+            output.close()
+        errors_changed()
+    return clean_count
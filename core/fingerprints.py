@@ -0,0 +1,112 @@
+# core/fingerprints.py
+import hashlib
+import logging
+
+from .models import CommandFingerprint
+
+logger = logging.getLogger(__name__)
+
+
+def command_hash(command):
+    """
+    Canonical SHA-256 of a Command element.
+
+    Tags are compared in their expanded '{namespace}Tag' form, attributes are
+    sorted and text is stripped, so namespace prefixes, attribute order and
+    indentation do not change the hash.
+    """
+    parts = []
+    _canonical_parts(command, parts)
+    return hashlib.sha256('\x00'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _canonical_parts(elem, parts):
+    parts.append('<' + elem.tag)
+    for key in sorted(elem.attrib):
+        parts.append(f'@{key}={elem.attrib[key]}')
+    text = (elem.text or '').strip()
+    if text:
+        parts.append('#' + text)
+    for child in elem:
+        _canonical_parts(child, parts)
+    parts.append('>')
+
+
+def result_hash(record):
+    """
+    SHA-256 of the report side of a command: the ReportRecord's result code,
+    error message and exceptions, or a fixed marker when the report has no
+    result for it (record is None).
+    """
+    if record is None:
+        parts = ['\x01missing']
+    else:
+        parts = [record.result_code, record.error_message if record.error_message is not None else '\x01none']
+        for error_code, full_error_code in record.exceptions:
+            parts.extend((error_code, full_error_code))
+    return hashlib.sha256('\x00'.join(parts).encode('utf-8')).hexdigest()
+
+
+def previous_fingerprints(batch_identifier, exclude_batch=None):
+    """
+    Fingerprints of the most recent earlier submission of a batch.
+
+    Returns (batch_id, {identifier: (content_hash, result_hash)}), or
+    (None, {}) if the batch has not been submitted before.
+    """
+    if not batch_identifier:
+        return None, {}
+    previous = CommandFingerprint.objects.filter(batch_identifier=batch_identifier)
+    if exclude_batch is not None:
+        previous = previous.exclude(batch=exclude_batch)
+    previous_batch_id = previous.order_by('-batch_id').values_list('batch_id', flat=True).first()
+    if previous_batch_id is None:
+        return None, {}
+    hashes = {
+        identifier: (content_hash, report_hash)
+        for identifier, content_hash, report_hash in
+        CommandFingerprint.objects.filter(batch_id=previous_batch_id)
+        .values_list('identifier', 'content_hash', 'result_hash').iterator()
+    }
+    return previous_batch_id, hashes
+
+
+def fingerprint_for(identifier, content_hash, rows, report_hash='', customer_code=''):
+    """Unsaved CommandFingerprint summarising the CleanEntry/CustomerError rows of one command."""
+    error_codes = []
+    for row in rows:
+        error_code = getattr(row, 'error_code', None)
+        if error_code and error_code not in error_codes:
+            error_codes.append(error_code)
+    return CommandFingerprint(
+        identifier=identifier,
+        customer_code=customer_code or '',
+        content_hash=content_hash,
+        result_hash=report_hash,
+        outcome='error' if error_codes else 'ok',
+        error_codes=error_codes,
+    )
+
+
+def save_fingerprints(batch, batch_identifier, fingerprints):
+    """Bulk-insert the unsaved CommandFingerprint rows of a processed batch."""
+    for fingerprint in fingerprints:
+        fingerprint.batch = batch
+        fingerprint.batch_identifier = batch_identifier or ''
+    CommandFingerprint.objects.bulk_create(fingerprints, batch_size=1000)
+    logger.debug(f"Stored {len(fingerprints)} command fingerprints for {batch_identifier}")
+
+
+def customer_timeline(identifier=None, customer_code=None, limit=200):
+    """
+    Every processed command for a Command identifier or CustomerCode across
+    all batches, newest batch first.
+    """
+    if not identifier and not customer_code:
+        return CommandFingerprint.objects.none()
+    timeline = CommandFingerprint.objects.select_related('batch')
+    if identifier:
+        timeline = timeline.filter(identifier=identifier)
+    if customer_code:
+        timeline = timeline.filter(customer_code=customer_code)
+    return timeline.order_by('-batch_id', 'identifier')[:limit]
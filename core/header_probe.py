@@ -0,0 +1,125 @@
+# core/header_probe.py
+"""
+Read the Header of a customer batch or BOT report without parsing the rest.
+
+Customer batches and BOT reports both start with a small <Header> block
+holding the batch Identifier, followed by thousands of Commands. Pairing
+files and checking that an upload matches its report only needs the
+Header, so probe_header() feeds the document to an incremental parser in
+small chunks and stops as soon as </Header> has been seen.
+
+Handles the namespaced customer <Batch>, the plain <BatchResponse>, UTF-8
+and UTF-16 (with or without a BOM), and BOT reports whose XML declaration
+claims UTF-16 while the bytes are UTF-8.
+"""
+import codecs
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+from .bot_validator import BATCH_NAMESPACE, XML_DECL_PATTERN
+
+CUSTOMER = 'customer'
+REPORT = 'report'
+
+HeaderInfo = namedtuple('HeaderInfo', ['kind', 'identifier', 'batch_id'])
+NOT_FOUND = HeaderInfo(None, None, None)
+
+CHUNK_SIZE = 8 * 1024
+# Headers are a few hundred bytes; give up on documents that have none
+MAX_HEADER_BYTES = 1024 * 1024
+
+
+def sniff_encoding(head):
+    """Encoding of a document from its first bytes (BOM or NUL pattern), default UTF-8."""
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    if head[:2] == b'<\x00':
+        return 'utf-16-le'
+    if head[:2] == b'\x00<':
+        return 'utf-16-be'
+    return 'utf-8'
+
+
+def iter_chunks(source, chunk_size):
+    """Yield byte chunks from bytes, a path or a binary file object."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        for start in range(0, len(source), chunk_size):
+            yield bytes(source[start:start + chunk_size])
+    elif isinstance(source, (str, bytes)) or hasattr(source, '__fspath__'):
+        with open(source, 'rb') as f:
+            yield from iter(lambda: f.read(chunk_size), b'')
+    else:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        try:
+            yield from iter(lambda: source.read(chunk_size), b'')
+        finally:
+            # Also runs when the probe stops early and closes the generator
+            if hasattr(source, 'seek'):
+                source.seek(0)
+
+
+def local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def probe_header(source, chunk_size=CHUNK_SIZE, max_bytes=MAX_HEADER_BYTES):
+    """
+    Return HeaderInfo(kind, identifier, batch_id) for a document.
+
+    kind is CUSTOMER for a <Batch>, REPORT for a <BatchResponse>
+    and None for anything else. identifier is Header/Identifier, batch_id
+    the report's Header/BatchId (None for customer batches). Malformed or
+    header-less documents give NOT_FOUND. File objects are left rewound.
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    decoder = None
+    path = []
+    kind = identifier = batch_id = None
+    read = 0
+    try:
+        for chunk in iter_chunks(source, chunk_size):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(sniff_encoding(chunk))(errors='replace')
+                # The declared encoding is not trusted, the text is already decoded
+                text = XML_DECL_PATTERN.sub('', decoder.decode(chunk), count=1).lstrip()
+            else:
+                text = decoder.decode(chunk)
+            parser.feed(text)
+            read += len(chunk)
+
+            for event, element in parser.read_events():
+                name = local_name(element.tag)
+                if event == 'start':
+                    if not path:
+                        # Un-namespaced <Batch> was accepted by the old full parse too
+                        if element.tag in (f'{{{BATCH_NAMESPACE}}}Batch', 'Batch'):
+                            kind = CUSTOMER
+                        elif element.tag == 'BatchResponse':
+                            kind = REPORT
+                        else:
+                            return NOT_FOUND
+                    path.append(name)
+                    continue
+
+                # Only Batch/Header/* counts, not StorHeader/Identifier inside Commands
+                if len(path) == 3 and path[1] == 'Header':
+                    value = (element.text or '').strip() or None
+                    if name == 'Identifier':
+                        identifier = value
+                    elif name == 'BatchId':
+                        batch_id = value
+                path.pop()
+                if len(path) == 1 and name == 'Header':
+                    return HeaderInfo(kind, identifier, batch_id if kind == REPORT else None)
+                if len(path) == 1 and name == 'Commands':
+                    # Commands before any Header: there is none
+                    return HeaderInfo(kind, None, None)
+
+            if read >= max_bytes:
+                break
+    except (ET.ParseError, UnicodeDecodeError, OSError):
+        return NOT_FOUND
+    return HeaderInfo(kind, identifier, batch_id if kind == REPORT else None)
@@ -0,0 +1,253 @@
+# core/ingest.py
+"""
+Watch-folder ingest: reconcile customer/report pairs as they are dropped
+into a share.
+
+IngestService watches directories (inotify when the inotify_simple package
+is installed, polling otherwise), waits until each new file has stopped
+changing, pairs customer batches with BOT reports by Header/Identifier and
+hands complete pairs to core.batch_processing.process_pair in a process
+pool. At most `workers` pairs run at once; further pairs stay in the watch
+folder until a slot frees up. Processed files are moved to the archive
+directory, files that failed or cannot be used to the failed directory.
+Started by `manage.py ingest_watch`.
+"""
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.db import connections
+
+from .batch_processing import CUSTOMER, REPORT, XML_EXTENSIONS, classify, init_worker, process_pair
+
+try:
+    import inotify_simple
+except ImportError:  # optional, the service polls when it is not installed
+    inotify_simple = None
+
+logger = logging.getLogger(__name__)
+
+
+class PollingWatcher:
+    """Wake up every `interval` seconds."""
+    name = 'polling'
+
+    def __init__(self, directories, interval):
+        self.interval = interval
+
+    def wait(self):
+        time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Wake up when a file is written or moved into a watched directory (or after `interval`)."""
+    name = 'inotify'
+
+    def __init__(self, directories, interval):
+        self.interval = interval
+        self.inotify = inotify_simple.INotify()
+        flags = inotify_simple.flags.CLOSE_WRITE | inotify_simple.flags.MOVED_TO
+        for directory in directories:
+            self.inotify.add_watch(directory, flags)
+
+    def wait(self):
+        # Events only wake the loop; the directories are rescanned either way
+        self.inotify.read(timeout=int(self.interval * 1000))
+
+    def close(self):
+        self.inotify.close()
+
+
+def make_watcher(directories, interval, use_inotify=True):
+    if use_inotify and inotify_simple is not None:
+        try:
+            return InotifyWatcher(directories, interval)
+        except OSError as e:
+            logger.warning(f"inotify unavailable ({e}), polling instead")
+    return PollingWatcher(directories, interval)
+
+
+class IngestService:
+    def __init__(self, watch_dirs, archive_dir, failed_dir, username, workers=2,
+                 settle_seconds=5, poll_seconds=5, incremental=True, use_cache=True,
+                 output_dir=None, use_inotify=True):
+        self.watch_dirs = [os.path.abspath(d) for d in watch_dirs]
+        self.archive_dir = os.path.abspath(archive_dir)
+        self.failed_dir = os.path.abspath(failed_dir)
+        self.workers = max(1, workers)
+        self.settle_seconds = settle_seconds
+        self.poll_seconds = poll_seconds
+        self.use_inotify = use_inotify
+        self.process_kwargs = {
+            'username': username,
+            'incremental': incremental,
+            'use_cache': use_cache,
+            'output_dir': output_dir,
+        }
+        # path -> (size, mtime) seen on the previous scan, to detect files still being copied
+        self.sizes = {}
+        # kind -> identifier -> path of files waiting for their partner
+        self.waiting = {CUSTOMER: {}, REPORT: {}}
+        # pairs ready to run, oldest first: (identifier, customer path, report path)
+        self.ready = []
+        # future -> (identifier, customer path, report path)
+        self.in_flight = {}
+        self.processed = 0
+        self.failed = 0
+        self.stopping = False
+
+    # -- scanning --------------------------------------------------------
+
+    def claimed(self):
+        """Paths already waiting, queued or being processed."""
+        paths = set()
+        for by_identifier in self.waiting.values():
+            paths.update(by_identifier.values())
+        for _identifier, customer_path, report_path in self.ready + list(self.in_flight.values()):
+            paths.update((customer_path, report_path))
+        return paths
+
+    def stable_files(self):
+        """New files in the watch folders whose size and mtime did not change since the last scan."""
+        now = time.time()
+        claimed = self.claimed()
+        current = {}
+        stable = []
+        for directory in self.watch_dirs:
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if not entry.is_file() or entry.name.startswith('.'):
+                    continue
+                if not entry.name.lower().endswith(XML_EXTENSIONS) or entry.path in claimed:
+                    continue
+                stat = entry.stat()
+                current[entry.path] = (stat.st_size, stat.st_mtime)
+                if (self.sizes.get(entry.path) == current[entry.path]
+                        and now - stat.st_mtime >= self.settle_seconds):
+                    stable.append(entry.path)
+        self.sizes = current
+        return sorted(stable, key=lambda p: current[p][1])
+
+    def scan(self):
+        for path in self.stable_files():
+            self.sizes.pop(path, None)
+            kind, identifier = classify(path)
+            if kind is None or not identifier:
+                self.move(path, self.failed_dir, 'not a customer batch or BOT report with a Header/Identifier')
+                continue
+            previous = self.waiting[kind].get(identifier)
+            if previous:
+                self.move(previous, self.failed_dir, f'superseded by {os.path.basename(path)}')
+            self.waiting[kind][identifier] = path
+            logger.info(f"Ingest: {kind} file {os.path.basename(path)} for {identifier}")
+
+            if identifier in self.waiting[CUSTOMER] and identifier in self.waiting[REPORT]:
+                self.ready.append((identifier,
+                                   self.waiting[CUSTOMER].pop(identifier),
+                                   self.waiting[REPORT].pop(identifier)))
+
+    # -- processing ------------------------------------------------------
+
+    def dispatch(self, pool):
+        """Start ready pairs while a worker is free (back-pressure: the rest stay queued)."""
+        while self.ready and len(self.in_flight) < self.workers and not self.stopping:
+            identifier, customer_path, report_path = self.ready.pop(0)
+            future = pool.submit(process_pair, identifier, customer_path, report_path, **self.process_kwargs)
+            self.in_flight[future] = (identifier, customer_path, report_path)
+
+    def collect(self, timeout=0):
+        """Archive the files of finished pairs."""
+        if not self.in_flight:
+            return
+        done, _pending = wait(list(self.in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            identifier, customer_path, report_path = self.in_flight.pop(future)
+            try:
+                result = future.result()
+                error = result['error']
+            except Exception as e:
+                result, error = None, str(e)
+            if error:
+                self.failed += 1
+                logger.error(f"Ingest: {identifier} failed: {error}")
+                destination = self.failed_dir
+            else:
+                self.processed += 1
+                logger.info(f"Ingest: {identifier} reconciled, {result['commands']} commands, "
+                            f"{result['clean']} clean in {result['seconds']:.2f}s"
+                            + (' (cached)' if result['cached'] else ''))
+                destination = self.archive_dir
+            for path in (customer_path, report_path):
+                self.move(path, destination)
+
+    def move(self, path, directory, reason=None):
+        day_dir = os.path.join(directory, time.strftime('%Y%m%d'))
+        os.makedirs(day_dir, exist_ok=True)
+        name = os.path.basename(path)
+        target = os.path.join(day_dir, name)
+        counter = 1
+        while os.path.exists(target):
+            stem, ext = os.path.splitext(name)
+            target = os.path.join(day_dir, f'{stem}.{counter}{ext}')
+            counter += 1
+        try:
+            shutil.move(path, target)
+        except FileNotFoundError:
+            logger.warning(f"Ingest: {path} disappeared before it could be moved")
+            return None
+        if reason:
+            logger.warning(f"Ingest: moved {name} to {day_dir}: {reason}")
+        return target
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def run(self, once=False):
+        """
+        Watch until stop() is called (or, with once=True, until everything
+        currently in the folders has been processed).
+        """
+        for directory in self.watch_dirs + [self.archive_dir, self.failed_dir]:
+            os.makedirs(directory, exist_ok=True)
+        watcher = make_watcher(self.watch_dirs, self.poll_seconds, self.use_inotify)
+        logger.info(f"Ingest: watching {', '.join(self.watch_dirs)} ({watcher.name}), "
+                    f"{self.workers} worker(s)")
+
+        connections.close_all()
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker) as pool:
+                while not self.stopping:
+                    try:
+                        self.scan()
+                        self.dispatch(pool)
+                        self.collect(timeout=0)
+                        if once and not self.ready and not self.in_flight and not self.pending_files():
+                            break
+                        if self.in_flight and len(self.in_flight) >= self.workers:
+                            # Every worker is busy, wait for one to finish instead of scanning
+                            self.collect(timeout=self.poll_seconds)
+                        elif once:
+                            time.sleep(min(self.poll_seconds, 1))
+                        else:
+                            watcher.wait()
+                    except KeyboardInterrupt:
+                        self.stop()
+                # Let running pairs finish so their files are archived
+                while self.in_flight:
+                    self.collect(timeout=None)
+        finally:
+            watcher.close()
+        return self.processed, self.failed
+
+    def pending_files(self):
+        """True while a file in the watch folders is still settling."""
+        claimed = self.claimed()
+        return any(path not in claimed for path in self.sizes)
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.archive import archivable_batches, archive_batch, restore_batch
+from core.models import BatchHistory, ErrorArchive
+
+
+class Command(BaseCommand):
+    help = ("Move the errors of resolved batches older than --days out of the CustomerError "
+            "table into per-batch archive files (or --restore them)")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'ERROR_ARCHIVE_AFTER_DAYS', 90),
+            help='Archive batches resolved more than this many days ago '
+                 '(default: settings.ERROR_ARCHIVE_AFTER_DAYS)',
+        )
+        parser.add_argument(
+            '--batch',
+            nargs='+',
+            help='Archive these batch identifiers only (still resolved and without pending errors)',
+        )
+        parser.add_argument(
+            '--restore',
+            nargs='+',
+            metavar='BATCH',
+            help='Put the archived errors of these batches back into the database',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only list the batches that would be archived',
+        )
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            for batch_identifier in options['restore']:
+                archive = ErrorArchive.objects.select_related('batch').filter(
+                    batch__batch_identifier=batch_identifier).first()
+                if archive is None:
+                    raise CommandError(f"Batch {batch_identifier} is not archived")
+                restored = restore_batch(archive)
+                self.stdout.write(f"{batch_identifier}: restored {restored} errors")
+            return
+
+        batches = archivable_batches(options['days'])
+        if options['batch']:
+            batches = archivable_batches(0).filter(batch_identifier__in=options['batch'])
+            missing = set(options['batch']) - set(batches.values_list('batch_identifier', flat=True))
+            for batch_identifier in sorted(missing):
+                reason = ('not found' if not BatchHistory.objects.filter(batch_identifier=batch_identifier).exists()
+                          else 'not resolved, already archived or has pending errors')
+                self.stderr.write(f"Skipping {batch_identifier}: {reason}")
+
+        archived = errors = size = 0
+        for batch in batches:
+            if options['dry_run']:
+                self.stdout.write(f"  {batch.batch_identifier} (resolved {batch.resolved_date:%Y-%m-%d})")
+                continue
+            archive = archive_batch(batch)
+            archived += 1
+            errors += archive.error_count
+            size += archive.size
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {batch.batch_identifier}: {archive.error_count} errors, "
+                                  f"{archive.size / 1024:.1f} KB")
+        if not options['dry_run']:
+            self.stdout.write(f"Archived {errors} errors from {archived} batch(es), {size / 1024 / 1024:.2f} MB")
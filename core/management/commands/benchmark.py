@@ -0,0 +1,290 @@
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from core.bot_validator import BOTValidator
+from core.models import BatchHistory, CleanEntry, CustomerError
+from core.synthetic import ENCODINGS, generate_batch
+from core.validation_config import validate_xml_file
+from core.validators import BOTXMLValidator
+
+STAGES = ['validators', 'process_xml_pair', 'upload_both_files', 'exports']
+
+
+class QueryCounter:
+    """execute_wrapper that counts queries and the time spent in them."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = ("Generate synthetic customer batches with matching BOT reports and time "
+            "process_xml_pair, upload_both_files, the XML validators and the exports "
+            "against a scratch database")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[1000, 10000, 100000],
+            help='Commands per batch (default: 1000 10000 100000)',
+        )
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=0.1,
+            help='Fraction of commands the report rejects (default: 0.1)',
+        )
+        parser.add_argument(
+            '--missing-rate',
+            type=float,
+            default=0.0,
+            help='Fraction of commands missing from the report (default: 0)',
+        )
+        parser.add_argument(
+            '--encoding',
+            choices=list(ENCODINGS),
+            default='utf-8',
+            help='Report encoding (default: utf-8)',
+        )
+        parser.add_argument(
+            '--stages',
+            nargs='+',
+            choices=STAGES,
+            default=STAGES,
+            help='Stages to time (default: all)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=1,
+            help='Random seed for the generator (default: 1)',
+        )
+        parser.add_argument(
+            '--output',
+            default='benchmark_results.json',
+            help='JSON results file (default: benchmark_results.json)',
+        )
+        parser.add_argument(
+            '--save-files',
+            metavar='DIR',
+            help='Also write each generated customer/report pair to DIR',
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options['error_rate'] + options['missing_rate'] <= 1:
+            raise CommandError("--error-rate plus --missing-rate must be between 0 and 1")
+
+        workdir = tempfile.mkdtemp(prefix='cbt-benchmark-')
+        results = {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'blob_compression': getattr(settings, 'BLOB_COMPRESSION', None),
+            'error_rate': options['error_rate'],
+            'missing_rate': options['missing_rate'],
+            'encoding': options['encoding'],
+            'seed': options['seed'],
+            'runs': [],
+        }
+
+        # Keep per-command debug logging out of the timings
+        if options['verbosity'] < 3:
+            logging.disable(logging.INFO)
+        # Scratch database and storage, so real batches are never touched
+        connection.settings_dict.setdefault('TEST', {})
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'benchmark.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        storages = {
+            **settings.STORAGES,
+            'default': {
+                **settings.STORAGES['default'],
+                'OPTIONS': {'location': os.path.join(workdir, 'media')},
+            },
+        }
+        try:
+            with override_settings(STORAGES=storages, ALLOWED_HOSTS=['testserver']):
+                for size in options['sizes']:
+                    run = self.run_size(size, options)
+                    results['runs'].append(run)
+                    self.print_run(run)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            logging.disable(logging.NOTSET)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def run_size(self, size, options):
+        batch_identifier = f'TZBENCH{size}'
+        run = {'size': size, 'stages': {}}
+
+        start = time.perf_counter()
+        customer_content, report_content, expected = generate_batch(
+            size,
+            error_rate=options['error_rate'],
+            missing_rate=options['missing_rate'],
+            encoding=options['encoding'],
+            batch_identifier=batch_identifier,
+            seed=options['seed'],
+        )
+        run['generate_seconds'] = round(time.perf_counter() - start, 4)
+        run['customer_bytes'] = len(customer_content)
+        run['report_bytes'] = len(report_content)
+        run['expected'] = expected
+
+        if options['save_files']:
+            os.makedirs(options['save_files'], exist_ok=True)
+            prefix = os.path.join(options['save_files'], f'{batch_identifier}_{options["encoding"]}')
+            with open(f'{prefix}_customer.xml', 'wb') as f:
+                f.write(customer_content)
+            with open(f'{prefix}_report.xml', 'wb') as f:
+                f.write(report_content)
+
+        user, _ = User.objects.get_or_create(username='benchmark')
+        client = Client()
+        client.force_login(user)
+        stages = options['stages']
+
+        if 'validators' in stages:
+            with self.timed(run, 'validate_xml_file', size) as extra:
+                extra['errors'] = validate_xml_file(customer_content)['error_count']
+            with self.timed(run, 'BOTXMLValidator', size) as extra:
+                report = BOTXMLValidator().validate_xml_file(io.BytesIO(customer_content))
+                extra['errors'] = report['error_counts']['total']
+
+        batch = None
+        if 'process_xml_pair' in stages or 'exports' in stages:
+            batch = BatchHistory.objects.create(
+                batch_identifier=f'{batch_identifier}-pair',
+                uploaded_by=user,
+                filename=f'{batch_identifier}.xml',
+                status='pending',
+            )
+            with self.timed(run, 'process_xml_pair', size) as extra:
+                clean_xml, corrections = BOTValidator().process_xml_pair(
+                    customer_content, report_content, batch=batch)
+                extra['clean_commands'] = corrections.get('total_clean_commands')
+                extra['error'] = corrections.get('error')
+                extra['phases'] = batch.phase_metrics
+            if clean_xml:
+                batch.clean_xml_file = default_storage.save('clean_xml/benchmark.xml', io.BytesIO(clean_xml))
+                batch.status = 'completed'
+                batch.save()
+
+        if 'upload_both_files' in stages:
+            with self.timed(run, 'upload_both_files', size) as extra:
+                # The view prints every customer it saves
+                with contextlib.redirect_stdout(io.StringIO()):
+                    response = client.post(reverse('upload_both_files'), {
+                        'customer_file': SimpleUploadedFile(f'{batch_identifier}.xml', customer_content),
+                        'error_file': SimpleUploadedFile(f'{batch_identifier}_report.xml', report_content),
+                    })
+                extra['status_code'] = response.status_code
+                extra['batch_created'] = BatchHistory.objects.filter(batch_identifier=batch_identifier).exists()
+
+        if 'exports' in stages and batch is not None:
+            run['export_rows'] = self.seed_clean_export(batch)
+        if run.get('export_rows'):
+            with self.timed(run, 'download_clean_xml', size) as extra:
+                response = client.get(reverse('download_clean_xml', args=[batch.id]))
+                extra['bytes'] = self.export_size('download_clean_xml', response)
+            with self.timed(run, 'extract_clean_entries_csv', size) as extra:
+                response = client.get(reverse('extract_clean_entries', args=[batch.batch_identifier, 'csv']))
+                extra['bytes'] = self.export_size('extract_clean_entries_csv', response)
+            with self.timed(run, 'upload_report_csv', size) as extra:
+                response = client.get(reverse('upload_report'))
+                extra['bytes'] = self.export_size('upload_report_csv', response)
+
+        return run
+
+    def seed_clean_export(self, batch):
+        """
+        extract_clean_entries exports the batch's CustomerError rows with
+        status 'ok', which process_xml_pair does not write: add one per
+        clean command so the export has the batch's rows to write.
+        """
+        entries = CleanEntry.objects.filter(batch_identifier=batch.batch_identifier)
+        CustomerError.objects.bulk_create((
+            CustomerError(
+                batch=batch,
+                customer_id=entry.customer_id,
+                identifier=entry.identifier,
+                account_number=entry.account_number,
+                amount=entry.amount,
+                national_id=entry.national_id,
+                error_code='',
+                message='',
+                status='ok',
+                uploaded_by=batch.uploaded_by,
+            )
+            for entry in entries.iterator()
+        ), batch_size=1000)
+        return CustomerError.objects.filter(batch=batch, status='ok').count()
+
+    def export_size(self, name, response):
+        """Body size of an export; a redirect or an empty body means nothing was timed."""
+        size = sum(len(chunk) for chunk in response.streaming_content) \
+            if response.streaming else len(response.content)
+        if response.status_code != 200 or not size:
+            raise CommandError(f"{name} returned {response.status_code} with {size} bytes")
+        return size
+
+    @contextlib.contextmanager
+    def timed(self, run, name, size):
+        """Time a stage, counting the queries it runs; yields a dict for extra results."""
+        extra = {}
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            yield extra
+        seconds = time.perf_counter() - start
+        run['stages'][name] = {
+            'seconds': round(seconds, 4),
+            'ms_per_command': round(seconds * 1000 / size, 4) if size else None,
+            'queries': counter.count,
+            'query_seconds': round(counter.seconds, 4),
+            **extra,
+        }
+
+    def print_run(self, run):
+        self.stdout.write(
+            f"{run['size']} commands ({run['customer_bytes'] / 1024:.0f} KB customer, "
+            f"{run['report_bytes'] / 1024:.0f} KB report), generated in {run['generate_seconds']:.2f}s"
+        )
+        for name, stage in run['stages'].items():
+            self.stdout.write(
+                f"  {name + ':':<28} {stage['seconds']:>9.3f}s  "
+                f"{stage['ms_per_command']:>8.3f} ms/command  {stage['queries']:>7} queries"
+            )
@@ -0,0 +1,266 @@
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.db.models import Count, Q
+
+from core.db_tuning import DEFAULT_SQLITE_PRAGMAS, sqlite_pragmas
+
+# SQLite out of the box (rollback journal); the file is fresh, so this is
+# what the project ran with before SQLITE_PRAGMAS existed
+DEFAULT_PROFILE = {**dict.fromkeys(DEFAULT_SQLITE_PRAGMAS), 'journal_mode': 'DELETE'}
+PROFILES = ['default', 'tuned']
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def init_worker(db_name, pragmas):
+    """Point a fresh process at the scratch database with the profile's pragmas."""
+    django.setup()
+    logging.disable(logging.INFO)
+    settings.SQLITE_PRAGMAS = pragmas
+    connections.close_all()
+    connections['default'].settings_dict['NAME'] = db_name
+
+
+def ingest_worker(db_name, pragmas, worker, batches, size, error_rate, start, results):
+    """Reconcile `batches` synthetic pairs one after the other, like concurrent uploads."""
+    init_worker(db_name, pragmas)
+    from django.contrib.auth.models import User
+
+    from core.bot_validator import BOTValidator
+    from core.error_status import transition_batch
+    from core.models import BatchHistory
+    from core.synthetic import generate_batch
+
+    user = User.objects.get(username='benchmark')
+    pairs = [generate_batch(size, error_rate=error_rate, batch_identifier=f'TZCONC{worker:02d}{n:04d}', seed=n)
+             for n in range(batches)]
+    timings, locked = [], 0
+    start.wait()
+    for n, (customer_content, report_content, _expected) in enumerate(pairs):
+        began = time.perf_counter()
+        try:
+            batch = BatchHistory.objects.create(
+                batch_identifier=f'TZCONC{worker:02d}{n:04d}',
+                uploaded_by=user,
+                filename=f'concurrency_{worker}_{n}.xml',
+                status='pending',
+            )
+            _clean_xml, corrections = BOTValidator().process_xml_pair(
+                customer_content, report_content, batch=batch)
+            if corrections.get('error') and 'locked' in str(corrections['error']):
+                locked += 1
+            transition_batch(batch, 'resolved', user=user)
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            locked += 1
+        timings.append(time.perf_counter() - began)
+    results.put(('ingest', timings, locked))
+
+
+def dashboard_worker(db_name, pragmas, stop, start, results):
+    """Run the dashboard's counter and first-page queries until the ingest workers finish."""
+    init_worker(db_name, pragmas)
+    from core.models import CustomerError
+
+    timings, locked = [], 0
+    start.wait()
+    while not stop.is_set():
+        began = time.perf_counter()
+        try:
+            CustomerError.objects.aggregate(
+                total=Count('id'),
+                pending=Count('id', filter=Q(status='pending')),
+                resolved=Count('id', filter=Q(status='resolved')),
+            )
+            list(CustomerError.objects.select_related('batch').filter(status='pending')[:50])
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            locked += 1
+            continue
+        timings.append(time.perf_counter() - began)
+    results.put(('dashboard', timings, locked))
+
+
+class Command(BaseCommand):
+    help = ("Run parallel ingest and dashboard reads against scratch SQLite databases, "
+            "once with SQLite defaults and once with settings.SQLITE_PRAGMAS, and report "
+            "read latency, lock waits and 'database is locked' failures")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--writers',
+            type=int,
+            default=2,
+            help='Ingest processes (default: 2)',
+        )
+        parser.add_argument(
+            '--readers',
+            type=int,
+            default=4,
+            help='Dashboard reader processes (default: 4)',
+        )
+        parser.add_argument(
+            '--batches',
+            type=int,
+            default=3,
+            help='Batches reconciled by each ingest process (default: 3)',
+        )
+        parser.add_argument(
+            '--size',
+            type=int,
+            default=5000,
+            help='Commands per batch (default: 5000)',
+        )
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=0.2,
+            help='Fraction of commands the report rejects (default: 0.2)',
+        )
+        parser.add_argument(
+            '--lock-wait-ms',
+            type=float,
+            default=100,
+            help='Dashboard reads slower than this count as lock waits (default: 100)',
+        )
+        parser.add_argument(
+            '--profiles',
+            nargs='+',
+            choices=PROFILES,
+            default=PROFILES,
+            help='Pragma profiles to compare (default: default tuned)',
+        )
+        parser.add_argument(
+            '--output',
+            default='benchmark_concurrency.json',
+            help='JSON results file (default: benchmark_concurrency.json)',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("This benchmark compares SQLite pragma profiles")
+
+        workdir = tempfile.mkdtemp(prefix='cbt-concurrency-')
+        results = {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'writers': options['writers'],
+            'readers': options['readers'],
+            'batches': options['batches'],
+            'size': options['size'],
+            'runs': [],
+        }
+        if options['verbosity'] < 3:
+            logging.disable(logging.INFO)
+        original_pragmas = getattr(settings, 'SQLITE_PRAGMAS', None)
+        profiles = {'default': DEFAULT_PROFILE, 'tuned': sqlite_pragmas()}
+        try:
+            for name in options['profiles']:
+                run = self.run_profile(name, profiles[name], workdir, options)
+                results['runs'].append(run)
+                self.print_run(run)
+        finally:
+            settings.SQLITE_PRAGMAS = original_pragmas
+            logging.disable(logging.NOTSET)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def run_profile(self, name, pragmas, workdir, options):
+        from django.contrib.auth.models import User
+
+        settings.SQLITE_PRAGMAS = pragmas
+        connection.close()
+        connection.settings_dict.setdefault('TEST', {})
+        connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, f'{name}.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        db_name = connection.settings_dict['NAME']
+        try:
+            User.objects.get_or_create(username='benchmark')
+            connections.close_all()
+
+            start = multiprocessing.Event()
+            stop = multiprocessing.Event()
+            queue = multiprocessing.Queue()
+            writers = [
+                multiprocessing.Process(target=ingest_worker, args=(
+                    db_name, pragmas, worker, options['batches'], options['size'],
+                    options['error_rate'], start, queue))
+                for worker in range(options['writers'])
+            ]
+            readers = [
+                multiprocessing.Process(target=dashboard_worker, args=(db_name, pragmas, stop, start, queue))
+                for _ in range(options['readers'])
+            ]
+            for process in writers + readers:
+                process.start()
+            # Give the writers time to generate their batches before the clock starts
+            time.sleep(1 + options['size'] * options['batches'] / 20000)
+            began = time.perf_counter()
+            start.set()
+
+            outcomes = []
+            for _ in writers:
+                outcomes.append(queue.get())
+            elapsed = time.perf_counter() - began
+            stop.set()
+            for _ in readers:
+                outcomes.append(queue.get())
+            for process in writers + readers:
+                process.join()
+            if any(process.exitcode for process in writers + readers):
+                raise CommandError(f"A worker process failed during the {name} run")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        ingest = [t for kind, timings, _locked in outcomes if kind == 'ingest' for t in timings]
+        reads = [t for kind, timings, _locked in outcomes if kind == 'dashboard' for t in timings]
+        lock_wait = options['lock_wait_ms'] / 1000
+        return {
+            'profile': name,
+            'pragmas': pragmas,
+            'seconds': round(elapsed, 3),
+            'batches': len(ingest),
+            'batch_seconds_mean': round(statistics.mean(ingest), 3) if ingest else None,
+            'ingest_locked': sum(locked for kind, _t, locked in outcomes if kind == 'ingest'),
+            'reads': len(reads),
+            'reads_per_second': round(len(reads) / elapsed, 1),
+            'read_ms_p50': round(percentile(reads, 50) * 1000, 2) if reads else None,
+            'read_ms_p95': round(percentile(reads, 95) * 1000, 2) if reads else None,
+            'read_ms_max': round(max(reads) * 1000, 2) if reads else None,
+            'read_lock_waits': sum(1 for t in reads if t > lock_wait),
+            'read_locked': sum(locked for kind, _t, locked in outcomes if kind == 'dashboard'),
+        }
+
+    def print_run(self, run):
+        self.stdout.write(
+            f"{run['profile']}: {run['batches']} batches in {run['seconds']:.2f}s "
+            f"({run['batch_seconds_mean']}s each), {run['ingest_locked']} ingest 'database is locked'"
+        )
+        self.stdout.write(
+            f"  {run['reads']} dashboard reads ({run['reads_per_second']}/s), "
+            f"p50 {run['read_ms_p50']} ms, p95 {run['read_ms_p95']} ms, max {run['read_ms_max']} ms, "
+            f"{run['read_lock_waits']} lock waits, {run['read_locked']} 'database is locked'"
+        )
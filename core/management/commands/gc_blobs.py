@@ -0,0 +1,38 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from core.storage import ContentAddressedStorage
+
+
+class Command(BaseCommand):
+    help = ("Delete content-addressed blobs that no batch, cached validation result "
+            "or error archive references")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=3600,
+            help='Keep unreferenced blobs younger than this many seconds (default: 3600)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only list the blobs that would be deleted',
+        )
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError("Default storage is not a ContentAddressedStorage")
+
+        removed, freed = default_storage.collect_garbage(
+            min_age=options['min_age'],
+            dry_run=options['dry_run'],
+        )
+        for name in removed:
+            self.stdout.write(name)
+
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {len(removed)} unreferenced blob(s), {freed / 1024:.1f} KB"
+        ))
@@ -0,0 +1,104 @@
+import os
+import signal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core.ingest import IngestService
+
+
+class Command(BaseCommand):
+    help = ("Watch folders for customer XML batches and BOT reports, reconcile each pair "
+            "as soon as both files have arrived and archive the files")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'directories',
+            nargs='*',
+            help='Folders to watch (default: settings.INGEST_WATCH_DIRS)',
+        )
+        parser.add_argument(
+            '--archive-dir',
+            default=None,
+            help='Where processed files are moved (default: settings.INGEST_ARCHIVE_DIR)',
+        )
+        parser.add_argument(
+            '--failed-dir',
+            default=None,
+            help='Where failed or unusable files are moved (default: settings.INGEST_FAILED_DIR)',
+        )
+        parser.add_argument(
+            '--user',
+            help='Username the batches are recorded under (default: first superuser)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'INGEST_WORKERS', 2),
+            help='Pairs reconciled at the same time (default: settings.INGEST_WORKERS)',
+        )
+        parser.add_argument(
+            '--settle',
+            type=float,
+            default=5,
+            help='Seconds a file must stay unchanged before it is read (default: 5)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Polling interval in seconds, also the inotify timeout (default: 5)',
+        )
+        parser.add_argument(
+            '--poll',
+            action='store_true',
+            help='Poll even if inotify is available',
+        )
+        parser.add_argument(
+            '--output-dir',
+            help='Also write clean XML to this directory as clean_<Identifier>.xml',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process the files already present and exit',
+        )
+
+    def handle(self, *args, **options):
+        directories = options['directories'] or getattr(settings, 'INGEST_WATCH_DIRS', [])
+        if not directories:
+            raise CommandError("No folders to watch, pass them or set INGEST_WATCH_DIRS")
+        archive_dir = options['archive_dir'] or getattr(settings, 'INGEST_ARCHIVE_DIR', None)
+        failed_dir = options['failed_dir'] or getattr(settings, 'INGEST_FAILED_DIR', None)
+        if not archive_dir or not failed_dir:
+            raise CommandError("Set --archive-dir and --failed-dir (or INGEST_ARCHIVE_DIR/INGEST_FAILED_DIR)")
+        for directory in (archive_dir, failed_dir):
+            if any(os.path.abspath(directory) == os.path.abspath(d) for d in directories):
+                raise CommandError(f"{directory} cannot be a watched folder")
+
+        username = options['user']
+        if username:
+            if not User.objects.filter(username=username).exists():
+                raise CommandError(f"User {username} does not exist")
+        else:
+            superuser = User.objects.filter(is_superuser=True).order_by('id').first()
+            if superuser is None:
+                raise CommandError("No superuser found, pass --user")
+            username = superuser.username
+
+        service = IngestService(
+            directories,
+            archive_dir,
+            failed_dir,
+            username,
+            workers=options['workers'],
+            settle_seconds=options['settle'],
+            poll_seconds=options['interval'],
+            incremental=getattr(settings, 'INCREMENTAL_REVALIDATION', True),
+            output_dir=options['output_dir'],
+            use_inotify=not options['poll'],
+        )
+        signal.signal(signal.SIGTERM, service.stop)
+        processed, failed = service.run(once=options['once'])
+        self.stdout.write(f"Ingest stopped: {processed} pair(s) reconciled, {failed} failed")
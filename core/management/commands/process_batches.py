@@ -0,0 +1,133 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.batch_processing import discover, init_worker, pair_files, process_pair
+
+
+class Command(BaseCommand):
+    help = ("Reconcile customer XML batches against BOT reports without going through "
+            "the web UI. Files are paired by Header/Identifier.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='+',
+            help='Directories or glob patterns holding customer XML and BOT reports '
+                 '(e.g. customer_xml/ bot_reports/ "xml_uploads/*.xml")',
+        )
+        parser.add_argument(
+            '--user',
+            help='Username the batches are recorded under (default: first superuser)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=min(4, os.cpu_count() or 1),
+            help='Worker processes (default: min(4, CPUs)); 1 processes inline',
+        )
+        parser.add_argument(
+            '--output-dir',
+            help='Also write clean XML to this directory as clean_<Identifier>.xml',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Reconcile every command, even ones unchanged since the last submission',
+        )
+        parser.add_argument(
+            '--no-cache',
+            action='store_true',
+            help='Reprocess pairs that were already validated',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only list the pairs that would be processed',
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        username = options['user']
+        if username:
+            if not User.objects.filter(username=username).exists():
+                raise CommandError(f"User {username} does not exist")
+        else:
+            superuser = User.objects.filter(is_superuser=True).order_by('id').first()
+            if superuser is None:
+                raise CommandError("No superuser found, pass --user")
+            username = superuser.username
+
+        paths = discover(options['paths'])
+        if not paths:
+            raise CommandError("No XML files found")
+        pairs, unpaired = pair_files(paths)
+        self.stdout.write(f"{len(paths)} files, {len(pairs)} pairs, {len(unpaired)} unpaired")
+        if options['verbosity'] > 1 or options['dry_run']:
+            for identifier, (customer_path, report_path) in pairs.items():
+                self.stdout.write(f"  {identifier}: {customer_path} + {report_path}")
+            for path, reason in unpaired:
+                self.stdout.write(f"  skipped {path}: {reason}")
+        if options['dry_run'] or not pairs:
+            return
+
+        incremental = not options['full'] and getattr(settings, 'INCREMENTAL_REVALIDATION', True)
+        kwargs = {
+            'username': username,
+            'incremental': incremental,
+            'use_cache': not options['no_cache'],
+            'output_dir': options['output_dir'],
+        }
+        workers = max(1, min(options['workers'], len(pairs)))
+
+        start = time.perf_counter()
+        results = []
+        if workers == 1:
+            for identifier, (customer_path, report_path) in pairs.items():
+                results.append(self.report(process_pair(identifier, customer_path, report_path, **kwargs)))
+        else:
+            # Children must not share the parent's database connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+                futures = [
+                    pool.submit(process_pair, identifier, customer_path, report_path, **kwargs)
+                    for identifier, (customer_path, report_path) in pairs.items()
+                ]
+                for future in as_completed(futures):
+                    results.append(self.report(future.result()))
+        elapsed = time.perf_counter() - start
+
+        failed = [r for r in results if r['error']]
+        commands = sum(r['commands'] for r in results)
+        clean = sum(r['clean'] for r in results)
+        total_bytes = sum(r['bytes'] for r in results)
+        rows = [
+            ('Pairs', f"{len(results)} ({len(failed)} failed, "
+                      f"{sum(1 for r in results if r['cached'])} from cache)"),
+            ('Commands', f"{commands} ({clean} clean, {commands - clean} rejected)"),
+            ('Input', f"{total_bytes / 1024 / 1024:.1f} MB"),
+            ('Wall time', f"{elapsed:.2f}s with {workers} worker{'s' if workers > 1 else ''}"),
+            ('Throughput', f"{commands / elapsed:.0f} commands/s, "
+                           f"{total_bytes / 1024 / 1024 / elapsed:.2f} MB/s, "
+                           f"{len(results) / elapsed:.2f} pairs/s"),
+        ]
+        for label, value in rows:
+            self.stdout.write(f"{label + ':':<12} {value}")
+        if failed:
+            raise CommandError(f"{len(failed)} pair(s) failed")
+
+    def report(self, result):
+        if result['error']:
+            self.stderr.write(f"{result['identifier']}: {result['error']}")
+        elif self.verbosity > 0:
+            source = ' (cached)' if result['cached'] else ''
+            self.stdout.write(
+                f"{result['identifier']}: {result['commands']} commands, {result['clean']} clean "
+                f"in {result['seconds']:.2f}s{source}"
+            )
+        return result
@@ -0,0 +1,76 @@
+import os
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.external_reconcile import DEFAULT_MEMORY_MB, reconcile_files
+from core.header_probe import probe_header
+from core.models import BatchHistory
+
+
+class Command(BaseCommand):
+    help = ("Reconcile one customer XML batch against its BOT report within a fixed memory "
+            "budget, spilling both to disk. For batches too large to process in memory.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('customer_file', help='Customer XML batch')
+        parser.add_argument('report_file', help='BOT report for the batch')
+        parser.add_argument(
+            '--user',
+            help='Username the batch is recorded under (default: first superuser)',
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the clean XML here (default: clean_<Identifier>.xml in the current directory)',
+        )
+        parser.add_argument(
+            '--memory-mb',
+            type=int,
+            default=getattr(settings, 'EXTERNAL_RECONCILE_MEMORY_MB', DEFAULT_MEMORY_MB),
+            help='Memory budget in MB (default: settings.EXTERNAL_RECONCILE_MEMORY_MB)',
+        )
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"User {options['user']} does not exist")
+        else:
+            user = User.objects.filter(is_superuser=True).order_by('id').first()
+            if user is None:
+                raise CommandError("No superuser found, pass --user")
+
+        for path in (options['customer_file'], options['report_file']):
+            if not os.path.isfile(path):
+                raise CommandError(f"{path} does not exist")
+        customer_header = probe_header(options['customer_file'])
+        report_header = probe_header(options['report_file'])
+        if customer_header.identifier != report_header.identifier:
+            raise CommandError(f"Batch identifiers do not match: {customer_header.identifier} "
+                               f"(customer file) and {report_header.identifier} (BOT report)")
+        identifier = customer_header.identifier or 'unknown_batch'
+
+        timestamp = timezone.now().strftime('%Y%m%d_%H%M%S_%f')
+        batch = BatchHistory.objects.create(
+            batch_identifier=f'{identifier}_{timestamp}',
+            uploaded_by=user,
+            filename=os.path.basename(options['customer_file']),
+            status='pending'
+        )
+        output = options['output'] or f'clean_{identifier}.xml'
+        clean_xml, corrections = reconcile_files(
+            options['customer_file'], options['report_file'], batch=batch,
+            clean_output=output, memory_budget=options['memory_mb'] * 1024 * 1024)
+
+        if corrections.get('error'):
+            batch.status = 'failed'
+            batch.save()
+            raise CommandError(f"{identifier}: {corrections['error']}")
+        batch.status = 'completed' if clean_xml else 'failed'
+        batch.save()
+        self.stdout.write(
+            f"{identifier}: {corrections['total_input_commands']} commands, "
+            f"{corrections['total_clean_commands']} clean"
+            + (f", clean XML in {clean_xml}" if clean_xml else ""))
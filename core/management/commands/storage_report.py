@@ -0,0 +1,105 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from core.storage import COMPRESSION_SUFFIXES, compress_bytes, open_compressed, zstandard
+
+
+class Command(BaseCommand):
+    help = ("Compare raw XML uploads, BOT reports and clean XML against compressed "
+            "blobs: disk used and time to read each file back")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='*',
+            help='Files or directories to measure (default: xml_uploads, bot_reports, clean_xml)',
+        )
+        parser.add_argument(
+            '--compression',
+            choices=[c for c in COMPRESSION_SUFFIXES if c],
+            default=None,
+            help='Codec to compare against (default: settings.BLOB_COMPRESSION)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Reads per file when timing (default: 5)',
+        )
+
+    def handle(self, *args, **options):
+        compression = options['compression'] or getattr(settings, 'BLOB_COMPRESSION', 'gzip') or 'gzip'
+        if compression == 'zstd' and zstandard is None:
+            self.stderr.write("zstandard is not installed, using gzip")
+            compression = 'gzip'
+
+        paths = options['paths'] or [
+            default_storage.path(d) for d in ('xml_uploads', 'bot_reports', 'clean_xml')
+        ]
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                for dirpath, _dirnames, filenames in os.walk(path):
+                    files.extend(os.path.join(dirpath, f) for f in sorted(filenames))
+            elif os.path.isfile(path):
+                files.append(path)
+
+        if not files:
+            self.stdout.write("No files found")
+            return
+
+        tmp_path = os.path.join(default_storage.path(''), f'.storage_report{COMPRESSION_SUFFIXES[compression]}')
+        raw_total = compressed_total = 0
+        raw_time = compressed_time = 0.0
+        repeat = max(options['repeat'], 1)
+        try:
+            for path in files:
+                with open(path, 'rb') as f:
+                    raw = f.read()
+                packed = compress_bytes(raw, compression)
+                with open(tmp_path, 'wb') as f:
+                    f.write(packed)
+
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    with open(path, 'rb') as f:
+                        f.read()
+                raw_read = (time.perf_counter() - start) / repeat
+
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    with open_compressed(tmp_path, compression) as f:
+                        data = f.read()
+                compressed_read = (time.perf_counter() - start) / repeat
+                if data != raw:
+                    raise CommandError(f"Round trip failed for {path}")
+
+                raw_total += len(raw)
+                compressed_total += len(packed)
+                raw_time += raw_read
+                compressed_time += compressed_read
+                if options['verbosity'] > 1:
+                    self.stdout.write(
+                        f"{path}: {len(raw)} -> {len(packed)} bytes, "
+                        f"read {raw_read * 1000:.2f} ms raw / {compressed_read * 1000:.2f} ms {compression}"
+                    )
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        saved = raw_total - compressed_total
+        rows = [
+            ('Files', f"{len(files)}"),
+            ('Raw size', f"{raw_total / 1024:.1f} KB"),
+            (f'{compression} size', f"{compressed_total / 1024:.1f} KB"),
+            ('Disk saved', f"{saved / 1024:.1f} KB ({saved / raw_total * 100:.1f}%)"),
+            ('Raw read', f"{raw_time * 1000:.2f} ms total, {raw_time / len(files) * 1000:.3f} ms/file"),
+            (f'{compression} read', f"{compressed_time * 1000:.2f} ms total, "
+                                    f"{compressed_time / len(files) * 1000:.3f} ms/file"),
+        ]
+        for label, value in rows:
+            self.stdout.write(f"{label + ':':<16} {value}")
@@ -0,0 +1,139 @@
+# core/metrics.py
+"""
+Phase timings for BOTValidator.process_xml_pair.
+
+Each reconciliation records, per phase, the seconds spent, the number of
+items handled and the bytes processed, and stores them on
+BatchHistory.phase_metrics. render_prometheus() exposes them in the
+Prometheus text format for the /metrics/ endpoint.
+"""
+import contextlib
+import time
+
+from .profiling import phase as profile_phase
+
+# Phases in pipeline order
+PHASES = (
+    'decode',          # bytes -> text, for both files
+    'parse_customer',  # customer XML -> element tree
+    'parse_report',    # BOT report -> element tree (or ReportRecords when streamed)
+    'index',           # fingerprint commands, index report results by identifier
+    'match',           # reconcile every command against its result
+    'persist',         # bulk insert CleanEntry/CustomerError/CommandFingerprint rows
+    'serialise',       # write the clean XML
+)
+
+# Request profiling (core/profiling.py) groups phases more coarsely
+PROFILE_GROUPS = {
+    'decode': 'parse',
+    'parse_customer': 'parse',
+    'parse_report': 'parse',
+    'index': 'parse',
+    'match': 'validation',
+    'persist': 'persist',
+    'serialise': 'serialise',
+}
+
+
+class PipelineMetrics:
+    """Seconds, items and bytes per phase for one process_xml_pair run."""
+
+    def __init__(self):
+        self.phases = {}
+
+    def _entry(self, name):
+        return self.phases.setdefault(name, {'seconds': 0.0, 'items': 0, 'bytes': 0})
+
+    @contextlib.contextmanager
+    def phase(self, name, items=0, nbytes=0):
+        entry = self._entry(name)
+        start = time.perf_counter()
+        try:
+            with profile_phase(PROFILE_GROUPS.get(name, name)):
+                yield entry
+        finally:
+            entry['seconds'] += time.perf_counter() - start
+            entry['items'] += items
+            entry['bytes'] += nbytes
+
+    def add(self, name, items=0, nbytes=0):
+        """Count items/bytes for a phase outside its timed block."""
+        entry = self._entry(name)
+        entry['items'] += items
+        entry['bytes'] += nbytes
+
+    def as_dict(self):
+        """Phases in pipeline order, rounded for storage."""
+        ordered = sorted(self.phases, key=lambda n: PHASES.index(n) if n in PHASES else len(PHASES))
+        return {
+            name: {
+                'seconds': round(self.phases[name]['seconds'], 6),
+                'items': self.phases[name]['items'],
+                'bytes': self.phases[name]['bytes'],
+            }
+            for name in ordered
+        }
+
+    @property
+    def total_seconds(self):
+        return sum(entry['seconds'] for entry in self.phases.values())
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(batches):
+    """
+    Prometheus text exposition of phase metrics.
+
+    batches: iterable of (batch_identifier, phase_metrics) newest first,
+    the window the caller chose (settings.METRICS_WINDOW_BATCHES for
+    /metrics/). The sums over the window are gauges, not counters: they
+    drop when batches leave the window or are purged. The newest batch is
+    also exported on its own so a single slow batch is visible.
+    """
+    totals = {name: {'seconds': 0.0, 'items': 0, 'bytes': 0} for name in PHASES}
+    count = 0
+    latest = None
+    for batch_identifier, metrics in batches:
+        if not metrics:
+            continue
+        count += 1
+        if latest is None:
+            latest = (batch_identifier, metrics)
+        for name, entry in metrics.items():
+            total = totals.setdefault(name, {'seconds': 0.0, 'items': 0, 'bytes': 0})
+            total['seconds'] += entry.get('seconds', 0)
+            total['items'] += entry.get('items', 0)
+            total['bytes'] += entry.get('bytes', 0)
+
+    lines = [
+        '# HELP cbt_reconcile_window_batches Recent batches with phase metrics summed below.',
+        '# TYPE cbt_reconcile_window_batches gauge',
+        f'cbt_reconcile_window_batches {count}',
+    ]
+    for field, unit, help_text in (
+        ('seconds', 'seconds', 'Time spent per reconciliation phase over the recent batches.'),
+        ('items', 'items', 'Items handled per reconciliation phase over the recent batches.'),
+        ('bytes', 'bytes', 'Bytes processed per reconciliation phase over the recent batches.'),
+    ):
+        metric = f'cbt_reconcile_window_phase_{unit}'
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} gauge')
+        for name, total in totals.items():
+            lines.append(f'{metric}{{phase="{_escape(name)}"}} {total[field]}')
+
+    if latest is not None:
+        batch_identifier, metrics = latest
+        lines.append('# HELP cbt_reconcile_last_phase_seconds Phase time of the most recent batch.')
+        lines.append('# TYPE cbt_reconcile_last_phase_seconds gauge')
+        for name, entry in metrics.items():
+            lines.append(f'cbt_reconcile_last_phase_seconds{{phase="{_escape(name)}",'
+                         f'batch="{_escape(batch_identifier)}"}} {entry.get("seconds", 0)}')
+        lines.append('# HELP cbt_reconcile_last_phase_items Items handled per phase in the most recent batch.')
+        lines.append('# TYPE cbt_reconcile_last_phase_items gauge')
+        for name, entry in metrics.items():
+            lines.append(f'cbt_reconcile_last_phase_items{{phase="{_escape(name)}",'
+                         f'batch="{_escape(batch_identifier)}"}} {entry.get("items", 0)}')
+    return '\n'.join(lines) + '\n'
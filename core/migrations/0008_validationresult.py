@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_batchhistory_clean_xml_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ValidationResult',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('customer_sha256', models.CharField(max_length=64)),
+                ('report_sha256', models.CharField(max_length=64)),
+                ('rules_version', models.CharField(max_length=20)),
+                ('corrections', models.JSONField(default=dict)),
+                ('clean_xml_file', models.CharField(blank=True, max_length=255, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('hit_count', models.IntegerField(default=0)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='validation_results', to='core.batchhistory')),
+            ],
+            options={
+                'ordering': ['-last_hit_at'],
+                'constraints': [models.UniqueConstraint(fields=('customer_sha256', 'report_sha256', 'rules_version'), name='unique_validation_result')],
+            },
+        ),
+    ]
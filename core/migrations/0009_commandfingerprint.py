@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_validationresult'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommandFingerprint',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('batch_identifier', models.CharField(max_length=100)),
+                ('identifier', models.CharField(max_length=100)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('result_hash', models.CharField(blank=True, default='', max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprints', to='core.batchhistory')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['batch_identifier', 'batch'], name='fingerprint_batch_idx')],
+            },
+        ),
+    ]
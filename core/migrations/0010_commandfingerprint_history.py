@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_commandfingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commandfingerprint',
+            name='customer_code',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='commandfingerprint',
+            name='error_codes',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='commandfingerprint',
+            name='outcome',
+            field=models.CharField(choices=[('ok', 'OK'), ('error', 'Error')], default='ok', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='commandfingerprint',
+            index=models.Index(fields=['identifier', 'batch'], name='fingerprint_identifier_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commandfingerprint',
+            index=models.Index(fields=['customer_code', 'batch'], name='fingerprint_customer_idx'),
+        ),
+    ]
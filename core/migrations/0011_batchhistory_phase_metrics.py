@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_commandfingerprint_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batchhistory',
+            name='phase_metrics',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
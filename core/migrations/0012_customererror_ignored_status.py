@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_batchhistory_phase_metrics'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customererror',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('resolved', 'Resolved'), ('ignored', 'Ignored'), ('ok', 'OK')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_customererror_ignored_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cleanentry',
+            index=models.Index(fields=['batch_identifier'], name='cleanentry_batch_idx'),
+        ),
+    ]
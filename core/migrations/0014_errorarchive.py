@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_cleanentry_batch_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ErrorArchive',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('archive_file', models.CharField(max_length=255)),
+                ('compression', models.CharField(blank=True, max_length=10, null=True)),
+                ('error_count', models.IntegerField(default=0)),
+                ('status_counts', models.JSONField(blank=True, default=dict)),
+                ('size', models.BigIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('batch', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='error_archive', to='core.batchhistory')),
+            ],
+            options={
+                'ordering': ['-archived_at'],
+            },
+        ),
+    ]
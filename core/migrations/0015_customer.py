@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_errorarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('identifier', models.CharField(max_length=100, unique=True)),
+                ('customer_code', models.CharField(blank=True, default='', max_length=100)),
+                ('name', models.CharField(blank=True, default='', max_length=255)),
+                ('phone', models.CharField(blank=True, default='', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='cleanentry',
+            name='customer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='clean_entries', to='core.customer'),
+        ),
+        migrations.AddField(
+            model_name='customererror',
+            name='customer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='errors', to='core.customer'),
+        ),
+        migrations.AddField(
+            model_name='submittedcustomerdata',
+            name='customer',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='submission', to='core.customer'),
+        ),
+    ]
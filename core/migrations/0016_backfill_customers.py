@@ -0,0 +1,56 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 500
+
+
+def backfill_customers(apps, schema_editor):
+    """
+    One Customer per identifier found in submitted data, errors and clean
+    entries, then point every row at its customer with one UPDATE per table.
+    Submitted data is read first: its contact details win.
+    """
+    Customer = apps.get_model('core', 'Customer')
+    SubmittedCustomerData = apps.get_model('core', 'SubmittedCustomerData')
+    CustomerError = apps.get_model('core', 'CustomerError')
+    CleanEntry = apps.get_model('core', 'CleanEntry')
+    db = schema_editor.connection.alias
+
+    details = {}
+    submitted = SubmittedCustomerData.objects.using(db).values_list(
+        'identifier', 'customer_code', 'birth_surname', 'trade_name', 'phone')
+    for identifier, code, birth_surname, trade_name, phone in submitted.iterator(chunk_size=2000):
+        details.setdefault(identifier, (code, birth_surname or trade_name, phone))
+    errors = CustomerError.objects.using(db).order_by('-id').values_list(
+        'identifier', 'customer_code', 'customer_name', 'phone')
+    for identifier, code, name, phone in errors.iterator(chunk_size=2000):
+        details.setdefault(identifier, (code, name, phone))
+    entries = CleanEntry.objects.using(db).order_by('-id').values_list(
+        'identifier', 'customer_code', 'customer_name')
+    for identifier, code, name in entries.iterator(chunk_size=2000):
+        details.setdefault(identifier, (code, name, ''))
+
+    Customer.objects.using(db).bulk_create(
+        [
+            Customer(identifier=identifier, customer_code=code or '',
+                     name=(name or '')[:255], phone=(phone or '')[:20])
+            for identifier, (code, name, phone) in details.items() if identifier
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+    customer = Customer.objects.using(db).filter(identifier=OuterRef('identifier')).values('id')[:1]
+    for model in (SubmittedCustomerData, CustomerError, CleanEntry):
+        model.objects.using(db).filter(customer__isnull=True).update(customer_id=Subquery(customer))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_customer'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_customers, migrations.RunPython.noop),
+    ]
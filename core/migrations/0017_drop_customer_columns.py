@@ -0,0 +1,73 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 500
+
+
+def link_remaining_customers(apps, schema_editor):
+    """
+    Errors and clean entries written without a customer keep their name,
+    code and phone only in the columns removed below: move them to a
+    Customer first, as 0016 did.
+    """
+    Customer = apps.get_model('core', 'Customer')
+    CustomerError = apps.get_model('core', 'CustomerError')
+    CleanEntry = apps.get_model('core', 'CleanEntry')
+    db = schema_editor.connection.alias
+
+    details = {}
+    errors = CustomerError.objects.using(db).filter(customer__isnull=True).order_by('-id').values_list(
+        'identifier', 'customer_code', 'customer_name', 'phone')
+    for identifier, code, name, phone in errors.iterator(chunk_size=2000):
+        details.setdefault(identifier, (code, name, phone))
+    entries = CleanEntry.objects.using(db).filter(customer__isnull=True).order_by('-id').values_list(
+        'identifier', 'customer_code', 'customer_name')
+    for identifier, code, name in entries.iterator(chunk_size=2000):
+        details.setdefault(identifier, (code, name, ''))
+    if not details:
+        return
+
+    Customer.objects.using(db).bulk_create(
+        [
+            Customer(identifier=identifier, customer_code=code or '',
+                     name=(name or '')[:255], phone=(phone or '')[:20])
+            for identifier, (code, name, phone) in details.items() if identifier
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+    customer = Customer.objects.using(db).filter(identifier=OuterRef('identifier')).values('id')[:1]
+    for model in (CustomerError, CleanEntry):
+        model.objects.using(db).filter(customer__isnull=True).update(customer_id=Subquery(customer))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_backfill_customers'),
+    ]
+
+    operations = [
+        migrations.RunPython(link_remaining_customers, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='customererror',
+            name='customer_name',
+        ),
+        migrations.RemoveField(
+            model_name='customererror',
+            name='customer_code',
+        ),
+        migrations.RemoveField(
+            model_name='customererror',
+            name='phone',
+        ),
+        migrations.RemoveField(
+            model_name='cleanentry',
+            name='customer_name',
+        ),
+        migrations.RemoveField(
+            model_name='cleanentry',
+            name='customer_code',
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_drop_customer_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParameterKey',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ErrorParameter',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('value', models.TextField(blank=True)),
+                ('error', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parameters', to='core.customererror')),
+                ('key', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='values', to='core.parameterkey')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key', 'value'], name='errorparameter_key_value_idx')],
+            },
+        ),
+    ]
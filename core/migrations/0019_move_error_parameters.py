@@ -0,0 +1,66 @@
+import json
+
+from django.db import migrations
+
+CHUNK_SIZE = 2000
+# customer_details keys that are customer data, not Exception parameters
+DETAIL_KEYS = {'birth_surname', 'phone', 'customer_code', 'loan_amount', 'friendly_message'}
+
+
+def move_parameters(apps, schema_editor):
+    """
+    Move the Exception parameters out of CustomerError.customer_details into
+    ErrorParameter rows, leaving only the customer keys in the JSON. The
+    Message parameter is dropped when it is the error's message column.
+    """
+    CustomerError = apps.get_model('core', 'CustomerError')
+    ErrorParameter = apps.get_model('core', 'ErrorParameter')
+    ParameterKey = apps.get_model('core', 'ParameterKey')
+    db = schema_editor.connection.alias
+
+    key_ids = dict(ParameterKey.objects.using(db).values_list('name', 'id'))
+    last_id = 0
+    while True:
+        errors = list(CustomerError.objects.using(db)
+                      .filter(id__gt=last_id).exclude(customer_details__isnull=True)
+                      .order_by('id').only('id', 'message', 'customer_details')[:CHUNK_SIZE])
+        if not errors:
+            break
+        last_id = errors[-1].id
+
+        moved, rows = [], []
+        for error in errors:
+            details = error.customer_details
+            if isinstance(details, str):
+                try:
+                    details = json.loads(details)
+                except json.JSONDecodeError:
+                    continue
+            if not isinstance(details, dict):
+                continue
+            kept = {k: v for k, v in details.items() if k in DETAIL_KEYS}
+            if kept == details:
+                continue
+            params = {k: v for k, v in details.items() if k not in DETAIL_KEYS}
+            if params.get('Message') == error.message:
+                del params['Message']
+            for name in params.keys() - key_ids.keys():
+                key_ids[name] = ParameterKey.objects.using(db).get_or_create(name=name)[0].id
+            rows.extend(ErrorParameter(error_id=error.id, key_id=key_ids[k],
+                                       value='' if v is None else str(v)) for k, v in params.items())
+            error.customer_details = kept
+            moved.append(error)
+
+        ErrorParameter.objects.using(db).bulk_create(rows, batch_size=500)
+        CustomerError.objects.using(db).bulk_update(moved, ['customer_details'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_error_parameters'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_parameters, migrations.RunPython.noop),
+    ]
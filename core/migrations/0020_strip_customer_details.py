@@ -0,0 +1,48 @@
+import json
+
+from django.db import migrations
+
+CHUNK_SIZE = 2000
+# customer_details keys the upload views used to copy from submitted data,
+# now read from the error's Customer
+CUSTOMER_KEYS = {'birth_surname', 'phone', 'customer_code'}
+
+
+def strip_customer_keys(apps, schema_editor):
+    """Drop the customer's name, phone and code copies from CustomerError.customer_details."""
+    CustomerError = apps.get_model('core', 'CustomerError')
+    db = schema_editor.connection.alias
+
+    last_id = 0
+    while True:
+        errors = list(CustomerError.objects.using(db)
+                      .filter(id__gt=last_id).exclude(customer_details__isnull=True)
+                      .order_by('id').only('id', 'customer_details')[:CHUNK_SIZE])
+        if not errors:
+            break
+        last_id = errors[-1].id
+
+        stripped = []
+        for error in errors:
+            details = error.customer_details
+            if isinstance(details, str):
+                try:
+                    details = json.loads(details)
+                except json.JSONDecodeError:
+                    continue
+            if not isinstance(details, dict) or not details.keys() & CUSTOMER_KEYS:
+                continue
+            error.customer_details = {k: v for k, v in details.items() if k not in CUSTOMER_KEYS}
+            stripped.append(error)
+        CustomerError.objects.using(db).bulk_update(stripped, ['customer_details'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_move_error_parameters'),
+    ]
+
+    operations = [
+        migrations.RunPython(strip_customer_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_strip_customer_details'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ErrorCode',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('code', models.CharField(max_length=50, unique=True)),
+                ('severity', models.CharField(max_length=20)),
+                ('category', models.CharField(max_length=20)),
+                ('template', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['code'],
+            },
+        ),
+        migrations.AddField(
+            model_name='customererror',
+            name='code',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='errors', to='core.errorcode'),
+        ),
+    ]
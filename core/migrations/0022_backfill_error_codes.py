@@ -0,0 +1,84 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+# Snapshot of core.error_codes and ERROR_CODE_TRANSLATIONS when the
+# catalogue was introduced, so later changes there do not alter this migration
+SEVERITY_PREFIXES = (
+    ('E', 'high'),
+    ('W', 'low'),
+    ('C', 'critical'),
+)
+DEFAULT_SEVERITY = 'medium'
+INTERNAL_CODES = {'NO_RESULT', 'NO_COMMANDS', 'UNKNOWN'}
+TRANSLATIONS = {
+    'UNKNOWN': 'An unknown error has occurred with this record.',
+    'E': 'Critical Error',
+    'W': 'Warning',
+    'C': 'Critical Error',
+    'E001': 'Customer code is missing or invalid',
+    'E002': 'Required personal information is missing',
+    'E003': 'Invalid identification document',
+    'E004': 'Invalid contact information',
+    'E005': 'Invalid address information',
+    'W001': 'Missing optional field that is recommended',
+    'W002': 'Date format is incorrect',
+    'C001': 'Critical validation error in primary data field',
+    'cvc-datatype-valid': 'The data format is invalid',
+    'cvc-enumeration-valid': 'The selected region is not valid',
+    'cvc-pattern-valid': 'The identification format is invalid',
+}
+
+
+def severity_for(code):
+    for prefix, severity in SEVERITY_PREFIXES:
+        if code.startswith(prefix):
+            return severity
+    return DEFAULT_SEVERITY
+
+
+def category_for(code):
+    if code in INTERNAL_CODES:
+        return 'internal'
+    if code.startswith('cvc-'):
+        return 'schema'
+    if code.startswith('ResultCode.'):
+        return 'result'
+    return 'bot'
+
+
+def template_for(code):
+    if code in TRANSLATIONS:
+        return TRANSLATIONS[code]
+    return TRANSLATIONS.get(code.split('-')[0], '')
+
+
+def backfill_error_codes(apps, schema_editor):
+    """Catalogue every error code already stored and point the errors at it."""
+    CustomerError = apps.get_model('core', 'CustomerError')
+    ErrorCode = apps.get_model('core', 'ErrorCode')
+    db = schema_editor.connection.alias
+
+    codes = (CustomerError.objects.using(db).order_by()
+             .values_list('error_code', flat=True).distinct())
+    ErrorCode.objects.using(db).bulk_create(
+        [
+            ErrorCode(code=code, severity=severity_for(code), category=category_for(code),
+                      template=template_for(code))
+            for code in codes if code
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    code = ErrorCode.objects.using(db).filter(code=OuterRef('error_code')).values('id')[:1]
+    CustomerError.objects.using(db).filter(code__isnull=True).update(code_id=Subquery(code))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_error_code'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_error_codes, migrations.RunPython.noop),
+    ]
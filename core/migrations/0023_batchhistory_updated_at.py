@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_backfill_error_codes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batchhistory',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def error_ids_to_range(apps, schema_editor):
+    """Turn each upload's list of error ids into its batch and id range."""
+    RecentUpload = apps.get_model('core', 'RecentUpload')
+    CustomerError = apps.get_model('core', 'CustomerError')
+    db = schema_editor.connection.alias
+
+    for upload in RecentUpload.objects.using(db).iterator():
+        if not upload.error_ids:
+            continue
+        upload.first_error_id = min(upload.error_ids)
+        upload.last_error_id = max(upload.error_ids)
+        upload.batch_id = (CustomerError.objects.using(db)
+                           .filter(id__in=upload.error_ids[:100])
+                           .values_list('batch_id', flat=True).first())
+        upload.save(update_fields=['first_error_id', 'last_error_id', 'batch'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_batchhistory_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recentupload',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='recent_uploads', to='core.batchhistory'),
+        ),
+        migrations.AddField(
+            model_name='recentupload',
+            name='first_error_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recentupload',
+            name='last_error_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(error_ids_to_range, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='recentupload',
+            name='error_ids',
+        ),
+    ]
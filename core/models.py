@@ -8,6 +8,7 @@ class BatchHistory(models.Model):
     id = models.AutoField(primary_key=True)
     batch_identifier = models.CharField(max_length=100, unique=True)
     upload_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     resolved_date = models.DateTimeField(null=True, blank=True)
     error_count = models.IntegerField(default=0)
     xml_file = models.FileField(upload_to='xml_uploads/')
@@ -27,6 +28,9 @@ class BatchHistory(models.Model):
         related_name='uploaded_batches'
     )
     filename = models.CharField(max_length=255)
+    # Reconciliation phase timings, see core/metrics.py:
+    # {phase: {'seconds': float, 'items': int, 'bytes': int}}
+    phase_metrics = models.JSONField(default=dict, blank=True)
 
     class Meta:
         verbose_name_plural = "Batch Histories"
@@ -35,11 +39,49 @@ class BatchHistory(models.Model):
     def __str__(self):
         return f"Batch {self.batch_identifier}"
 
+class Customer(models.Model):
+    """
+    One customer, keyed by its Command identifier. Errors, clean entries and
+    submitted data point at it so they are joined on an indexed integer
+    instead of the identifier string (see core/customers.py).
+    """
+    id = models.BigAutoField(primary_key=True)
+    identifier = models.CharField(max_length=100, unique=True)
+    customer_code = models.CharField(max_length=100, blank=True, default='')
+    name = models.CharField(max_length=255, blank=True, default='')
+    phone = models.CharField(max_length=20, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.identifier} - {self.name}"
+
+class ErrorCode(models.Model):
+    """
+    Catalogue of the error codes seen at ingest (BOT-E-0030,
+    cvc-pattern-valid, ...), created on first sight with the severity,
+    category and friendly message worked out once per code (see
+    core/error_codes.py).
+    """
+    id = models.AutoField(primary_key=True)
+    code = models.CharField(max_length=50, unique=True)
+    severity = models.CharField(max_length=20)
+    category = models.CharField(max_length=20)
+    template = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['code']
+
+    def __str__(self):
+        return self.code
+
 class CustomerError(models.Model):
     id = models.AutoField(primary_key=True)
     STATUS_CHOICES = (
         ('pending', 'Pending'),
         ('resolved', 'Resolved'),
+        ('ignored', 'Ignored'),
         ('ok', 'OK'),
     )
 
@@ -51,17 +93,28 @@ class CustomerError(models.Model):
 
     # Core fields
     batch = models.ForeignKey(BatchHistory, on_delete=models.CASCADE, related_name='errors')
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='errors'
+    )
     identifier = models.CharField(max_length=100)
-    customer_name = models.CharField(max_length=255, null=True, blank=True)
     account_number = models.CharField(max_length=100)
     amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     national_id = models.CharField(max_length=100, blank=True)
-    customer_code = models.CharField(max_length=100, null=True, blank=True)
-    phone = models.CharField(max_length=20, null=True, blank=True)
     full_error_code = models.CharField(max_length=100, null=True, blank=True)
     error_message = models.TextField(null=True, blank=True)
     loan_amount = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
     error_code = models.CharField(max_length=50)
+    code = models.ForeignKey(
+        ErrorCode,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='errors'
+    )
     message = models.TextField()
     line_number = models.IntegerField(null=True, blank=True)
     
@@ -115,20 +168,44 @@ class CustomerError(models.Model):
         return dict(self.SEVERITY_CHOICES).get(self.severity, self.severity)
         
     def get_customer_details_display(self):
-        """Return customer details as a dictionary."""
+        """Return customer details, with the Exception parameters, as a dictionary."""
         if not self.customer_details:
-            return {}
-        
-        if isinstance(self.customer_details, str):
+            details = {}
+        elif isinstance(self.customer_details, str):
             try:
-                return json.loads(self.customer_details)
+                details = json.loads(self.customer_details)
             except json.JSONDecodeError:
-                return {'error': 'Invalid JSON format'}
-        return self.customer_details
+                details = {'error': 'Invalid JSON format'}
+        else:
+            details = dict(self.customer_details)
+        return {**details, **self.get_parameters()}
+
+    def get_parameters(self):
+        """
+        Exception Parameters of this error as {key: value}, read from its
+        ErrorParameter rows (prefetch 'parameters__key' for lists of errors).
+        Errors read back from an archive carry them in `archived_parameters`.
+        """
+        if hasattr(self, 'archived_parameters'):
+            params = dict(self.archived_parameters)
+        elif self.pk is None:
+            params = {}
+        else:
+            params = {p.key.name: p.value for p in self.parameters.all()}
+        if self.message and params:
+            params.setdefault('Message', self.message)
+        return params
     
 class SubmittedCustomerData(models.Model):
     id = models.AutoField(primary_key=True)
     identifier = models.CharField(max_length=100, unique=True)
+    customer = models.OneToOneField(
+        Customer,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='submission'
+    )
     trade_name = models.CharField(max_length=255)
     registration_number = models.CharField(max_length=100)
     customer_code = models.CharField(max_length=100)
@@ -148,7 +225,17 @@ class RecentUpload(models.Model):
     filename = models.CharField(max_length=255)
     customer_count = models.IntegerField(default=0)
     error_count = models.IntegerField(default=0)
-    error_ids = models.JSONField(default=list)  # Changed from models.JSONField() to models.JSONField(default=list)
+    # The upload's errors: those of `batch` with ids from first_error_id to
+    # last_error_id, so no list of ids is stored here or in the session
+    batch = models.ForeignKey(
+        BatchHistory,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='recent_uploads'
+    )
+    first_error_id = models.IntegerField(null=True, blank=True)
+    last_error_id = models.IntegerField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
 
     class Meta:
@@ -157,14 +244,28 @@ class RecentUpload(models.Model):
     def __str__(self):
         return f"{self.filename} - {self.timestamp}"
 
+    def errors(self):
+        """The errors this upload created, through the primary key index."""
+        # Without its batch (deleted, so the errors went with it) the id range
+        # alone would pick up errors of other uploads
+        if self.first_error_id is None or self.batch_id is None:
+            return CustomerError.objects.none()
+        return CustomerError.objects.filter(id__range=(self.first_error_id, self.last_error_id),
+                                            batch_id=self.batch_id)
+
 class CleanEntry(models.Model):
     id = models.AutoField(primary_key=True)
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='clean_entries'
+    )
     identifier = models.CharField(max_length=100)
-    customer_name = models.CharField(max_length=255)
     account_number = models.CharField(max_length=100)
     amount = models.DecimalField(max_digits=15, decimal_places=2)
     national_id = models.CharField(max_length=100)
-    customer_code = models.CharField(max_length=100)
     batch_identifier = models.CharField(max_length=100)
     status = models.CharField(max_length=20, default='ok')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -173,6 +274,40 @@ class CleanEntry(models.Model):
     class Meta:
         verbose_name_plural = "Clean Entries"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['batch_identifier'], name='cleanentry_batch_idx'),
+        ]
+
+class ParameterKey(models.Model):
+    """Dictionary of Exception parameter names (LineNumber, Field, Rule, ...)."""
+    id = models.AutoField(primary_key=True)
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+class ErrorParameter(models.Model):
+    """
+    One Exception parameter of a CustomerError, with its key stored once in
+    ParameterKey. Indexed by (key, value) for "all errors for field X".
+    The Message parameter is not stored: it is CustomerError.message.
+    """
+    id = models.BigAutoField(primary_key=True)
+    error = models.ForeignKey(
+        'CustomerError',
+        on_delete=models.CASCADE,
+        related_name='parameters'
+    )
+    key = models.ForeignKey(ParameterKey, on_delete=models.PROTECT, related_name='values')
+    value = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['key', 'value'], name='errorparameter_key_value_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key.name}={self.value}"
 
 class ErrorHistory(models.Model):
     id = models.BigAutoField(primary_key=True)
@@ -196,4 +331,102 @@ class ErrorHistory(models.Model):
         ordering = ['-changed_at']
 
     def __str__(self):
-        return f"Error {self.error.identifier} status change: {self.previous_status} -> {self.new_status}"
\ No newline at end of file
+        return f"Error {self.error.identifier} status change: {self.previous_status} -> {self.new_status}"
+
+class ValidationResult(models.Model):
+    """Memoised coop_validator outcome for one customer XML / BOT report pair."""
+    id = models.BigAutoField(primary_key=True)
+    customer_sha256 = models.CharField(max_length=64)
+    report_sha256 = models.CharField(max_length=64)
+    rules_version = models.CharField(max_length=20)
+    batch = models.ForeignKey(
+        BatchHistory,
+        on_delete=models.CASCADE,
+        related_name='validation_results'
+    )
+    corrections = models.JSONField(default=dict)
+    clean_xml_file = models.CharField(max_length=255, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(default=timezone.now)
+    hit_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-last_hit_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['customer_sha256', 'report_sha256', 'rules_version'],
+                name='unique_validation_result'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.batch.batch_identifier} ({self.customer_sha256[:8]}/{self.report_sha256[:8]})"
+
+
+class CommandFingerprint(models.Model):
+    """
+    One customer Command in a processed batch: its canonical content hash and
+    reconciliation outcome. Indexed by identifier and customer code for
+    cross-batch customer timelines.
+    """
+    OUTCOME_CHOICES = (
+        ('ok', 'OK'),
+        ('error', 'Error'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    batch = models.ForeignKey(
+        BatchHistory,
+        on_delete=models.CASCADE,
+        related_name='fingerprints'
+    )
+    # Header/Identifier of the customer file (e.g. TZ0230653), shared by
+    # every resubmission of the same batch
+    batch_identifier = models.CharField(max_length=100)
+    identifier = models.CharField(max_length=100)
+    customer_code = models.CharField(max_length=100, blank=True, default='')
+    content_hash = models.CharField(max_length=64)
+    # Hash of the command's BOT report result (see fingerprints.result_hash)
+    result_hash = models.CharField(max_length=64, blank=True, default='')
+    outcome = models.CharField(max_length=10, choices=OUTCOME_CHOICES, default='ok')
+    # Distinct error codes reported for the command, e.g. ["cvc-complex-type"]
+    error_codes = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['batch_identifier', 'batch'], name='fingerprint_batch_idx'),
+            models.Index(fields=['identifier', 'batch'], name='fingerprint_identifier_idx'),
+            models.Index(fields=['customer_code', 'batch'], name='fingerprint_customer_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.batch_identifier}/{self.identifier} {self.content_hash[:12]}"
+
+
+class ErrorArchive(models.Model):
+    """
+    The CustomerError rows (with their ErrorHistory) of a resolved batch,
+    moved out of the hot tables into one JSONL file, see core/archive.py.
+    """
+    id = models.BigAutoField(primary_key=True)
+    batch = models.OneToOneField(
+        BatchHistory,
+        on_delete=models.CASCADE,
+        related_name='error_archive'
+    )
+    archive_file = models.CharField(max_length=255)
+    # 'gzip' when the file was compressed before saving, None when the
+    # storage backend compresses it (content-addressed blobs)
+    compression = models.CharField(max_length=10, null=True, blank=True)
+    error_count = models.IntegerField(default=0)
+    # {status: count} of the archived errors
+    status_counts = models.JSONField(default=dict, blank=True)
+    size = models.BigIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-archived_at']
+
+    def __str__(self):
+        return f"Archive of {self.batch.batch_identifier} ({self.error_count} errors)"
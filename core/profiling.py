@@ -0,0 +1,222 @@
+# core/profiling.py
+"""
+Opt-in per-request profiling.
+
+ProfilingMiddleware records wall time, database queries, time spent in the
+'parse' and 'validation' phases and peak Python memory (tracemalloc) for a
+request when settings.REQUEST_PROFILING is on, or when a staff user (or
+anyone while DEBUG is on) sends the X-Profile header. Code marks its phases
+with `with phase('parse'): ...`, which costs nothing when the request is not
+being profiled. tracemalloc is process-wide, so memory is only recorded for
+one profiled request at a time; requests overlapping it report no peak.
+
+Slow requests are logged with their most expensive and most repeated
+queries, and totals per view are kept in memory for the /profiling/ page.
+"""
+import contextlib
+import logging
+import re
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_profile', default=None)
+
+# Literals stripped from SQL so the same query with different parameters groups together
+SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+TOP_QUERIES = 5
+
+# tracemalloc is process-wide: its peak is reset and read by one profiled
+# request at a time. Requests that overlap it are profiled without memory.
+_memory_lock = threading.Lock()
+
+
+class RequestProfile:
+    """Measurements for one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.wall = 0.0
+        self.phases = defaultdict(float)
+        self.queries = []  # (sql, seconds)
+        self.peak_memory = None
+
+    @property
+    def query_count(self):
+        return len(self.queries)
+
+    @property
+    def query_seconds(self):
+        return sum(seconds for _sql, seconds in self.queries)
+
+    def __call__(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    def slowest_queries(self, limit=TOP_QUERIES):
+        return sorted(self.queries, key=lambda q: q[1], reverse=True)[:limit]
+
+    def repeated_queries(self, limit=TOP_QUERIES):
+        """Query shapes run more than once, most frequent first (N+1 suspects)."""
+        shapes = Counter(SQL_LITERALS.sub('?', sql) for sql, _seconds in self.queries)
+        return [(sql, count) for sql, count in shapes.most_common(limit) if count > 1]
+
+    def server_timing(self):
+        """Value for the Server-Timing response header, in milliseconds."""
+        entries = [f'total;dur={self.wall * 1000:.1f}', f'db;dur={self.query_seconds * 1000:.1f}']
+        entries += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.phases.items()]
+        return ', '.join(entries)
+
+
+class ProfileStats:
+    """Thread-safe running totals per view."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+    def add(self, view_name, profile):
+        with self._lock:
+            stats = self._views.setdefault(view_name, {
+                'requests': 0,
+                'wall_seconds': 0.0,
+                'max_wall_seconds': 0.0,
+                'queries': 0,
+                'max_queries': 0,
+                'query_seconds': 0.0,
+                'phases': defaultdict(float),
+                'max_peak_memory': 0,
+            })
+            stats['requests'] += 1
+            stats['wall_seconds'] += profile.wall
+            stats['max_wall_seconds'] = max(stats['max_wall_seconds'], profile.wall)
+            stats['queries'] += profile.query_count
+            stats['max_queries'] = max(stats['max_queries'], profile.query_count)
+            stats['query_seconds'] += profile.query_seconds
+            for name, seconds in profile.phases.items():
+                stats['phases'][name] += seconds
+            if profile.peak_memory:
+                stats['max_peak_memory'] = max(stats['max_peak_memory'], profile.peak_memory)
+
+    def snapshot(self):
+        """Totals per view with averages, most expensive view first."""
+        with self._lock:
+            views = []
+            for view_name, stats in self._views.items():
+                requests = stats['requests']
+                views.append({
+                    'view': view_name,
+                    **stats,
+                    'phases': dict(stats['phases']),
+                    'avg_wall_seconds': stats['wall_seconds'] / requests,
+                    'avg_queries': stats['queries'] / requests,
+                })
+        return sorted(views, key=lambda v: v['wall_seconds'], reverse=True)
+
+
+stats = ProfileStats()
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Add the time spent in the block to the current request's profile, if any."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.phases[name] += time.perf_counter() - start
+
+
+def current_profile():
+    return _current.get()
+
+
+class ProfilingMiddleware:
+    """
+    Profile requests when settings.REQUEST_PROFILING is True, or on demand
+    with the X-Profile header (staff users, or anyone while DEBUG is on).
+    Place after AuthenticationMiddleware.
+    """
+    header = 'HTTP_X_PROFILE'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def enabled_for(self, request):
+        if getattr(settings, 'REQUEST_PROFILING', False):
+            return True
+        if request.META.get(self.header, '').lower() not in ('1', 'true', 'on'):
+            return False
+        user = getattr(request, 'user', None)
+        return settings.DEBUG or bool(user and user.is_staff)
+
+    def __call__(self, request):
+        if not self.enabled_for(request):
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        track_memory = (getattr(settings, 'REQUEST_PROFILING_MEMORY', True)
+                        and _memory_lock.acquire(blocking=False))
+        started_tracing = False
+        if track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+        try:
+            with connection.execute_wrapper(profile):
+                response = self.get_response(request)
+        finally:
+            profile.wall = time.perf_counter() - profile.started
+            if track_memory:
+                profile.peak_memory = tracemalloc.get_traced_memory()[1]
+                if started_tracing:
+                    tracemalloc.stop()
+                _memory_lock.release()
+            _current.reset(token)
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else request.path
+        stats.add(view_name, profile)
+        response['Server-Timing'] = profile.server_timing()
+        self.log(request, view_name, profile)
+        return response
+
+    def log(self, request, view_name, profile):
+        slow_ms = getattr(settings, 'SLOW_REQUEST_MS', 1000)
+        wall_ms = profile.wall * 1000
+        summary = (f"{request.method} {request.path} ({view_name}): {wall_ms:.0f} ms, "
+                   f"{profile.query_count} queries in {profile.query_seconds * 1000:.0f} ms"
+                   + ''.join(f", {name} {seconds * 1000:.0f} ms" for name, seconds in profile.phases.items())
+                   + (f", peak {profile.peak_memory / 1024 / 1024:.1f} MB" if profile.peak_memory else ''))
+        if slow_ms is None or wall_ms < slow_ms:
+            logger.debug(summary)
+            return
+
+        lines = [f"Slow request {summary}"]
+        for sql, seconds in profile.slowest_queries():
+            lines.append(f"  {seconds * 1000:8.1f} ms  {sql[:300]}")
+        for sql, count in profile.repeated_queries():
+            lines.append(f"  {count:6d} x     {sql[:300]}")
+        logger.warning('\n'.join(lines))
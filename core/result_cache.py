@@ -0,0 +1,114 @@
+# core/result_cache.py
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from .bot_validator import BOTValidator
+from .models import ValidationResult
+from .storage import content_digest
+
+logger = logging.getLogger(__name__)
+
+
+class ValidationResultCache:
+    """
+    Memoises coop_validator results by (customer SHA-256, report SHA-256,
+    BOTValidator.RULES_VERSION).
+
+    A hit returns the stored corrections and clean XML of the batch that was
+    first validated, so re-uploading the same pair skips parsing and does not
+    create duplicate CustomerError/CleanEntry rows.
+
+    Settings:
+        VALIDATION_CACHE_TTL          seconds an entry stays valid (None = forever)
+        VALIDATION_CACHE_MAX_ENTRIES  entries kept before eviction (None = unbounded)
+        VALIDATION_CACHE_EVICTION     'lru' (least recently hit) or 'fifo' (oldest)
+    """
+
+    def __init__(self, ttl=None, max_entries=None, eviction=None):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'VALIDATION_CACHE_TTL', 7 * 24 * 3600)
+        self.max_entries = (max_entries if max_entries is not None
+                            else getattr(settings, 'VALIDATION_CACHE_MAX_ENTRIES', 500))
+        self.eviction = eviction or getattr(settings, 'VALIDATION_CACHE_EVICTION', 'lru')
+        if self.eviction not in ('lru', 'fifo'):
+            raise ValueError(f"Unknown validation cache eviction policy: {self.eviction}")
+        self.rules_version = BOTValidator.RULES_VERSION
+
+    @staticmethod
+    def key_for(customer_file, report_file):
+        """Content hashes for an uploaded pair (files are left rewound)."""
+        return content_digest(customer_file), content_digest(report_file)
+
+    def _expired_before(self):
+        if not self.ttl:
+            return None
+        return timezone.now() - timedelta(seconds=self.ttl)
+
+    def get(self, customer_sha256, report_sha256):
+        """Return the cached ValidationResult for a pair, or None."""
+        result = (ValidationResult.objects
+                  .select_related('batch')
+                  .filter(customer_sha256=customer_sha256,
+                          report_sha256=report_sha256,
+                          rules_version=self.rules_version)
+                  .first())
+        if result is None:
+            return None
+
+        expired_before = self._expired_before()
+        if expired_before and result.created_at < expired_before:
+            logger.debug(f"Validation cache entry {result.id} expired")
+            result.delete()
+            return None
+
+        ValidationResult.objects.filter(pk=result.pk).update(
+            hit_count=F('hit_count') + 1,
+            last_hit_at=timezone.now()
+        )
+        logger.debug(f"Validation cache hit for batch {result.batch.batch_identifier}")
+        return result
+
+    def put(self, customer_sha256, report_sha256, batch, corrections, clean_xml_file=None):
+        """Store a result; corrections carrying an error are never cached."""
+        if not corrections or corrections.get('error'):
+            return None
+        try:
+            result, _ = ValidationResult.objects.update_or_create(
+                customer_sha256=customer_sha256,
+                report_sha256=report_sha256,
+                rules_version=self.rules_version,
+                defaults={
+                    'batch': batch,
+                    'corrections': corrections,
+                    'clean_xml_file': clean_xml_file,
+                    'last_hit_at': timezone.now(),
+                }
+            )
+        except IntegrityError:
+            # A concurrent request stored the same pair first
+            return None
+        self.evict()
+        return result
+
+    def evict(self):
+        """Drop expired entries, then the surplus according to the eviction policy."""
+        removed = 0
+        expired_before = self._expired_before()
+        if expired_before:
+            removed += ValidationResult.objects.filter(created_at__lt=expired_before).delete()[0]
+
+        if self.max_entries:
+            order = '-last_hit_at' if self.eviction == 'lru' else '-created_at'
+            surplus = (ValidationResult.objects.order_by(order)
+                       .values_list('pk', flat=True)[self.max_entries:])
+            surplus_ids = list(surplus)
+            if surplus_ids:
+                removed += ValidationResult.objects.filter(pk__in=surplus_ids).delete()[0]
+
+        if removed:
+            logger.debug(f"Evicted {removed} validation cache entries")
+        return removed
@@ -0,0 +1,256 @@
+# core/storage.py
+import gzip
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+try:
+    import zstandard
+except ImportError:  # optional, gzip is used when it is not installed
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# All content-addressed files live under this prefix, e.g. blobs/3f/3fa9...e1
+BLOB_PREFIX = 'blobs'
+
+# Blob name suffix per compression codec
+COMPRESSION_SUFFIXES = {
+    None: '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+
+def compress_bytes(data, compression):
+    """Compress data in memory with the given codec (None returns it unchanged)."""
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return data
+
+
+def open_compressed(path, compression):
+    """Open a file on disk as a binary stream that decompresses on read."""
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def content_digest(content, chunk_size=64 * 1024):
+    """SHA-256 hex digest of bytes or a File, leaving the file rewound."""
+    if isinstance(content, bytes):
+        return hashlib.sha256(content).hexdigest()
+    sha = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(chunk_size):
+        sha.update(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return sha.hexdigest()
+
+
+def stream_file(f, chunk_size=64 * 1024):
+    """Yield a storage File in chunks and close it afterwards (for streaming responses)."""
+    with f:
+        yield from f.chunks(chunk_size)
+
+
+def compression_for_name(name):
+    """Codec a stored name was written with, from its suffix."""
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if suffix and str(name).endswith(suffix):
+            return compression
+    return None
+
+
+def blob_references():
+    """
+    (model, field names) of every column holding a storage name. A blob no
+    such column points at is garbage: add new stored files here.
+    """
+    from .models import BatchHistory, ErrorArchive, ValidationResult
+
+    return [
+        (BatchHistory, ('xml_file', 'report_file', 'clean_xml_file')),
+        (ValidationResult, ('clean_xml_file',)),
+        (ErrorArchive, ('archive_file',)),
+    ]
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage that names every file after the SHA-256 of its content.
+
+    Saving content that is already stored returns the existing name without
+    writing anything, so identical re-uploads share a single blob on disk.
+    The requested name is ignored; keep the original filename on the model.
+    Files saved before this storage was introduced (xml_uploads/, bot_reports/,
+    clean_xml/) live under the same location and stay readable.
+
+    Blobs are written compressed (settings.BLOB_COMPRESSION: 'gzip' by
+    default, 'zstd' if the zstandard package is installed, or None for raw
+    files) and open() returns a stream that decompresses on read, so callers
+    always see the original bytes. The hash is taken over the uncompressed
+    content, so switching codecs never stores the same document twice.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, *args, compression='default', **kwargs):
+        super().__init__(*args, **kwargs)
+        if compression == 'default':
+            compression = getattr(settings, 'BLOB_COMPRESSION', 'gzip')
+        if compression == 'zstd' and zstandard is None:
+            logger.warning("zstandard is not installed, falling back to gzip blobs")
+            compression = 'gzip'
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unknown blob compression: {compression}")
+        self.compression = compression
+
+    @staticmethod
+    def is_blob(name):
+        """True if name points into the content-addressed area."""
+        return bool(name) and str(name).startswith(BLOB_PREFIX + '/')
+
+    def blob_name(self, digest, compression=None):
+        """Storage name for a SHA-256 hex digest."""
+        return f'{BLOB_PREFIX}/{digest[:2]}/{digest}{COMPRESSION_SUFFIXES[compression]}'
+
+    def find_blob(self, digest):
+        """Existing name for a digest under any codec, or None."""
+        preferred = [self.compression] + [c for c in COMPRESSION_SUFFIXES if c != self.compression]
+        for compression in preferred:
+            name = self.blob_name(digest, compression)
+            if self.exists(name):
+                return name
+        return None
+
+    def digest(self, content):
+        """SHA-256 hex digest of a File/bytes, leaving the file rewound."""
+        return content_digest(content, self.chunk_size)
+
+    def save(self, name, content, max_length=None):
+        if content is None:
+            raise ValueError('Cannot save None to content-addressed storage')
+        if isinstance(content, bytes):
+            digest = self.digest(content)
+        else:
+            if not hasattr(content, 'chunks'):
+                content = File(content, name)
+            digest = self.digest(content)
+
+        existing = self.find_blob(digest)
+        if existing:
+            logger.debug(f"Blob {digest} already stored, skipping write for {name}")
+            return existing
+
+        blob_name = self.blob_name(digest, self.compression)
+
+        self._write_blob(blob_name, content)
+        logger.debug(f"Stored {name} as blob {digest}")
+        return blob_name
+
+    def _iter_chunks(self, content):
+        if isinstance(content, bytes):
+            yield content
+            return
+        for chunk in content.chunks(self.chunk_size):
+            yield chunk if isinstance(chunk, bytes) else chunk.encode('utf-8')
+
+    def _write_blob(self, blob_name, content):
+        """Write to a temporary file and rename, so readers never see partial blobs."""
+        full_path = self.path(blob_name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if self.compression == 'gzip':
+                    writer = gzip.GzipFile(fileobj=tmp, mode='wb', compresslevel=6, mtime=0)
+                elif self.compression == 'zstd':
+                    writer = zstandard.ZstdCompressor(level=3).stream_writer(tmp, closefd=False)
+                else:
+                    writer = None
+                for chunk in self._iter_chunks(content):
+                    (writer or tmp).write(chunk)
+                if writer is not None:
+                    writer.close()
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            # Identical content under an identical name, so a concurrent
+            # writer winning the race is harmless.
+            os.replace(tmp_path, full_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _open(self, name, mode='rb'):
+        compression = compression_for_name(name)
+        if compression is None:
+            return super()._open(name, mode)
+        stream = open_compressed(self.path(name), compression)
+        if 'b' not in mode:
+            stream = io.TextIOWrapper(stream, encoding='utf-8')
+        return File(stream, name)
+
+    def iter_blobs(self):
+        """Yield (name, size, mtime) for every blob currently on disk."""
+        root = self.path(BLOB_PREFIX)
+        if not os.path.isdir(root):
+            return
+        for dirpath, _dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.startswith('.tmp-'):
+                    continue
+                full_path = os.path.join(dirpath, filename)
+                stat = os.stat(full_path)
+                name = os.path.relpath(full_path, self.location).replace('\\', '/')
+                yield name, stat.st_size, stat.st_mtime
+
+    def reference_counts(self):
+        """Count how many stored-file fields (see blob_references()) point at each blob."""
+        counts = Counter()
+        for model, fields in blob_references():
+            for row in model.objects.values_list(*fields).iterator():
+                for name in row:
+                    if self.is_blob(name):
+                        counts[name] += 1
+        return counts
+
+    def collect_garbage(self, min_age=3600, dry_run=False):
+        """
+        Delete blobs no row references.
+
+        Blobs younger than min_age seconds are kept, because an upload saves its
+        files before the BatchHistory row that references them is created.
+        Returns (removed_names, freed_bytes).
+        """
+        references = self.reference_counts()
+        cutoff = time.time() - min_age
+        removed = []
+        freed = 0
+        for name, size, mtime in self.iter_blobs():
+            if references.get(name) or mtime > cutoff:
+                continue
+            if not dry_run:
+                self.delete(name)
+            removed.append(name)
+            freed += size
+        return removed, freed
@@ -0,0 +1,260 @@
+# core/synthetic.py
+"""
+Synthetic customer batches and matching BOT reports, for benchmarking.
+
+The customer XML follows the StorInstalment layout of real uploads
+(customer_xml/) and the report follows the BatchResponse layout BOT returns
+(bot_reports/), so every parser in the app accepts them. Commands also
+carry the coded CompanyData/EconomicSector that validate_xml_file() checks,
+so they pass it. See `manage.py benchmark`.
+"""
+import random
+from xml.sax.saxutils import escape
+
+from .bot_validator import BATCH_NAMESPACE
+
+# (ErrorCode, FullErrorCode) pairs seen in real BOT reports
+REPORT_ERRORS = [
+    ('cvc-complex-type',
+     "cvc-complex-type.2.4.b: The content of element 'CompanyData' is not complete. "
+     "One of '{\"" + BATCH_NAMESPACE + "\":EstablishmentDate, \"" + BATCH_NAMESPACE +
+     "\":TaxIdentificationNumber}' is expected."),
+    ('cvc-datatype-valid',
+     "cvc-datatype-valid.1.2.1: '' is not a valid value for 'dateTime'."),
+    ('cvc-enumeration-valid',
+     "cvc-enumeration-valid: Value 'EconomicSector.Unknown' is not facet-valid with respect "
+     "to enumeration. It must be a value from the enumeration."),
+    ('cvc-pattern-valid',
+     "cvc-pattern-valid: Value '07106' is not facet-valid with respect to pattern "
+     "'\\+[0-9]{12}' for type 'PhoneNumber'."),
+]
+
+REGIONS = [
+    ('Region.Arusha', 'District.Moshi'),
+    ('Region.DarEsSalaam', 'District.Ilala'),
+    ('Region.Mwanza', 'District.Ilemela'),
+    ('Region.Dodoma', 'District.Kondoa'),
+]
+# (lookup, code): the codes are the economic_sectors validation_config knows
+SECTORS = [
+    ('EconomicSector.OtherServices', 'S'),
+    ('EconomicSector.Agriculture', 'A'),
+    ('EconomicSector.Manufacturing', 'M'),
+]
+TRADE_NAME_WORDS = ['AMCOS', 'COOPERATIVE', 'SACCOS', 'TRADERS', 'FARMERS', 'UNION', 'GROUP', 'LIMITED']
+PLACE_NAMES = ['NAMUNDA', 'KILIMO', 'MBEYA', 'TANGA', 'RUVUMA', 'KAGERA', 'SINGIDA', 'MTWARA']
+
+ENCODINGS = {
+    'utf-8': 'utf-8',
+    'utf-16': 'UTF-16',
+}
+
+
+def command_identifier(number):
+    """Zero-padded Command identifier, e.g. 0000000013."""
+    return f'{number:010d}'
+
+
+def synthetic_customer(rng, number):
+    """Field values for one synthetic customer."""
+    region, district = rng.choice(REGIONS)
+    sector, sector_code = rng.choice(SECTORS)
+    total = rng.randint(1_000_000, 90_000_000)
+    return {
+        'identifier': command_identifier(number),
+        'trade_name': f'{rng.choice(PLACE_NAMES)} {rng.choice(TRADE_NAME_WORDS)} {number}',
+        'registration_number': str(20_000_000 + number),
+        'customer_code': f'{number:07d}',
+        'phone': f'+2557{rng.randint(10_000_000, 99_999_999)}',
+        'region': region,
+        'district': district,
+        'sector': sector,
+        'sector_code': sector_code,
+        'instalments': rng.randint(1, 60),
+        'total': total,
+        'outstanding': round(total * rng.random(), 4),
+    }
+
+
+def customer_command(customer):
+    """One customer Command element as XML text."""
+    c = {key: escape(str(value)) for key, value in customer.items()}
+    return f"""		<Command identifier="{c['identifier']}">
+			<Cis.CB4.Projects.TZ.BOT.Body.Products.StorInstalment>
+				<Instalment>
+					<InstalmentCount>{c['instalments']}</InstalmentCount>
+					<InstalmentType>InstalmentType.Fixed</InstalmentType>
+					<OutstandingAmount>{c['outstanding']}</OutstandingAmount>
+					<OutstandingInstalmentCount>0</OutstandingInstalmentCount>
+					<OverdueInstalmentCount>0</OverdueInstalmentCount>
+					<PeriodicityOfPayments>PeriodicityOfPayments.MonthlyInstalments</PeriodicityOfPayments>
+					<StandardInstalmentAmount>0</StandardInstalmentAmount>
+					<TypeOfInstalmentLoan>TypeOfInstalmentLoan.BusinessLoan</TypeOfInstalmentLoan>
+					<ConnectedSubject key="1">
+						<RoleOfClient>RoleOfClient.MainDebtor</RoleOfClient>
+						<SubjectChoice>
+							<Company>
+								<AddressesCompany>
+									<Registration>
+										<Country>CountryCode.TZ</Country>
+										<District>{c['district']}</District>
+										<Region>{c['region']}</Region>
+									</Registration>
+								</AddressesCompany>
+								<CompanyData>
+									<EconomicSector code="{c['sector_code']}">{c['sector']}</EconomicSector>
+									<EstablishmentDate>2023-06-17T14:30:00</EstablishmentDate>
+									<LegalForm>LegalForm.GovernmentalInstitution</LegalForm>
+									<RegistrationNumber>{c['registration_number']}</RegistrationNumber>
+									<TradeName>{c['trade_name']}</TradeName>
+								</CompanyData>
+								<ContactsCompany>
+									<CellularPhone>{c['phone']}</CellularPhone>
+								</ContactsCompany>
+								<CustomerCode>{c['customer_code']}</CustomerCode>
+							</Company>
+						</SubjectChoice>
+					</ConnectedSubject>
+					<ContractDates>
+						<ExpectedEnd>2029-03-20T00:00:00Z</ExpectedEnd>
+						<LastPayment>2025-03-22T00:00:00Z</LastPayment>
+						<RealEnd>2029-03-20T00:00:00Z</RealEnd>
+						<Start>2024-03-21T00:00:00Z</Start>
+					</ContractDates>
+					<CurrencyOfLoan>Currency.TZS</CurrencyOfLoan>
+					<EconomicSector>{c['sector']}</EconomicSector>
+					<NegativeStatusOfLoan>NegativeStatusOfLoan.NoNegativeStatus</NegativeStatusOfLoan>
+					<PastDueAmount>0.0000</PastDueAmount>
+					<PastDueDays>0</PastDueDays>
+					<PhaseOfLoan>PhaseOfLoan.Existing</PhaseOfLoan>
+					<RescheduledLoan>Bool.False</RescheduledLoan>
+					<TotalLoanAmount>{c['total']}.0000</TotalLoanAmount>
+				</Instalment>
+				<StorHeader>
+					<Source>CBT</Source>
+					<StoreTo>2025-04-12T00:00:00Z</StoreTo>
+					<Identifier>{c['identifier']}</Identifier>
+				</StorHeader>
+			</Cis.CB4.Projects.TZ.BOT.Body.Products.StorInstalment>
+		</Command>
+"""
+
+
+def report_ok(identifier):
+    """Report Command for an accepted customer."""
+    return f"""        <Command identifier="{identifier}">
+            <Cis.CB4.Projects.TZ.BOT.Body.Products.StorInstalment.Response>
+                <Lookups.ResultCode>ResultCode.OK</Lookups.ResultCode>
+            </Cis.CB4.Projects.TZ.BOT.Body.Products.StorInstalment.Response>
+        </Command>
+"""
+
+
+def report_exception(identifier, error_code, full_error_code, line_number):
+    """Report Command for a rejected customer."""
+    message = escape(full_error_code)
+    return f"""        <Command identifier="{identifier}">
+            <Exception>
+                <ErrorCode>{error_code}</ErrorCode>
+                <FullErrorCode>{message}</FullErrorCode>
+                <LogGuid/>
+                <Parameters>
+                    <parameter>
+                        <Key>Message</Key>
+                        <Value>{message}</Value>
+                    </parameter>
+                    <parameter>
+                        <Key>NodeType</Key>
+                    </parameter>
+                    <parameter>
+                        <Key>LocalName</Key>
+                    </parameter>
+                    <parameter>
+                        <Key>LineNumber</Key>
+                        <Value>{line_number}</Value>
+                    </parameter>
+                    <parameter>
+                        <Key>LinePosition</Key>
+                        <Value>47</Value>
+                    </parameter>
+                </Parameters>
+            </Exception>
+        </Command>
+"""
+
+
+def generate_batch(size, error_rate=0.1, missing_rate=0.0, encoding='utf-8',
+                   batch_identifier='TZ0000001', seed=None):
+    """
+    Build a customer batch of `size` commands and the BOT report for it.
+
+    error_rate: fraction of commands the report rejects with an Exception
+    missing_rate: fraction of commands left out of the report entirely
+    encoding: 'utf-8' or 'utf-16' for the report (BOT sends UTF-16); the
+        customer file is always UTF-8, as uploads are
+    seed: makes the output reproducible
+
+    Returns (customer_bytes, report_bytes, expected) where expected counts
+    the 'ok', 'error' and 'missing' commands.
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unsupported encoding: {encoding}")
+    rng = random.Random(seed)
+    expected = {'ok': 0, 'error': 0, 'missing': 0}
+
+    customer_parts = [
+        '<?xml version="1.0" encoding="utf-8" ?>\n',
+        f'<Batch xmlns="{BATCH_NAMESPACE}">\n',
+        '\t<Header>\n',
+        f'\t\t<Identifier>{escape(batch_identifier)}</Identifier>\n',
+        '\t\t<Subscriber>CBT</Subscriber>\n',
+        '\t\t<SubscriberUnit>Primary</SubscriberUnit>\n',
+        '\t</Header>\n',
+        '\t<Commands>\n',
+    ]
+    report_commands = []
+    line_number = 10
+    for number in range(1, size + 1):
+        customer = synthetic_customer(rng, number)
+        customer_parts.append(customer_command(customer))
+
+        roll = rng.random()
+        if roll < missing_rate:
+            expected['missing'] += 1
+        elif roll < missing_rate + error_rate:
+            error_code, full_error_code = rng.choice(REPORT_ERRORS)
+            report_commands.append(report_exception(customer['identifier'], error_code,
+                                                    full_error_code, line_number))
+            expected['error'] += 1
+        else:
+            report_commands.append(report_ok(customer['identifier']))
+            expected['ok'] += 1
+        line_number += 60
+    customer_parts.append('\t</Commands>\n</Batch>\n')
+
+    completed = size - expected['missing']
+    report_parts = [
+        f'<?xml version="1.0" encoding="{ENCODINGS[encoding]}"?>\n',
+        '<BatchResponse>\n',
+        '    <Header>\n',
+        f'        <BatchId>{rng.randint(100, 9999)}</BatchId>\n',
+        '        <State>Finished</State>\n',
+        '        <BeginTimeStamp>2025-04-15T15:10:14.0000000Z</BeginTimeStamp>\n',
+        '        <TimeStamp>2025-04-15T15:10:14.3880000Z</TimeStamp>\n',
+        '        <FinishTimeStamp>2025-04-15T15:10:14.0000000Z</FinishTimeStamp>\n',
+        '        <Duration>0</Duration>\n',
+        f'        <Identifier>{escape(batch_identifier)}</Identifier>\n',
+        '        <Subscriber>CBT</Subscriber>\n',
+        '        <SubscriberUnit>Primary</SubscriberUnit>\n',
+        f'        <CommandsUploaded>{completed}</CommandsUploaded>\n',
+        f'        <CommandsCompleted>{completed}</CommandsCompleted>\n',
+        '    </Header>\n',
+        '    <Commands>\n',
+        *report_commands,
+        '    </Commands>\n',
+        '</BatchResponse>\n',
+    ]
+
+    customer_bytes = ''.join(customer_parts).encode('utf-8')
+    report_bytes = ''.join(report_parts).encode(encoding)
+    return customer_bytes, report_bytes, expected
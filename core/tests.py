@@ -1,3 +1,1156 @@
-from django.test import TestCase
+import codecs
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import Future
+from datetime import timedelta
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import dashboard_cache
+from .archive import archivable_batches, archive_batch, archived_errors, iter_archive, restore_batch
+from .batch_deletion import delete_in_chunks, purge_batch
+from .batch_processing import discover, pair_files
+from .bot_validator import BATCH_NAMESPACE, BOTValidator
+from .db_backend import distinct_errors, upsert_submitted_customers
+from .error_codes import link_codes
+from .error_parameters import save_parameters
+from .error_status import filter_errors, transition_errors
+from .external_reconcile import reconcile_files
+from .fingerprints import customer_timeline
+from .header_probe import CUSTOMER, NOT_FOUND, REPORT, HeaderInfo, probe_header
+from .ingest import IngestService
+from .models import (
+    BatchHistory, CleanEntry, CommandFingerprint, Customer, CustomerError, ErrorArchive, ErrorCode,
+    ErrorHistory, RecentUpload, SubmittedCustomerData, ValidationResult,
+)
+from .profiling import ProfilingMiddleware, _memory_lock, current_profile
+from .result_cache import ValidationResultCache
+from .storage import ContentAddressedStorage, zstandard
+from .synthetic import generate_batch, report_ok
+from .validation_config import validate_xml_file
+
+
+def make_errors(batch, count, status='pending', error_code='E001'):
+    return CustomerError.objects.bulk_create([
+        CustomerError(
+            batch=batch,
+            identifier=f'{i:010d}',
+            account_number=f'ACC{i}',
+            error_code=error_code,
+            message=f'Error {i}',
+            status=status,
+            uploaded_by=batch.uploaded_by,
+        )
+        for i in range(count)
+    ])
+
+
+def all_ok_report(customer_content, batch_identifier='TZ0000001'):
+    """BOT report accepting every command of a customer file."""
+    identifiers = re.findall(rb'<Command identifier="([^"]+)"', customer_content)
+    commands = ''.join(report_ok(identifier.decode()) for identifier in identifiers)
+    return (f'<BatchResponse><Header><Identifier>{batch_identifier}</Identifier></Header>'
+            f'<Commands>{commands}</Commands></BatchResponse>').encode('utf-8')
+
+
+# The dashboard cache is exercised on its own; elsewhere it is switched off
+# so tests never share cached blocks through the file-based cache
+@override_settings(DASHBOARD_CACHE=None)
+class CoreTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def make_batch(self, identifier='TZ0000001', **kwargs):
+        kwargs.setdefault('uploaded_by', self.user)
+        kwargs.setdefault('filename', f'{identifier}.xml')
+        return BatchHistory.objects.create(batch_identifier=identifier, **kwargs)
+
+
+class StorageTestCase(CoreTestCase):
+    """Runs against a content-addressed storage in a temporary directory."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        storages = override_settings(STORAGES={
+            'default': {
+                'BACKEND': 'core.storage.ContentAddressedStorage',
+                'OPTIONS': {'location': self.media_root},
+            },
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        })
+        storages.enable()
+        self.addCleanup(storages.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+
+class ContentAddressedStorageTests(StorageTestCase):
+
+    def test_round_trip_and_deduplication(self):
+        content = b'<Batch>' + b'x' * 10000 + b'</Batch>'
+        name = default_storage.save('xml_uploads/first.xml', ContentFile(content))
+        self.assertTrue(name.startswith('blobs/'))
+        self.assertIn(hashlib.sha256(content).hexdigest(), name)
+        with default_storage.open(name) as f:
+            self.assertEqual(f.read(), content)
+
+        # Same content under another name is the same blob, written once
+        self.assertEqual(default_storage.save('bot_reports/second.xml', ContentFile(content)), name)
+        self.assertEqual(len(list(default_storage.iter_blobs())), 1)
+
+    def test_legacy_files_stay_readable(self):
+        os.makedirs(os.path.join(self.media_root, 'xml_uploads'))
+        with open(os.path.join(self.media_root, 'xml_uploads', 'old.xml'), 'wb') as f:
+            f.write(b'<Old/>')
+        with default_storage.open('xml_uploads/old.xml') as f:
+            self.assertEqual(f.read(), b'<Old/>')
+
+
+class BlobCompressionTests(StorageTestCase):
+
+    content = b'<Batch>' + b'<Command/>' * 1000 + b'</Batch>'
+
+    def storage(self, compression):
+        return ContentAddressedStorage(location=self.media_root, compression=compression)
+
+    def test_blobs_are_compressed_and_read_back_plain(self):
+        storage = self.storage('gzip')
+        name = storage.save('xml_uploads/batch.xml', ContentFile(self.content))
+        self.assertTrue(name.endswith('.gz'))
+        self.assertLess(os.path.getsize(storage.path(name)), len(self.content))
+        with storage.open(name) as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_switching_codec_reuses_the_stored_blob(self):
+        name = self.storage(None).save('xml_uploads/batch.xml', ContentFile(self.content))
+        self.assertFalse(name.endswith('.gz'))
+        self.assertEqual(self.storage('gzip').save('xml_uploads/again.xml', ContentFile(self.content)), name)
+
+    @skipUnless(zstandard is None, 'zstandard is installed')
+    def test_zstd_falls_back_to_gzip(self):
+        self.assertEqual(self.storage('zstd').compression, 'gzip')
+
+    def test_unknown_codec_is_refused(self):
+        with self.assertRaises(ValueError):
+            self.storage('lz4')
+
+
+class ErrorArchiveTests(StorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.batch = self.make_batch(status='resolved', resolved_date=timezone.now() - timedelta(days=100))
+        make_errors(self.batch, 5, error_code='cvc-pattern-valid')
+        transition_errors(CustomerError.objects.filter(batch=self.batch), 'resolved', user=self.user, notes='done')
+        first = CustomerError.objects.filter(batch=self.batch).order_by('id').first()
+        save_parameters([(first, {'LineNumber': '12', 'Message': 'bad phone'})])
+        self.originals = list(CustomerError.objects.filter(batch=self.batch).order_by('id')
+                              .values_list('id', 'identifier', 'status', 'created_at'))
+
+    def test_only_old_fully_resolved_batches_are_archivable(self):
+        pending = self.make_batch('pending', status='resolved', resolved_date=self.batch.resolved_date)
+        make_errors(pending, 1)
+        recent = self.make_batch('recent', status='resolved', resolved_date=timezone.now())
+        make_errors(recent, 1, status='resolved')
+        self.assertEqual(list(archivable_batches(90)), [self.batch])
+
+    def test_archive_then_read_through(self):
+        archive = archive_batch(self.batch)
+        self.assertEqual((archive.error_count, archive.status_counts), (5, {'resolved': 5}))
+        self.assertFalse(CustomerError.objects.filter(batch=self.batch).exists())
+        self.assertFalse(ErrorHistory.objects.exists())
+
+        errors = archived_errors(archive)
+        self.assertEqual([e.id for e in errors], [row[0] for row in self.originals])
+        self.assertEqual(errors[0].archived_history[0].new_status, 'resolved')
+        self.assertEqual(errors[0].get_parameters()['LineNumber'], '12')
+        self.assertEqual(len(archived_errors(archive, identifier='0000000003')), 1)
+        self.assertEqual([e.id for e in archived_errors(archive, offset=1, limit=2)],
+                         [row[0] for row in self.originals[1:3]])
+
+    def test_restore_puts_errors_back(self):
+        archive = archive_batch(self.batch)
+        name = archive.archive_file
+
+        self.assertEqual(restore_batch(archive), 5)
+
+        restored = CustomerError.objects.filter(batch=self.batch).order_by('id')
+        self.assertEqual(list(restored.values_list('id', 'identifier', 'status', 'created_at')), self.originals)
+        self.assertEqual(ErrorHistory.objects.filter(error__batch=self.batch, notes='done').count(), 5)
+        self.assertEqual(restored.first().get_parameters()['LineNumber'], '12')
+        # Errors saved before the catalogue and customers existed come back linked
+        self.assertFalse(restored.filter(code__isnull=True).exists())
+        self.assertFalse(restored.filter(customer__isnull=True).exists())
+        self.assertFalse(ErrorArchive.objects.exists())
+        self.assertFalse(default_storage.exists(name))
+
+
+class BlobGarbageCollectionTests(StorageTestCase):
+
+    def test_archived_errors_survive_gc(self):
+        batch = self.make_batch(status='resolved')
+        make_errors(batch, 5, status='resolved')
+        archive = archive_batch(batch)
+        self.assertFalse(CustomerError.objects.filter(batch=batch).exists())
+
+        removed, _freed = default_storage.collect_garbage(min_age=0)
+
+        self.assertNotIn(archive.archive_file, removed)
+        archive = ErrorArchive.objects.get(pk=archive.pk)
+        self.assertEqual(len(archived_errors(archive)), 5)
+
+    def test_referenced_blobs_are_kept_and_orphans_removed(self):
+        batch = self.make_batch()
+        batch.xml_file = default_storage.save('xml_uploads/batch.xml', ContentFile(b'<Batch/>'))
+        batch.save()
+        clean_xml = default_storage.save('clean_xml/clean.xml', ContentFile(b'<Clean/>'))
+        ValidationResult.objects.create(customer_sha256='c', report_sha256='r', rules_version='1',
+                                        batch=batch, clean_xml_file=clean_xml)
+        orphan = default_storage.save('xml_uploads/orphan.xml', ContentFile(b'<Orphan/>'))
+
+        removed, _freed = default_storage.collect_garbage(min_age=0)
+
+        self.assertEqual(removed, [orphan])
+        self.assertTrue(default_storage.exists(batch.xml_file.name))
+        self.assertTrue(default_storage.exists(clean_xml))
+        self.assertFalse(os.path.exists(default_storage.path(orphan)))
+
+    def test_young_blobs_are_kept(self):
+        orphan = default_storage.save('xml_uploads/orphan.xml', ContentFile(b'<Orphan/>'))
+        removed, _freed = default_storage.collect_garbage(min_age=3600)
+        self.assertEqual(removed, [])
+        self.assertTrue(default_storage.exists(orphan))
+
+
+class ValidationResultCacheTests(CoreTestCase):
+
+    def setUp(self):
+        self.batch = self.make_batch()
+        self.cache = ValidationResultCache(ttl=3600, max_entries=2, eviction='lru')
+
+    def put(self, customer, report='r'):
+        return self.cache.put(customer, report, self.batch, {'total_clean_commands': 1, 'error': None})
+
+    def test_miss_then_hit(self):
+        self.assertIsNone(self.cache.get('c', 'r'))
+        self.put('c')
+        result = self.cache.get('c', 'r')
+        self.assertEqual(result.corrections['total_clean_commands'], 1)
+        self.assertEqual(ValidationResult.objects.get().hit_count, 1)
+        # Another report or rules version is another key
+        self.assertIsNone(self.cache.get('c', 'other'))
+        self.cache.rules_version = 'next'
+        self.assertIsNone(self.cache.get('c', 'r'))
+
+    def test_failed_validations_are_not_cached(self):
+        self.assertIsNone(self.cache.put('c', 'r', self.batch, {'error': 'XML parsing error'}))
+        self.assertFalse(ValidationResult.objects.exists())
+
+    def test_expired_entries_are_dropped(self):
+        self.put('c')
+        ValidationResult.objects.update(created_at=timezone.now() - timedelta(hours=2))
+        self.assertIsNone(self.cache.get('c', 'r'))
+        self.assertFalse(ValidationResult.objects.exists())
+
+    def test_least_recently_hit_is_evicted(self):
+        self.put('a')
+        self.put('b')
+        ValidationResult.objects.filter(customer_sha256='b').update(
+            last_hit_at=timezone.now() - timedelta(minutes=5))
+        self.cache.get('a', 'r')
+        self.put('c')
+        self.assertEqual(set(ValidationResult.objects.values_list('customer_sha256', flat=True)), {'a', 'c'})
+
+
+class BatchPurgeTests(StorageTestCase):
+
+    def stored(self, content):
+        return default_storage.save('xml_uploads/batch.xml', ContentFile(content))
+
+    def test_purge_in_chunks(self):
+        batch = self.make_batch('purged', xml_file=self.stored(b'<Shared/>'),
+                                clean_xml_file=self.stored(b'<Clean/>'))
+        kept = self.make_batch('kept', xml_file=self.stored(b'<Shared/>'))
+        make_errors(batch, 7)
+        make_errors(kept, 2)
+        transition_errors(CustomerError.objects.filter(batch=batch), 'resolved', user=self.user)
+        CleanEntry.objects.create(identifier='1', account_number='1', amount=1,
+                                  national_id='', batch_identifier='purged')
+
+        summary = purge_batch(batch, chunk_size=3)
+
+        self.assertEqual((summary['errors'], summary['clean_entries']), (7, 1))
+        self.assertFalse(BatchHistory.objects.filter(pk=batch.pk).exists())
+        self.assertFalse(ErrorHistory.objects.exists())
+        self.assertEqual(CustomerError.objects.filter(batch=kept).count(), 2)
+        # The customer XML is shared with the kept batch, the clean XML is not
+        self.assertEqual(summary['files'], [batch.clean_xml_file])
+        self.assertTrue(default_storage.exists(kept.xml_file.name))
+
+    def test_delete_in_chunks_splits_by_chunk_size(self):
+        make_errors(self.make_batch(), 7)
+        chunks = []
+        deleted = delete_in_chunks(CustomerError.objects.all(), chunk_size=3, before_chunk=chunks.append)
+        self.assertEqual(deleted, 7)
+        self.assertEqual([len(pks) for pks in chunks], [3, 3, 1])
+        self.assertFalse(CustomerError.objects.exists())
+
+
+def report_values(index):
+    return {identifier: (r.result_code, r.error_message, r.exceptions) for identifier, r in index.items()}
+
+
+class ReportStreamingTests(CoreTestCase):
+
+    def test_stream_matches_tree_index(self):
+        validator = BOTValidator()
+        for encoding in ('utf-8', 'utf-16'):
+            with self.subTest(encoding=encoding):
+                _customer, report, expected = generate_batch(
+                    200, error_rate=0.3, missing_rate=0.05, encoding=encoding, seed=5)
+                tree = report_values(validator.index_report(validator.parse_report(report)))
+                self.assertEqual(len(tree), expected['ok'] + expected['error'])
+                self.assertEqual(report_values(validator.stream_report(report)), tree)
+                self.assertEqual(report_values(validator.stream_report(io.BytesIO(report))), tree)
+
+    def test_first_result_of_an_identifier_wins(self):
+        report = (b'<BatchResponse><Commands>' + report_ok('1').encode()
+                  + b'<Command identifier="1"><Exception><ErrorCode>E1</ErrorCode></Exception></Command>'
+                  + b'</Commands></BatchResponse>')
+        validator = BOTValidator()
+        streamed = report_values(validator.stream_report(report))
+        self.assertEqual(streamed, report_values(validator.index_report(validator.parse_report(report))))
+        self.assertEqual(streamed['1'][0], 'ResultCode.OK')
+
+    def test_truncated_report_raises(self):
+        with self.assertRaises(ET.ParseError):
+            BOTValidator().stream_report(b'<BatchResponse><Commands><Command identifier="1">')
+
+    def test_process_xml_pair_results_match(self):
+        customer, report, _expected = generate_batch(100, error_rate=0.3, missing_rate=0.05, seed=6)
+        for name, stream in (('tree', False), ('stream', True)):
+            BOTValidator().process_xml_pair(customer, report, batch=self.make_batch(name), stream_report=stream)
+        errors = {name: sorted(CustomerError.objects.filter(batch__batch_identifier=name)
+                               .values_list('identifier', 'error_code', 'message'))
+                  for name in ('tree', 'stream')}
+        self.assertEqual(errors['stream'], errors['tree'])
+        self.assertEqual(CleanEntry.objects.filter(batch_identifier='stream').count(),
+                         CleanEntry.objects.filter(batch_identifier='tree').count())
+
+
+class IncrementalRevalidationTests(CoreTestCase):
+
+    def setUp(self):
+        self.customer, self.report, self.expected = generate_batch(40, error_rate=0.3, seed=1)
+        self.first = self.make_batch('first')
+        BOTValidator().process_xml_pair(self.customer, self.report, batch=self.first)
+
+    def resubmit(self, report, name):
+        batch = self.make_batch(name)
+        _clean_xml, corrections = BOTValidator().process_xml_pair(
+            self.customer, report, batch=batch, incremental=True)
+        return batch, corrections
+
+    def test_unchanged_resubmission_is_carried_over(self):
+        batch, corrections = self.resubmit(self.report, 'second')
+        self.assertEqual(corrections['previous_batch_id'], self.first.id)
+        self.assertEqual(corrections['changed_commands'], 0)
+        self.assertEqual(CustomerError.objects.filter(batch=batch).count(), self.expected['error'])
+        self.assertEqual(corrections['total_clean_commands'], self.expected['ok'])
+
+    def test_changed_report_is_reconciled_again(self):
+        batch, corrections = self.resubmit(all_ok_report(self.customer), 'second')
+        self.assertEqual(corrections['changed_commands'], self.expected['error'])
+        self.assertFalse(CustomerError.objects.filter(batch=batch).exists())
+        self.assertEqual(corrections['total_clean_commands'], 40)
+        self.assertEqual(CleanEntry.objects.filter(batch_identifier='second').count(), 40)
+
+    def test_matches_full_revalidation(self):
+        report = all_ok_report(self.customer)
+        incremental, _ = self.resubmit(report, 'incremental')
+        full = self.make_batch('full')
+        BOTValidator().process_xml_pair(self.customer, report, batch=full)
+        self.assertEqual(CustomerError.objects.filter(batch=incremental).count(),
+                         CustomerError.objects.filter(batch=full).count())
+
+
+class CustomerHistoryTests(CoreTestCase):
+
+    def setUp(self):
+        customer, report, _expected = generate_batch(10, error_rate=0.3, seed=2)
+        self.first = self.make_batch('first')
+        self.second = self.make_batch('second')
+        BOTValidator().process_xml_pair(customer, report, batch=self.first)
+        BOTValidator().process_xml_pair(customer, all_ok_report(customer), batch=self.second)
+        self.entry = CommandFingerprint.objects.filter(batch=self.first).exclude(customer_code='').first()
+
+    def test_lookup_by_identifier(self):
+        timeline = list(customer_timeline(identifier=self.entry.identifier))
+        self.assertEqual([entry.batch_id for entry in timeline], [self.second.id, self.first.id])
+        self.assertEqual({entry.identifier for entry in timeline}, {self.entry.identifier})
+        self.assertEqual(timeline[0].outcome, 'ok')
+
+    def test_lookup_by_customer_code(self):
+        timeline = list(customer_timeline(customer_code=self.entry.customer_code))
+        self.assertEqual({entry.batch_id for entry in timeline}, {self.first.id, self.second.id})
+        self.assertEqual({entry.customer_code for entry in timeline}, {self.entry.customer_code})
+        self.assertFalse(customer_timeline().exists())
+
+    def test_view_summarises_both_batches(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('customer_history'), {'identifier': self.entry.identifier})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['summary']['batches'], 2)
+        self.assertEqual(len(response.context['timeline']), 2)
+
+
+class DbBackendTests(CoreTestCase):
+    """Runs on every backend; the PostgreSQL COPY/DISTINCT ON paths only with POSTGRES_DB set."""
+
+    def submitted(self, identifier, phone, amount='100.00'):
+        return SubmittedCustomerData(
+            identifier=identifier, trade_name=f'Customer {identifier}', registration_number='R1',
+            customer_code=f'C{identifier}', phone=phone, total_loan_amount=Decimal(amount),
+            submitted_by=self.user, birth_surname='',
+        )
+
+    def test_upsert_inserts_then_updates(self):
+        written = upsert_submitted_customers([self.submitted('1', '111'), self.submitted('2', '222')])
+        self.assertEqual(written, 2)
+        first_id = SubmittedCustomerData.objects.get(identifier='1').id
+
+        # The last row of a repeated identifier wins
+        upsert_submitted_customers([self.submitted('1', '999'), self.submitted('1', '333', '5.50'),
+                                    self.submitted('3', '444')])
+
+        self.assertEqual(SubmittedCustomerData.objects.count(), 3)
+        updated = SubmittedCustomerData.objects.get(identifier='1')
+        self.assertEqual(updated.id, first_id)
+        self.assertEqual((updated.phone, updated.total_loan_amount), ('333', Decimal('5.50')))
+        self.assertEqual(updated.customer.identifier, '1')
+        self.assertEqual(Customer.objects.count(), 3)
+
+    def test_distinct_errors_keeps_latest_per_identifier_and_code(self):
+        batch = self.make_batch()
+        make_errors(batch, 3)
+        make_errors(batch, 3)
+        make_errors(batch, 2, error_code='E002')
+        latest = list(distinct_errors(CustomerError.objects.all()))
+        self.assertEqual(len(latest), 5)
+        newest = CustomerError.objects.filter(error_code='E001', identifier='0000000000').latest('id')
+        self.assertIn(newest, latest)
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL fast paths')
+    def test_postgresql_uses_copy_and_distinct_on(self):
+        with CaptureQueriesContext(connection) as queries:
+            upsert_submitted_customers([self.submitted('1', '111')])
+            list(distinct_errors(CustomerError.objects.all()))
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertIn('ON CONFLICT', sql)
+        self.assertIn('DISTINCT ON', sql)
+        self.assertTrue(SubmittedCustomerData.objects.filter(identifier='1').exists())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite pragmas')
+class SqlitePragmaTests(TestCase):
+
+    def pragmas_of_new_connection(self):
+        """journal_mode and busy_timeout of a fresh connection to a file database."""
+        path = os.path.join(tempfile.mkdtemp(), 'pragmas.sqlite3')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        default = connections['default']
+        new = default.__class__({**default.settings_dict, 'NAME': path}, alias='default')
+        try:
+            with new.cursor() as cursor:
+                return tuple(cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                             for name in ('journal_mode', 'busy_timeout'))
+        finally:
+            new.close()
+
+    def test_defaults_apply_to_new_connections(self):
+        self.assertEqual(self.pragmas_of_new_connection(), ('wal', 5000))
+
+    @override_settings(SQLITE_PRAGMAS={'journal_mode': None, 'busy_timeout': 1000})
+    def test_settings_override_and_drop_defaults(self):
+        self.assertEqual(self.pragmas_of_new_connection(), ('delete', 1000))
+
+
+class CustomerLinkTests(StorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.customer_content, self.report_content, self.expected = generate_batch(
+            12, error_rate=0.5, batch_identifier='TZ0000043', seed=6)
+
+    def upload(self, name, customer_field, report_field):
+        return self.client.post(reverse(name), {
+            customer_field: SimpleUploadedFile('customers.xml', self.customer_content),
+            report_field: SimpleUploadedFile('report.xml', self.report_content),
+        })
+
+    def assert_linked(self):
+        errors = CustomerError.objects.filter(batch__batch_identifier='TZ0000043').select_related('customer')
+        self.assertEqual(errors.count(), self.expected['error'])
+        for error in errors:
+            submitted = SubmittedCustomerData.objects.get(identifier=error.identifier)
+            self.assertEqual(error.customer_id, submitted.customer_id)
+            self.assertEqual((error.customer.customer_code, error.customer.phone),
+                             (submitted.customer_code, submitted.phone))
+            # Name and phone are not copied into the error's JSON either
+            self.assertEqual(error.customer_details, {})
+
+    def submitted_data_queries(self, queries):
+        return [q['sql'] for q in queries.captured_queries
+                if 'FROM "core_submittedcustomerdata"' in q['sql'] and q['sql'].startswith('SELECT')]
+
+    def test_upload_both_files_links_errors_without_per_error_lookups(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.upload('upload_both_files', 'customer_file', 'error_file')
+        self.assert_linked()
+        self.assertEqual(self.submitted_data_queries(queries), [])
+
+    def test_upload_customer_xml_links_errors_without_per_error_lookups(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.upload('upload_customer', 'customer_file', 'bot_report')
+        self.assert_linked()
+        self.assertEqual(self.submitted_data_queries(queries), [])
+
+    def test_restore_links_archives_written_with_customer_columns(self):
+        batch = self.make_batch('TZ0000043', status='resolved')
+        make_errors(batch, 2, status='resolved')
+        archive = archive_batch(batch)
+        # Rewrite the archive as it was before errors had a customer
+        records = []
+        for record in iter_archive(archive):
+            record.pop('customer_id')
+            record.update(customer_name=f"Name {record['identifier']}", customer_code='C1', phone='255')
+            records.append(json.dumps(record))
+        default_storage.delete(archive.archive_file)
+        name = default_storage.save(archive.archive_file, ContentFile(('\n'.join(records) + '\n').encode()))
+        ErrorArchive.objects.filter(pk=archive.pk).update(archive_file=name, compression=None)
+        archive.refresh_from_db()
+
+        restore_batch(archive)
+        errors = CustomerError.objects.filter(batch=batch).select_related('customer').order_by('identifier')
+        self.assertEqual([(e.customer.name, e.customer.customer_code, e.customer.phone) for e in errors],
+                         [('Name 0000000000', 'C1', '255'), ('Name 0000000001', 'C1', '255')])
+
+
+class HeaderProbeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer, cls.report, _ = generate_batch(3, batch_identifier='TZ0000036', seed=36)
+        cls.batch_id = re.search(rb'<BatchId>(\d+)</BatchId>', cls.report).group(1).decode()
+
+    def test_namespaced_customer_batch(self):
+        self.assertEqual(probe_header(self.customer), HeaderInfo(CUSTOMER, 'TZ0000036', None))
+
+    def test_plain_batch_response(self):
+        self.assertEqual(probe_header(self.report), HeaderInfo(REPORT, 'TZ0000036', self.batch_id))
+
+    def test_utf16_with_and_without_bom(self):
+        text = self.report.decode('utf-8')
+        for encoding, bom in (('utf-16-le', codecs.BOM_UTF16_LE), ('utf-16-be', codecs.BOM_UTF16_BE)):
+            for prefix in (bom, b''):
+                with self.subTest(encoding=encoding, bom=bool(prefix)):
+                    # An odd chunk size splits code units across chunks
+                    content = prefix + text.encode(encoding)
+                    self.assertEqual(probe_header(content, chunk_size=7),
+                                     HeaderInfo(REPORT, 'TZ0000036', self.batch_id))
+
+    def test_utf8_body_declared_utf16(self):
+        content = re.sub(rb'encoding="[^"]+"', b'encoding="utf-16"', self.report, count=1)
+        self.assertIn(b'encoding="utf-16"', content)
+        self.assertEqual(probe_header(content), HeaderInfo(REPORT, 'TZ0000036', self.batch_id))
+
+    def test_document_without_header(self):
+        content = (f'<Batch xmlns="{BATCH_NAMESPACE}"><Commands><Command identifier="1">'
+                   '<StorHeader><Identifier>TZ0000099</Identifier></StorHeader>'
+                   '</Command></Commands></Batch>').encode()
+        self.assertEqual(probe_header(content), HeaderInfo(CUSTOMER, None, None))
+        self.assertEqual(probe_header(b'<Other><Header><Identifier>X</Identifier></Header></Other>'), NOT_FOUND)
+        self.assertEqual(probe_header(b'not xml at all'), NOT_FOUND)
+
+    def test_file_object_is_left_rewound(self):
+        source = io.BytesIO(self.customer)
+        source.read(10)
+        # Stops after the Header, long before the end of the file
+        self.assertEqual(probe_header(source, chunk_size=64).identifier, 'TZ0000036')
+        self.assertEqual(source.tell(), 0)
+
+
+def fake_process_pair(identifier, customer_path, report_path, **kwargs):
+    """Stands in for batch_processing.process_pair in the ingest worker: fails identifiers ending in 9."""
+    error = 'reconciliation failed' if identifier.endswith('9') else None
+    return {'identifier': identifier, 'commands': 2, 'clean': 2, 'seconds': 0.0, 'cached': False, 'error': error}
+
+
+class IngestServiceTests(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.watch = os.path.join(self.root, 'watch')
+        os.makedirs(self.watch)
+
+    def service(self, **kwargs):
+        kwargs.setdefault('settle_seconds', 0)
+        return IngestService([self.watch], os.path.join(self.root, 'archive'), os.path.join(self.root, 'failed'),
+                             'admin', use_inotify=False, **kwargs)
+
+    def drop(self, name, identifier, kind='customer', age=60):
+        customer, report, _ = generate_batch(2, batch_identifier=identifier, seed=35)
+        path = os.path.join(self.watch, name)
+        with open(path, 'wb') as f:
+            f.write(customer if kind == 'customer' else report)
+        settled = time.time() - age
+        os.utime(path, (settled, settled))
+        return path
+
+    def moved(self, directory):
+        found = []
+        for _root, _dirs, files in os.walk(os.path.join(self.root, directory)):
+            found.extend(files)
+        return sorted(found)
+
+    def test_files_are_claimed_once_settled(self):
+        service = self.service(settle_seconds=30)
+        path = self.drop('customer.xml', 'TZ0000001', age=0)
+        service.scan()
+        service.scan()
+        # Unchanged, but modified less than settle_seconds ago
+        self.assertEqual(service.waiting['customer'], {})
+        os.utime(path, (time.time() - 60, time.time() - 60))
+        service.scan()
+        # The mtime changed since the previous scan: wait for one more
+        self.assertEqual(service.waiting['customer'], {})
+        service.scan()
+        self.assertEqual(service.waiting['customer'], {'TZ0000001': path})
+
+    def test_pairs_by_header_identifier(self):
+        service = self.service()
+        customer_a = self.drop('a.xml', 'TZ0000001')
+        report_b = self.drop('b.xml', 'TZ0000002', kind='report')
+        customer_b = self.drop('c.xml', 'TZ0000002')
+        with open(os.path.join(self.watch, 'notes.xml'), 'w') as f:
+            f.write('<Notes/>')
+        service.scan()
+        service.scan()
+        self.assertEqual(service.ready, [('TZ0000002', customer_b, report_b)])
+        self.assertEqual(service.waiting['customer'], {'TZ0000001': customer_a})
+        self.assertEqual(self.moved('failed'), ['notes.xml'])
+
+    def test_a_newer_file_supersedes_the_waiting_one(self):
+        service = self.service()
+        first = self.drop('first.xml', 'TZ0000001', age=120)
+        service.scan()
+        service.scan()
+        second = self.drop('second.xml', 'TZ0000001')
+        service.scan()
+        service.scan()
+        self.assertEqual(service.waiting['customer'], {'TZ0000001': second})
+        self.assertFalse(os.path.exists(first))
+        self.assertEqual(self.moved('failed'), ['first.xml'])
+
+    def test_dispatch_keeps_pairs_queued_while_workers_are_busy(self):
+        class Pool:
+            def __init__(self):
+                self.futures = []
+
+            def submit(self, fn, *args, **kwargs):
+                self.futures.append(Future())
+                return self.futures[-1]
+
+        service, pool = self.service(workers=1), Pool()
+        for number in (1, 2, 3):
+            identifier = f'TZ000000{number}'
+            service.ready.append((identifier, self.drop(f'c{number}.xml', identifier),
+                                  self.drop(f'r{number}.xml', identifier, kind='report')))
+        service.dispatch(pool)
+        service.dispatch(pool)
+        self.assertEqual(len(pool.futures), 1)
+        self.assertEqual([pair[0] for pair in service.ready], ['TZ0000002', 'TZ0000003'])
+
+        pool.futures[0].set_result(fake_process_pair('TZ0000001', '', ''))
+        service.collect()
+        service.dispatch(pool)
+        self.assertEqual(len(pool.futures), 2)
+        self.assertEqual(service.processed, 1)
+        self.assertEqual(self.moved('archive'), ['c1.xml', 'r1.xml'])
+
+    def test_run_once_archives_processed_pairs_and_fails_the_rest(self):
+        for identifier in ('TZ0000001', 'TZ0000009'):
+            self.drop(f'{identifier}_customer.xml', identifier)
+            self.drop(f'{identifier}_report.xml', identifier, kind='report')
+        with patch('core.ingest.process_pair', fake_process_pair):
+            processed, failed = self.service(workers=1, poll_seconds=0.1).run(once=True)
+        self.assertEqual((processed, failed), (1, 1))
+        self.assertEqual(self.moved('archive'), ['TZ0000001_customer.xml', 'TZ0000001_report.xml'])
+        self.assertEqual(self.moved('failed'), ['TZ0000009_customer.xml', 'TZ0000009_report.xml'])
+        self.assertEqual(os.listdir(self.watch), [])
+
+
+class ErrorTransitionTests(CoreTestCase):
+
+    def setUp(self):
+        self.batch = self.make_batch()
+        make_errors(self.batch, 3)
+        self.errors = CustomerError.objects.filter(batch=self.batch)
+
+    def test_resolve_stamps_and_records_history(self):
+        result = transition_errors(self.errors, 'resolved', user=self.user, notes='fixed')
+        self.assertEqual((result.updated, result.before, result.after), (3, {'pending': 3}, {'resolved': 3}))
+        for error in self.errors:
+            self.assertEqual((error.status, error.resolved_by, error.notes), ('resolved', self.user, 'fixed'))
+            self.assertIsNotNone(error.resolved_at)
+        history = ErrorHistory.objects.filter(error__batch=self.batch)
+        self.assertEqual(history.count(), 3)
+        self.assertEqual(set(history.values_list('previous_status', 'new_status', 'changed_by')),
+                         {('pending', 'resolved', self.user.id)})
+
+    def test_reopen_clears_resolution(self):
+        transition_errors(self.errors, 'resolved', user=self.user)
+        result = transition_errors(self.errors, 'pending', user=self.user)
+        self.assertEqual(result.updated, 3)
+        self.assertFalse(self.errors.exclude(resolved_at=None).exists())
+        self.assertFalse(self.errors.exclude(resolved_by=None).exists())
+        self.assertEqual(ErrorHistory.objects.filter(previous_status='resolved', new_status='pending').count(), 3)
+
+    def test_same_status_is_a_no_op(self):
+        result = transition_errors(self.errors, 'pending', user=self.user)
+        self.assertEqual((result.updated, result.total), (0, 3))
+        self.assertFalse(ErrorHistory.objects.exists())
+
+    def test_from_statuses_limits_what_moves(self):
+        first = self.errors.order_by('id').first()
+        transition_errors(self.errors.filter(pk=first.pk), 'ignored')
+        result = transition_errors(self.errors, 'resolved', from_statuses=['pending'])
+        self.assertEqual(result.moved, {'pending': 2})
+        self.assertEqual(result.after, {'ignored': 1, 'resolved': 2})
+        self.assertEqual(CustomerError.objects.get(pk=first.pk).status, 'ignored')
+
+    def test_unknown_status_is_refused(self):
+        with self.assertRaises(ValueError):
+            transition_errors(self.errors, 'deleted')
+        self.assertFalse(self.errors.exclude(status='pending').exists())
+
+    def test_dashboard_status_change_is_recorded(self):
+        self.client.force_login(self.user)
+        error = self.errors.first()
+        response = self.client.post(reverse('customer_error_dashboard'),
+                                    {'error_id': error.id, 'status': 'resolved', 'notes': 'checked'},
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.json(), {'success': True, 'updated': 1})
+        error.refresh_from_db()
+        self.assertEqual((error.status, error.resolved_by), ('resolved', self.user))
+        history = ErrorHistory.objects.get(error=error)
+        self.assertEqual((history.previous_status, history.new_status, history.notes, history.changed_by),
+                         ('pending', 'resolved', 'checked', self.user))
+
+
+class BulkStatusEndpointTests(CoreTestCase):
+
+    def setUp(self):
+        self.batch = self.make_batch()
+        make_errors(self.batch, 4)
+        self.url = reverse('bulk_update_error_status')
+        self.client.force_login(self.user)
+
+    def post(self, payload, client=None):
+        body = payload if isinstance(payload, str) else json.dumps(payload)
+        return (client or self.client).post(self.url, body, content_type='application/json')
+
+    def test_rejects_bad_requests(self):
+        ids = list(CustomerError.objects.values_list('id', flat=True))
+        for payload in ('{not json', '[1, 2]',
+                        {'ids': ids, 'status': 'deleted'},
+                        {'ids': ids, 'filter': {'batch': 'TZ0000001'}, 'status': 'resolved'},
+                        {'status': 'resolved'},
+                        {'ids': [], 'status': 'resolved'},
+                        {'ids': ['1'], 'status': 'resolved'},
+                        {'ids': ids, 'status': 'resolved', 'notes': 5},
+                        {'filter': {}, 'status': 'resolved'},
+                        {'filter': {'message': 'x'}, 'status': 'resolved'},
+                        {'filter': {'error_code__in': 'E001'}, 'status': 'resolved'}):
+            with self.subTest(payload=payload):
+                response = self.post(payload)
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.json()['success'])
+        self.assertFalse(CustomerError.objects.exclude(status='pending').exists())
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+    def test_requires_csrf_token_and_login(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        self.assertEqual(self.post({'filter': {'batch': 'TZ0000001'}, 'status': 'resolved'}, client).status_code, 403)
+        anonymous = self.post({'filter': {'batch': 'TZ0000001'}, 'status': 'resolved'}, Client())
+        self.assertEqual(anonymous.status_code, 302)
+        self.assertFalse(CustomerError.objects.exclude(status='pending').exists())
+
+    def test_updates_by_ids_and_by_filter(self):
+        first, second, *_rest = CustomerError.objects.order_by('id').values_list('id', flat=True)
+        data = self.post({'ids': [first, second], 'status': 'ignored', 'notes': 'duplicate'}).json()
+        self.assertEqual((data['updated'], data['error_stats']['ignored']), (2, 2))
+
+        data = self.post({'filter': {'batch': 'TZ0000001', 'status': 'pending'}, 'status': 'resolved'}).json()
+        self.assertEqual((data['updated'], data['after']), (2, {'resolved': 2}))
+        self.assertEqual(ErrorHistory.objects.filter(changed_by=self.user).count(), 4)
+
+
+class ApiTests(CoreTestCase):
+
+    def setUp(self):
+        self.batch = self.make_batch()
+        make_errors(self.batch, 7)
+        link_codes(CustomerError.objects.all())
+        self.client.force_login(self.user)
+        self.url = reverse('api_errors')
+
+    def test_keyset_pages_cover_every_row_once(self):
+        ids, url, pages = [], f'{self.url}?batch=TZ0000001&fields=id,identifier&limit=3', 0
+        while url:
+            data = self.client.get(url).json()
+            self.assertEqual(set(data['results'][0]), {'id', 'identifier'})
+            ids += [row['id'] for row in data['results']]
+            url, pages = data['next'], pages + 1
+        self.assertEqual(pages, 3)
+        self.assertEqual(ids, sorted(CustomerError.objects.values_list('id', flat=True), reverse=True))
+
+    def test_filters(self):
+        self.assertEqual(len(self.client.get(f'{self.url}?error_code=E001').json()['results']), 7)
+        self.assertEqual(self.client.get(f'{self.url}?error_code__in=E002,E003').json()['results'], [])
+        self.assertEqual(self.client.get(f'{self.url}?created_before=2020-01-01').json()['results'], [])
+        for query in ('fields=nope', 'created_after=yesterday', 'limit=0', 'limit=5000', 'after=x'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'{self.url}?{query}').status_code, 400)
+
+    def test_etag_gives_304_until_the_rows_change(self):
+        url = f'{self.url}?status=pending&limit=2'
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # The aggregate is the only query on errors: no rows are read
+        error_queries = [q['sql'] for q in queries.captured_queries if 'core_customererror' in q['sql']]
+        self.assertEqual(len(error_queries), 1)
+        self.assertIn('COUNT(', error_queries[0])
+
+        # Another query string is another ETag
+        self.assertEqual(self.client.get(f'{self.url}?status=pending&limit=3',
+                                         HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        transition_errors(CustomerError.objects.filter(pk=CustomerError.objects.first().pk), 'resolved')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_read_only_and_json_401_without_login(self):
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+        response = Client().get(self.url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'error': 'Authentication required'})
+
+
+class RecentUploadTests(CoreTestCase):
+
+    def upload(self, batch, errors):
+        return RecentUpload.objects.create(user=self.user, filename=batch.filename, batch=batch,
+                                           first_error_id=errors[0].id, last_error_id=errors[-1].id)
+
+    def test_errors_are_the_batch_rows_in_the_id_range(self):
+        first, second = self.make_batch('first'), self.make_batch('second')
+        # Interleaved ids, as with two uploads at once
+        errors = make_errors(first, 2) + make_errors(second, 2) + make_errors(first, 2)
+        upload = self.upload(first, errors)
+        self.assertEqual(set(upload.errors()), set(CustomerError.objects.filter(batch=first)))
+
+    def test_no_errors_once_the_batch_is_deleted(self):
+        first, second = self.make_batch('first'), self.make_batch('second')
+        errors = make_errors(first, 2) + make_errors(second, 2) + make_errors(first, 2)
+        upload = self.upload(first, errors)
+        purge_batch(first, delete_files=False)
+
+        upload.refresh_from_db()
+        self.assertIsNone(upload.batch_id)
+        self.assertFalse(upload.errors().exists())
+        self.assertEqual(CustomerError.objects.filter(batch=second).count(), 2)
+
+    def test_upload_without_errors(self):
+        upload = RecentUpload.objects.create(user=self.user, filename='clean.xml')
+        self.assertFalse(upload.errors().exists())
+
+
+@override_settings(DASHBOARD_CACHE='default')
+class DashboardCacheTests(CoreTestCase):
+
+    def setUp(self):
+        dashboard_cache.get_cache().clear()
+        dashboard_cache.stats.reset()
+        self.batch = self.make_batch()
+
+    def create_error(self, identifier='1'):
+        return CustomerError.objects.create(batch=self.batch, identifier=identifier, error_code='E1',
+                                            uploaded_by=self.user)
+
+    def generation(self, scope='errors'):
+        return dashboard_cache.generation(dashboard_cache.get_cache(), scope)
+
+    def assert_bumps(self, change, scope='errors'):
+        before = self.generation(scope)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertNotEqual(self.generation(scope), before)
+
+    def test_hits_and_misses(self):
+        make_errors(self.batch, 2)
+        self.assertEqual(dashboard_cache.error_stats()['total'], 2)
+        self.assertEqual(dashboard_cache.error_stats()['pending'], 2)
+        self.assertEqual(dashboard_cache.stats.snapshot()['blocks']['stats'],
+                         {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_save_delete_and_bulk_paths_bump_the_generation(self):
+        error = make_errors(self.batch, 1)[0]
+        self.assert_bumps(self.create_error)
+        self.assert_bumps(lambda: error.save())
+        self.assert_bumps(lambda: transition_errors(CustomerError.objects.all(), 'resolved', user=self.user))
+        self.assert_bumps(dashboard_cache.errors_changed)
+        self.assert_bumps(lambda: CustomerError.objects.filter(pk=error.pk).delete())
+        self.assert_bumps(lambda: RecentUpload.objects.create(user=self.user, filename='a.xml'),
+                          scope=f'uploads:{self.user.pk}')
+
+    def test_changes_in_a_transaction_bump_once_on_commit(self):
+        self.assertEqual(dashboard_cache.error_stats()['total'], 0)
+        before = self.generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            for identifier in '123':
+                self.create_error(identifier)
+            self.assertEqual(self.generation(), before)
+            self.assertEqual(dashboard_cache.error_stats()['total'], 0)
+        self.assertEqual(self.generation(), before + 1)
+        self.assertEqual(dashboard_cache.stats.snapshot()['invalidations'], 1)
+        self.assertEqual(dashboard_cache.error_stats()['total'], 3)
+
+    def test_rolled_back_change_does_not_invalidate(self):
+        before = self.generation()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    self.create_error()
+                    raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.generation(), before)
+        # Its scope is left pending, for the next commit to bump
+        with self.captureOnCommitCallbacks(execute=True):
+            dashboard_cache.invalidate(f'uploads:{self.user.pk}')
+        self.assertEqual(self.generation(), before + 1)
+
+    def test_recent_upload_is_plain_data_and_stale_uploads_are_deleted_by_the_view(self):
+        errors = make_errors(self.batch, 2)
+        upload = RecentUpload.objects.create(user=self.user, filename='a.xml', batch=self.batch,
+                                             first_error_id=errors[0].id, last_error_id=errors[-1].id)
+        block = dashboard_cache.recent_upload(self.user)
+        self.assertEqual({row['error']['id'] for row in block['recent_errors']}, {e.id for e in errors})
+        self.assertIsInstance(block['recent_errors'][0]['error'], dict)
+
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomerError.objects.filter(batch=self.batch).delete()
+        self.assertEqual(self.client.get(reverse('customer_error_dashboard')).status_code, 200)
+        self.assertFalse(RecentUpload.objects.filter(pk=upload.pk).exists())
+
+
+class ExternalReconcileTests(CoreTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def errors(self, batch):
+        return sorted(CustomerError.objects.filter(batch=batch)
+                      .values_list('identifier', 'error_code', 'message', 'customer_id', 'code_id'))
+
+    def test_matches_process_xml_pair(self):
+        for encoding in ('utf-8', 'utf-16'):
+            customer, report, _expected = generate_batch(
+                350, error_rate=0.3, missing_rate=0.05, encoding=encoding, seed=11)
+            in_memory = self.make_batch(f'memory-{encoding}')
+            clean_xml, expected = BOTValidator().process_xml_pair(customer, report, batch=in_memory)
+            spilled = self.make_batch(f'spilled-{encoding}')
+            # A 1 MB budget reconciles in chunks of MIN_CHUNK_SIZE
+            path, corrections = reconcile_files(
+                self.write('customer.xml', customer), self.write('report.xml', report), spilled,
+                clean_output=os.path.join(self.directory, 'clean.xml'), memory_budget=1024 * 1024)
+
+            self.assertIsNone(corrections['error'])
+            self.assertEqual(corrections['total_clean_commands'], expected['total_clean_commands'])
+            self.assertEqual(self.errors(spilled), self.errors(in_memory))
+            self.assertEqual(CommandFingerprint.objects.filter(batch=spilled).count(), 350)
+            with open(path, 'rb') as f:
+                self.assertEqual(ET.canonicalize(f.read().decode(), strip_text=True),
+                                 ET.canonicalize(clean_xml.decode(), strip_text=True))
+
+    def test_batch_is_required(self):
+        customer, report, _expected = generate_batch(5, seed=1)
+        with self.assertRaises(ValueError):
+            reconcile_files(self.write('customer.xml', customer), self.write('report.xml', report), None)
+
+
+class ReconcileMetricsTests(CoreTestCase):
+
+    def setUp(self):
+        self.url = reverse('reconcile_metrics')
+        now = timezone.now()
+        for number, seconds in enumerate((1.0, 2.0, 4.0)):
+            batch = self.make_batch(f'TZ000000{number}', phase_metrics={
+                'match': {'seconds': seconds, 'items': 10, 'bytes': 0},
+            })
+            BatchHistory.objects.filter(pk=batch.pk).update(upload_date=now + timedelta(minutes=number))
+
+    @override_settings(METRICS_WINDOW_BATCHES=2)
+    def test_gauges_over_the_newest_batches(self):
+        response = self.client.get(self.url, REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('# TYPE cbt_reconcile_window_phase_seconds gauge', text)
+        self.assertIn('cbt_reconcile_window_batches 2\n', text)
+        self.assertIn('cbt_reconcile_window_phase_seconds{phase="match"} 6.0\n', text)
+        self.assertIn('cbt_reconcile_window_phase_items{phase="match"} 20\n', text)
+        self.assertIn('cbt_reconcile_last_phase_seconds{phase="match",batch="TZ0000002"} 4.0\n', text)
+        self.assertNotIn('counter\ncbt_reconcile', text)
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_local_scrapers_and_staff_only(self):
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR='10.0.0.5').status_code, 403)
+        clerk = User.objects.create_user('clerk', password='password')
+        self.client.force_login(clerk)
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR='10.0.0.5').status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+
+@override_settings(REQUEST_PROFILING=True, REQUEST_PROFILING_MEMORY=True, SLOW_REQUEST_MS=None)
+class ProfilingMiddlewareTests(TestCase):
+
+    def profile(self):
+        profiles = []
+
+        def view(request):
+            profiles.append(current_profile())
+            bytearray(1024 * 1024)
+            return HttpResponse('ok')
+
+        response = ProfilingMiddleware(view)(RequestFactory().get('/'))
+        self.assertIn('Server-Timing', response)
+        return profiles[0]
+
+    def test_records_peak_memory(self):
+        self.assertGreater(self.profile().peak_memory, 1024 * 1024)
+        self.assertFalse(_memory_lock.locked())
+
+    def test_overlapping_request_skips_memory(self):
+        # Another profiled request owns tracemalloc
+        with _memory_lock:
+            profile = self.profile()
+        self.assertIsNone(profile.peak_memory)
+        self.assertGreaterEqual(profile.wall, 0)
+
+
+class SyntheticBatchTests(TestCase):
+
+    def test_customer_file_passes_validation(self):
+        customer, _report, expected = generate_batch(50, error_rate=0.2, missing_rate=0.1, seed=3)
+        self.assertEqual(validate_xml_file(customer)['errors'], [])
+        self.assertEqual(sum(expected.values()), 50)
+
+
+class BatchProcessingTests(StorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.inbox = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.inbox, ignore_errors=True)
+
+    def write(self, name, content, age=0):
+        path = os.path.join(self.inbox, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        written = time.time() - age
+        os.utime(path, (written, written))
+        return path
+
+    def test_files_are_paired_by_header_identifier(self):
+        customer, report, _ = generate_batch(3, seed=34)
+        older = self.write('older.xml', customer, age=60)
+        newer = self.write('newer.xml', generate_batch(4, seed=35)[0])
+        bot = self.write('bot.xml', report)
+        orphan = self.write('orphan.xml', generate_batch(1, batch_identifier='TZ0000002', seed=34)[1])
+        pairs, unpaired = pair_files(discover([self.inbox]))
+        self.assertEqual(pairs, {'TZ0000001': (newer, bot)})
+        self.assertEqual({path for path, _reason in unpaired}, {older, orphan})
+
+    def test_command_reconciles_pairs_once(self):
+        customer, report, expected = generate_batch(20, error_rate=0.25, seed=34)
+        self.write('customer.xml', customer)
+        self.write('report.xml', report)
+        out = io.StringIO()
+        call_command('process_batches', self.inbox, workers=1, stdout=out)
+        batch = BatchHistory.objects.get()
+        self.assertEqual(batch.status, 'completed')
+        self.assertTrue(batch.batch_identifier.startswith('TZ0000001_'))
+        self.assertIn(f"TZ0000001: 20 commands, {expected['ok']} clean", out.getvalue())
+
+        # The same pair again comes from the result cache
+        call_command('process_batches', self.inbox, workers=1, stdout=out)
+        self.assertEqual(BatchHistory.objects.count(), 1)
+        self.assertIn('(cached)', out.getvalue())
+
+
+class ErrorCodeTests(CoreTestCase):
+
+    def test_filters_go_through_the_catalogue(self):
+        batch = self.make_batch()
+        make_errors(batch, 3, error_code='cvc-pattern-valid')
+        make_errors(batch, 2, error_code='BOT-E-0030')
+        self.assertEqual(link_codes(CustomerError.objects.all()), 5)
+
+        code = ErrorCode.objects.get(code='cvc-pattern-valid')
+        self.assertEqual(code.category, 'schema')
+        errors = filter_errors({'error_code': 'cvc-pattern-valid'})
+        self.assertIn('"core_errorcode"."code"', str(errors.query))
+        self.assertEqual(set(errors.values_list('code_id', flat=True)), {code.id})
+        self.assertEqual(filter_errors({'error_code__in': ['cvc-pattern-valid', 'BOT-E-0030']}).count(), 5)
+        self.assertEqual(filter_errors({'category': 'schema'}).count(), 3)
+
+    def test_link_codes_skips_linked_errors(self):
+        batch = self.make_batch()
+        make_errors(batch, 2)
+        link_codes(CustomerError.objects.all())
+        self.assertEqual(link_codes(CustomerError.objects.all()), 0)
+        self.assertEqual(ErrorCode.objects.count(), 1)
@@ -1,7 +1,7 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
 from django.contrib.auth.decorators import login_required
-from . import views
+from . import api, views
 
 urlpatterns = [
     # Main dashboard - now points to customer_error_dashboard
@@ -30,7 +30,15 @@ urlpatterns = [
     path('validate-xml/', views.validate_xml_file, name='validate_xml'),
 
     path('resolve-batch/', views.resolve_all_batch, name='resolve_all_batch'),
+    path('errors/bulk-status/', views.bulk_update_error_status, name='bulk_update_error_status'),
     path('batch-history/', views.batch_history, name='batch_history'),
+    path('customer-history/', views.customer_history, name='customer_history'),
+    path('profiling/', views.profiling_stats, name='profiling_stats'),
+    path('metrics/', views.reconcile_metrics, name='reconcile_metrics'),
+    path('archive/<str:batch_id>/', views.batch_archive, name='batch_archive'),
+    path('api/errors/', api.collection, {'resource_name': 'errors'}, name='api_errors'),
+    path('api/batches/', api.collection, {'resource_name': 'batches'}, name='api_batches'),
+    path('api/clean-entries/', api.collection, {'resource_name': 'clean-entries'}, name='api_clean_entries'),
     path('delete-batch/<str:batch_id>/', views.delete_batch, name='delete_batch'),
     path('error-dashboard/', views.error_dashboard, name='error_dashboard'),
 
@@ -1,6 +1,8 @@
 import xml.etree.ElementTree as ET
 import re
 
+from .profiling import phase
+
 VALIDATION_RULES = {
     # Base currency codes dictionary
     "currency_codes": {
@@ -1271,6 +1273,7 @@ XML_NAMESPACE = {
     'ns': 'http://cb4.creditinfosolutions.com/BatchUploader/Batch'
 }
 
+@phase('validation')
 def validate_xml_file(xml_content):
     """
     Validate XML content against BOT rules using exact error checking
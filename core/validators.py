@@ -1,6 +1,7 @@
 from typing import Dict, List, Tuple
 import xml.etree.ElementTree as ET
 from .validation_config import validation_dict, validation_dict_by_code
+from .profiling import phase
 
 class BOTXMLValidator:
     def __init__(self):
@@ -146,6 +147,7 @@ class BOTXMLValidator:
             return False
         return True
 
+    @phase('validation')
     def validate_xml_file(self, xml_file_path: str) -> dict:
         """Validate XML file and return precise error count"""
         try:
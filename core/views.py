@@ -15,11 +15,22 @@ from core import BOTXMLValidator
 from django.core.files.storage import FileSystemStorage
 import os
 from .validation_config import validation_dict, validation_dict_by_code, validate_xml_file
-from .models import BatchHistory
+from .models import BatchHistory, ErrorArchive
+from .profiling import phase
+from .header_probe import probe_header
+from .archive import archived_errors
+from .batch_deletion import purge_batch
+from .db_backend import distinct_errors, upsert_submitted_customers
+from .customers import ensure_customers, submission_of
+from .error_parameters import save_parameters
+from .error_codes import get_error_code
+from . import dashboard_cache
+from .error_status import TARGET_STATUSES, filter_errors, transition_batch, transition_errors
 import csv
 from datetime import datetime
 from django.db import transaction
-from django.db.models import Q  # Add this import
+from django.db.models import Count, Q, prefetch_related_objects  # Add this import
+from django.core.exceptions import ValidationError
 from django.conf import settings  # Add this import
 from django.core.files.storage import FileSystemStorage
 import xml.etree.ElementTree as ET
@@ -27,42 +38,6 @@ import os
 import logging
 # from .xml_validator import XMLValidator
 
-# Create this function to handle friendly error messages
-def get_friendly_error_message(error_code, message=""):
-    
-    """Returns a user-friendly message based on the error code or message."""
-    # Define a mapping of error codes to friendly messages
-    friendly_messages = {
-        'E001': 'Customer information is incomplete. Please provide all required details.',
-        'E002': 'The account number format is invalid. Please check and try again.',
-        'E003': 'National ID format is incorrect. Please verify and resubmit.',
-        # Add more mappings as needed
-    }
-    
-    # First try to match by error code
-    if error_code in friendly_messages:
-        return friendly_messages[error_code]
-        
-    # Default friendly message if no specific mapping exists
-    return "There was an issue with the submission. Our team is working to resolve it."
-
-# Add this helper function at the top of the file
-def get_batch_identifier(xml_content, is_customer_file=False):
-    """Extract batch identifier from XML Header block"""
-    try:
-        root = ET.fromstring(xml_content.decode('utf-8'))
-        if is_customer_file:
-            ns = {'ns': 'http://cb4.creditinfosolutions.com/BatchUploader/Batch'}
-            batch_id = root.find('.//ns:Header/ns:Identifier', ns)
-        else:
-            batch_id = root.find('.//Header/Identifier')
-            
-        if batch_id is None:
-            return None
-        return batch_id.text.strip()
-    except ET.ParseError:
-        return None
-
 
 @login_required
 def error_dashboard(request):
@@ -70,32 +45,37 @@ def error_dashboard(request):
     batch_id = request.GET.get('batch')
     
     # Get errors with related batch and customer data
-    errors = CustomerError.objects.select_related('batch').all()
+    errors = CustomerError.objects.select_related('batch', 'customer__submission').all()
+    archive = None
     
     if batch_id:
         errors = errors.filter(batch__batch_identifier=batch_id)
+        # Errors of archived batches are read back from the archive file
+        archive = ErrorArchive.objects.filter(batch__batch_identifier=batch_id).select_related('batch').first()
+        if archive is not None:
+            errors = archived_errors(archive)
+            for error in errors:
+                error.batch = archive.batch
+            prefetch_related_objects(errors, 'customer__submission')
     
     # Get customer data for each error
+    data = []
     for error in errors:
         # Get customer data from SubmittedCustomerData
-        customer_data = SubmittedCustomerData.objects.filter(
-            identifier=error.identifier
-        ).first()
+        customer_data = submission_of(error)
+        customer_code = error.customer.customer_code if error.customer else ''
+        data.append({'error': error, 'submitted': customer_data, 'customer_code': customer_code})
         
         if customer_data:
-            error.customer_name = customer_data.birth_surname
-            error.customer_code = customer_data.customer_code
-            error.phone = customer_data.phone
             error.loan_amount = customer_data.total_loan_amount
         else:
-            error.customer_name = error.customer_details.get('birth_surname', '')
-            error.customer_code = error.customer_details.get('customer_code', '')
-            error.phone = error.customer_details.get('phone', '')
             error.loan_amount = error.customer_details.get('loan_amount', '0.00')
     
     context = {
         'errors': errors,
-        'batch_id': batch_id
+        'data': data,
+        'batch_id': batch_id,
+        'archive': archive,
     }
     
     return render(request, 'error_dashboard.html', context)
@@ -143,29 +123,21 @@ def upload_both_files(request):
         error_file = request.FILES.get('error_file')
         customer_count = 0
         error_count = 0
-        current_errors = []  # Track errors from this upload session
+        # Id range of the errors created by this upload
+        first_error_id = last_error_id = None
+        batch_history = None
         customer_batch_id = None  # Initialize variable here
 
-        # Clear session data about current upload
+        # Clear session data left by uploads that stored error id lists
         if 'current_upload_errors' in request.session:
             del request.session['current_upload_errors']
 
         # === Check Batch Identifiers ===
         if customer_file and error_file:
             try:
-                # Read customer file content
-                customer_content = customer_file.read()
-                if customer_content.startswith(b'\xef\xbb\xbf'):
-                    customer_content = customer_content[3:]
-                    
-                # Read error file content
-                error_content = error_file.read()
-                if error_content.startswith(b'\xef\xbb\xbf'):
-                    error_content = error_content[3:]
-
-                # Get batch identifiers from Header block
-                customer_batch_id = get_batch_identifier(customer_content, is_customer_file=True)
-                error_batch_id = get_batch_identifier(error_content)
+                # Get batch identifiers from Header block (only the Header is read)
+                customer_batch_id = get_batch_identifier(customer_file, is_customer_file=True)
+                error_batch_id = get_batch_identifier(error_file)
 
                 # Check if identifiers were found in Header block
                 if not customer_batch_id:
@@ -200,9 +172,11 @@ def upload_both_files(request):
                 customer_content = customer_file.read()
                 if customer_content.startswith(b'\xef\xbb\xbf'):
                     customer_content = customer_content[3:]
-                root = ET.fromstring(customer_content.decode('utf-8'))
+                with phase('parse'):
+                    root = ET.fromstring(customer_content.decode('utf-8'))
                 ns = {'ns': 'http://cb4.creditinfosolutions.com/BatchUploader/Batch'}
 
+                customers = []
                 for command in root.findall('.//ns:Command', ns):
                     identifier = command.attrib.get('identifier', '')
                     company = command.find('.//ns:Company', ns)
@@ -218,19 +192,19 @@ def upload_both_files(request):
 
                     print(f"Saving customer: {identifier}, {birth_surname}, {customer_code}, {phone}, {amount}")
 
-                    SubmittedCustomerData.objects.update_or_create(
+                    customers.append(SubmittedCustomerData(
                         identifier=identifier,
-                        defaults={
-                            'trade_name': trade_name,
-                            'registration_number': registration_number,
-                            'customer_code': customer_code,
-                            'phone': phone,
-                            'birth_surname': birth_surname,
-                            'total_loan_amount': float(amount),
-                            'submitted_by': request.user,
-                        }
-                    )
+                        trade_name=trade_name,
+                        registration_number=registration_number,
+                        customer_code=customer_code,
+                        phone=phone,
+                        birth_surname=birth_surname,
+                        total_loan_amount=float(amount),
+                        submitted_by=request.user,
+                    ))
                     customer_count += 1
+                # One COPY/upsert instead of an update_or_create per customer
+                upsert_submitted_customers(customers)
             except Exception as e:
                 messages.error(request, f"Failed to process customer file: {e}")
 
@@ -240,7 +214,8 @@ def upload_both_files(request):
                 error_content = error_file.read()
                 if error_content.startswith(b'\xef\xbb\xbf'):
                     error_content = error_content[3:]
-                root = ET.fromstring(error_content.decode('utf-8'))
+                with phase('parse'):
+                    root = ET.fromstring(error_content.decode('utf-8'))
                 
                 # Create a unique upload identifier
                 upload_session_id = f"upload_{request.user.id}_{timezone.now().strftime('%Y%m%d%H%M%S')}"
@@ -255,9 +230,17 @@ def upload_both_files(request):
                         filename=error_file.name
                     )
 
-                for command in root.findall('.//Command'):
+                error_parameters = []
+                error_codes = {}
+                commands = root.findall('.//Command')
+                # Customer ids resolved once for the whole report; customers of
+                # the submitted data above already exist and keep their details
+                customer_ids = ensure_customers({
+                    command.attrib.get('identifier', ''): ('', command.findtext('CustomerName') or '', '')
+                    for command in commands
+                })
+                for command in commands:
                     identifier = command.attrib.get('identifier', '')
-                    customer_name = command.findtext('CustomerName') or ''
                     account_number = command.findtext('AccountNumber') or ''
                     amount_str = command.findtext('Amount') or '0'
                     national_id = command.findtext('NationalID') or ''
@@ -270,7 +253,7 @@ def upload_both_files(request):
                         error_code = ex.findtext('ErrorCode') or 'UNKNOWN'
                         message = ''
                         line_number = ''
-                        customer_details = {}
+                        parameters = {}
                         params_element = ex.find('Parameters')
                         if params_element is not None:
                             for param in params_element.findall('parameter'):
@@ -281,18 +264,13 @@ def upload_both_files(request):
                                         message = val
                                     elif key == 'LineNumber':
                                         line_number = val
-                                    customer_details[key] = val
-
-                        severity = 'medium'
-                        if error_code.startswith('E'):
-                            severity = 'high'
-                        elif error_code.startswith('W'):
-                            severity = 'low'
-                        elif error_code.startswith('C'):
-                            severity = 'critical'
+                                    parameters[key] = val
 
-                        # Generate friendly error message using our function
-                        friendly_message = get_friendly_error_message(error_code, message)
+                        # Severity and friendly message (code.template) come from
+                        # the code catalogue, looked up once per code
+                        if error_code not in error_codes:
+                            error_codes[error_code] = get_error_code(error_code)
+                        code = error_codes[error_code]
 
                         # Check if this error already exists for this identifier
                         existing_error = CustomerError.objects.filter(
@@ -302,55 +280,41 @@ def upload_both_files(request):
                             status='pending'  # Only check pending errors to allow resolved ones to be recreated
                         ).first()
 
-                        # Store customer code from matching submitted data
-                        submitted_data = SubmittedCustomerData.objects.filter(identifier=identifier).first()
-                        customer_code = submitted_data.customer_code if submitted_data else ''
-
                         if not existing_error:
-                            # Create error with customer code included
                             # Ensure we use the batch history record created earlier
                             error = CustomerError.objects.create(
                                 batch=batch_history,  # Use the BatchHistory object created earlier
+                                customer_id=customer_ids.get(identifier),
                                 identifier=identifier,
-                                customer_name=submitted_data.birth_surname if submitted_data and submitted_data.birth_surname else customer_name,
-                                customer_code=submitted_data.customer_code if submitted_data else customer_code,
                                 account_number=account_number,
                                 amount=amount,
                                 national_id=national_id,
                                 error_code=error_code,
+                                code=code,
                                 message=message,
                                 line_number=line_number,
-                                severity=severity,
+                                severity=code.severity,
                                 status='pending',
                                 uploaded_by=request.user,
                                 xml_file_name=error_file.name,
-                                customer_details={
-                                    **customer_details,
-                                    'birth_surname': submitted_data.birth_surname if submitted_data else '',
-                                    'phone': submitted_data.phone if submitted_data else '',
-                                }
                             )
-                            # Store friendly message in customer_details_json
-                            if hasattr(error, 'customer_details_json'):
-                                error.customer_details_json = {'friendly_message': friendly_message}
-                                error.save()
-                            
+                            error_parameters.append((error, parameters))
                             error_count += 1
-                            current_errors.append(error.id)
+                            if first_error_id is None:
+                                first_error_id = error.id
+                            last_error_id = error.id
                 
                 # Update batch history with final error count
                 if batch_history:
                     batch_history.error_count = error_count
                     batch_history.save()
+                save_parameters(error_parameters)
                 
-                # Store current upload session errors in session
-                request.session['current_upload_errors'] = current_errors
                 # Store the recent upload information in session
                 request.session['recent_upload'] = {
                     'timestamp': timezone.now().isoformat(),
                     'error_count': error_count,
                     'customer_count': customer_count,
-                    'error_ids': current_errors,
                     'filename': error_file.name}
                 
             except Exception as e:
@@ -365,7 +329,9 @@ def upload_both_files(request):
             filename=error_file.name if error_file else "No file",
             customer_count=customer_count,
             error_count=error_count,
-            error_ids=current_errors,
+            batch=batch_history,
+            first_error_id=first_error_id,
+            last_error_id=last_error_id,
             is_active=True
         )
 
@@ -700,18 +666,6 @@ def documentation_view(request):
     return render(request, 'documentation.html', context)
 @login_required
 def customer_error_dashboard(request):
-    # Add at the beginning of the view
-    # Clean up recent uploads if no errors exist
-    recent_upload = RecentUpload.objects.filter(user=request.user, is_active=True).first()
-    if recent_upload:
-        # Check if any of the stored error IDs still exist
-        existing_errors = CustomerError.objects.filter(id__in=recent_upload.error_ids).exists()
-        if not existing_errors:
-            # No errors exist anymore, delete the recent upload record
-            recent_upload.delete()
-            if 'recent_upload' in request.session:
-                del request.session['recent_upload']
-
     # Handle the status update
     if request.method == 'POST' and 'error_id' in request.POST and 'status' in request.POST:
         error_id = request.POST.get('error_id')
@@ -720,18 +674,19 @@ def customer_error_dashboard(request):
         
         try:
             error = CustomerError.objects.get(id=error_id)
-            if new_status in ['pending', 'resolved', 'ignored']:
-                error.status = new_status
-                error.notes = notes
-                if new_status == 'resolved' and error.status != 'resolved':
-                    error.resolved_by = request.user
-                    error.resolved_at = timezone.now()
-                error.save()
-                messages.success(request, f"Error status updated to {error.get_status_display()}.")
-                
+            if new_status in TARGET_STATUSES:
+                # Through transition_errors so the change is checked and lands in ErrorHistory
+                result = transition_errors(CustomerError.objects.filter(id=error.id), new_status,
+                                           user=request.user, notes=notes)
+                error.refresh_from_db()
+                if result.updated:
+                    messages.success(request, f"Error status updated to {error.get_status_display()}.")
+                else:
+                    messages.info(request, f"Error is already {error.get_status_display()}.")
+
                 # For AJAX requests
                 if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                    return JsonResponse({'success': True})
+                    return JsonResponse({'success': True, 'updated': result.updated})
         except CustomerError.DoesNotExist:
             messages.error(request, "Error not found.")
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -745,7 +700,7 @@ def customer_error_dashboard(request):
     status_filter = request.GET.get('status', 'pending')
     
     # Get all errors for counting purposes
-    all_errors = CustomerError.objects.select_related('uploaded_by').all()
+    all_errors = CustomerError.objects.select_related('uploaded_by', 'customer__submission').all()
     
     # Filter errors based on status
     if status_filter == 'all':
@@ -753,34 +708,29 @@ def customer_error_dashboard(request):
     else:
         errors = all_errors.filter(status=status_filter)
     
-    # Get counts for display
-    total_errors = all_errors.count()
-    pending_errors = all_errors.filter(status='pending').count()
-    resolved_errors = all_errors.filter(status='resolved').count()
-    ignored_errors = all_errors.filter(status='ignored').count()
+    # Get counts for display (cached until errors change, see core/dashboard_cache.py)
+    error_stats = dashboard_cache.error_stats()
     
     # Check if we have current upload session errors
     current_upload_errors = request.session.get('current_upload_errors', [])
     current_upload_count = len(current_upload_errors) if current_upload_errors else 0
     
-    # Group errors by identifiers to avoid duplicates
+    # Group errors by identifiers to avoid duplicates: the database keeps
+    # the most recent error per identifier and error code
     unique_errors = {}
-    for error in errors:
-        # Only include the first occurrence of each error code for an identifier
+    for error in distinct_errors(errors):
         key = f"{error.identifier}_{error.error_code}"
         if key not in unique_errors:
-            submitted = SubmittedCustomerData.objects.filter(identifier=error.identifier).first()
+            submitted = submission_of(error)
             
-            # Get the customer code either from the error or submitted data
-            customer_code = error.customer_code or (submitted.customer_code if submitted else '')
+            customer_code = error.customer.customer_code if error.customer else ''
             
             # Use the error translator utility to get the friendly message
             from .error_translator_utils import process_dashboard_error
             friendly_message = process_dashboard_error(error.error_code, error.message)
             
-            # Store the friendly message and customer code on the error object
+            # Store the friendly message on the error object
             error.friendly_message = friendly_message
-            error.customer_code = customer_code
                 
             unique_errors[key] = {
                 'error': error,
@@ -791,40 +741,28 @@ def customer_error_dashboard(request):
     # Convert to list for template
     data = list(unique_errors.values())
     
-    # Get most recent upload for current user
-    recent_upload = RecentUpload.objects.filter(user=request.user, is_active=True).first()
-    
-    recent_errors = []
-    if recent_upload:
-        recent_errors_raw = CustomerError.objects.filter(id__in=recent_upload.error_ids)
-        for error in recent_errors_raw:
-            # Get corresponding submitted data
-            submitted = SubmittedCustomerData.objects.filter(identifier=error.identifier).first()
-            
-            # Get friendly message
-            from .error_translator_utils import process_dashboard_error
-            friendly_message = process_dashboard_error(error.error_code, error.message)
-            
-            error_data = {
-                'error': error,
-                'submitted': submitted,
-                'friendly_message': friendly_message
-            }
-            recent_errors.append(error_data)
+    # Most recent upload of the current user; uploads whose errors are all
+    # gone are cleaned up here (the next request then shows the one before)
+    current_upload = dashboard_cache.recent_upload(request.user)
+    if current_upload is not None and not current_upload['recent_errors']:
+        RecentUpload.objects.filter(pk=current_upload['id']).delete()
+        current_upload = None
+    if current_upload is None and 'recent_upload' in request.session:
+        del request.session['recent_upload']
 
     context = {
         'data': data,
         'error_stats': {
-            'total': total_errors,
-            'pending': pending_errors,
-            'resolved': resolved_errors
+            'total': error_stats['total'],
+            'pending': error_stats['pending'],
+            'resolved': error_stats['resolved']
         },
-        'current_upload': {
-            'timestamp': recent_upload.timestamp if recent_upload else None,
-            'customer_count': recent_upload.customer_count if recent_upload else 0,
-            'error_count': recent_upload.error_count if recent_upload else 0,
-            'filename': recent_upload.filename if recent_upload else '',
-            'recent_errors': recent_errors
+        'current_upload': current_upload or {
+            'timestamp': None,
+            'customer_count': 0,
+            'error_count': 0,
+            'filename': '',
+            'recent_errors': []
         },
         'status_filter': status_filter
     }
@@ -867,101 +805,103 @@ def validate_xml_file(request):
                 content = content[3:]
             xml_content = content.decode('utf-8-sig')
 
-            root = ET.fromstring(xml_content)
+            with phase('parse'):
+                root = ET.fromstring(xml_content)
             ns = {'ns': 'http://cb4.creditinfosolutions.com/BatchUploader/Batch'}
 
-            for command in root.findall('.//ns:Command', ns):
-                identifier = command.attrib.get('identifier', '')
+            with phase('validation'):
+                for command in root.findall('.//ns:Command', ns):
+                    identifier = command.attrib.get('identifier', '')
                 
-                # Validate StorInstalment structure
-                stor_instalment = command.find('.//ns:Cis.CB4.Projects.TZ.BOT.Body.Products.StorInstalment', ns)
-                if stor_instalment is None:
-                    validation_errors.append(f"Invalid command structure in Command {identifier}")
-                    continue
+                    # Validate StorInstalment structure
+                    stor_instalment = command.find('.//ns:Cis.CB4.Projects.TZ.BOT.Body.Products.StorInstalment', ns)
+                    if stor_instalment is None:
+                        validation_errors.append(f"Invalid command structure in Command {identifier}")
+                        continue
 
-                # Validate Instalment section
-                instalment = stor_instalment.find('ns:Instalment', ns)
-                if instalment is not None:
-                    # Required Instalment fields
-                    instalment_fields = {
-                        'InstalmentCount': ('int', None),
-                        'InstalmentType': ('lookup', 'InstalmentType.Fixed'),
-                        'OutstandingAmount': ('decimal', None),
-                        'PeriodicityOfPayments': ('lookup', None),
-                        'TypeOfInstalmentLoan': ('lookup', 'TypeOfInstalmentLoan.BusinessLoan'),
-                        'CurrencyOfLoan': ('lookup', 'Currency.TZS'),
-                        'TotalLoanAmount': ('decimal', None),
-                        'NegativeStatusOfLoan': ('lookup', 'NegativeStatusOfLoan.NoNegativeStatus'),
-                        'PhaseOfLoan': ('lookup', 'PhaseOfLoan.Existing'),
-                        'RescheduledLoan': ('lookup', 'Bool.False')
-                    }
+                    # Validate Instalment section
+                    instalment = stor_instalment.find('ns:Instalment', ns)
+                    if instalment is not None:
+                        # Required Instalment fields
+                        instalment_fields = {
+                            'InstalmentCount': ('int', None),
+                            'InstalmentType': ('lookup', 'InstalmentType.Fixed'),
+                            'OutstandingAmount': ('decimal', None),
+                            'PeriodicityOfPayments': ('lookup', None),
+                            'TypeOfInstalmentLoan': ('lookup', 'TypeOfInstalmentLoan.BusinessLoan'),
+                            'CurrencyOfLoan': ('lookup', 'Currency.TZS'),
+                            'TotalLoanAmount': ('decimal', None),
+                            'NegativeStatusOfLoan': ('lookup', 'NegativeStatusOfLoan.NoNegativeStatus'),
+                            'PhaseOfLoan': ('lookup', 'PhaseOfLoan.Existing'),
+                            'RescheduledLoan': ('lookup', 'Bool.False')
+                        }
 
-                    for field, (field_type, expected_value) in instalment_fields.items():
-                        elem = instalment.find(f'ns:{field}', ns)
-                        if elem is None or not elem.text:
-                            validation_errors.append(f"Missing {field} in Command {identifier}")
-                        elif expected_value and elem.text != expected_value:
-                            validation_errors.append(f"Invalid {field} value in Command {identifier}")
-
-                    # Validate ContractDates
-                    contract_dates = instalment.find('ns:ContractDates', ns)
-                    if contract_dates is not None:
-                        for date_field in ['Start', 'ExpectedEnd', 'RealEnd']:
-                            date_elem = contract_dates.find(f'ns:{date_field}', ns)
-                            if date_elem is None or not elem.text:
-                                validation_errors.append(f"Missing {date_field} date in Command {identifier}")
-
-                # Validate ConnectedSubject
-                connected_subject = instalment.find('.//ns:ConnectedSubject', ns)
-                if connected_subject is not None:
-                    company = connected_subject.find('.//ns:Company', ns)
-                    if company is not None:
-                        # Validate CompanyData
-                        company_data = company.find('ns:CompanyData', ns)
-                        if company_data is not None:
-                            company_fields = {
-                                'EstablishmentDate': ('datetime', None),
-                                'LegalForm': ('lookup', 'LegalForm.GovernmentalInstitution'),
-                                'RegistrationNumber': ('string', None),
-                                'TradeName': ('string', None)
-                            }
-
-                            for field, (field_type, expected_value) in company_fields.items():
-                                elem = company_data.find(f'ns:{field}', ns)
-                                if elem is None or not elem.text:
-                                    validation_errors.append(f"Missing {field} in Command {identifier}")
-                                elif expected_value and elem.text != expected_value:
-                                    validation_errors.append(f"Invalid {field} value in Command {identifier}")
-
-                        # Validate AddressesCompany
-                        addresses = company.find('.//ns:AddressesCompany/ns:Registration', ns)
-                        if addresses is not None:
-                            for field in ['Country', 'District', 'Region']:
-                                elem = addresses.find(f'ns:{field}', ns)
-                                if elem is None or not elem.text:
-                                    validation_errors.append(f"Missing {field} in Command {identifier}")
-
-                        # Validate ContactsCompany
-                        contacts = company.find('ns:ContactsCompany', ns)
-                        if contacts is not None:
-                            phone = contacts.find('ns:CellularPhone', ns)
-                            if phone is None or not phone.text:
-                                validation_errors.append(f"Missing Phone Number in Command {identifier}")
-
-                        # Validate CustomerCode
-                        customer_code = company.findtext('ns:CustomerCode', '', ns)
-                        if not customer_code.strip():
-                            validation_errors.append(f"Missing CustomerCode in Command {identifier}")
-
-                # Validate StorHeader
-                header = stor_instalment.find('ns:StorHeader', ns)
-                if header is None:
-                    validation_errors.append(f"Missing StorHeader in Command {identifier}")
-                else:
-                    for field in ['Source', 'StoreTo', 'Identifier']:
-                        elem = header.find(f'ns:{field}', ns)
-                        if elem is None or not elem.text:
-                            validation_errors.append(f"Missing {field} in StorHeader for Command {identifier}")
+                        for field, (field_type, expected_value) in instalment_fields.items():
+                            elem = instalment.find(f'ns:{field}', ns)
+                            if elem is None or not elem.text:
+                                validation_errors.append(f"Missing {field} in Command {identifier}")
+                            elif expected_value and elem.text != expected_value:
+                                validation_errors.append(f"Invalid {field} value in Command {identifier}")
+
+                        # Validate ContractDates
+                        contract_dates = instalment.find('ns:ContractDates', ns)
+                        if contract_dates is not None:
+                            for date_field in ['Start', 'ExpectedEnd', 'RealEnd']:
+                                date_elem = contract_dates.find(f'ns:{date_field}', ns)
+                                if date_elem is None or not elem.text:
+                                    validation_errors.append(f"Missing {date_field} date in Command {identifier}")
+
+                    # Validate ConnectedSubject
+                    connected_subject = instalment.find('.//ns:ConnectedSubject', ns)
+                    if connected_subject is not None:
+                        company = connected_subject.find('.//ns:Company', ns)
+                        if company is not None:
+                            # Validate CompanyData
+                            company_data = company.find('ns:CompanyData', ns)
+                            if company_data is not None:
+                                company_fields = {
+                                    'EstablishmentDate': ('datetime', None),
+                                    'LegalForm': ('lookup', 'LegalForm.GovernmentalInstitution'),
+                                    'RegistrationNumber': ('string', None),
+                                    'TradeName': ('string', None)
+                                }
+
+                                for field, (field_type, expected_value) in company_fields.items():
+                                    elem = company_data.find(f'ns:{field}', ns)
+                                    if elem is None or not elem.text:
+                                        validation_errors.append(f"Missing {field} in Command {identifier}")
+                                    elif expected_value and elem.text != expected_value:
+                                        validation_errors.append(f"Invalid {field} value in Command {identifier}")
+
+                            # Validate AddressesCompany
+                            addresses = company.find('.//ns:AddressesCompany/ns:Registration', ns)
+                            if addresses is not None:
+                                for field in ['Country', 'District', 'Region']:
+                                    elem = addresses.find(f'ns:{field}', ns)
+                                    if elem is None or not elem.text:
+                                        validation_errors.append(f"Missing {field} in Command {identifier}")
+
+                            # Validate ContactsCompany
+                            contacts = company.find('ns:ContactsCompany', ns)
+                            if contacts is not None:
+                                phone = contacts.find('ns:CellularPhone', ns)
+                                if phone is None or not phone.text:
+                                    validation_errors.append(f"Missing Phone Number in Command {identifier}")
+
+                            # Validate CustomerCode
+                            customer_code = company.findtext('ns:CustomerCode', '', ns)
+                            if not customer_code.strip():
+                                validation_errors.append(f"Missing CustomerCode in Command {identifier}")
+
+                    # Validate StorHeader
+                    header = stor_instalment.find('ns:StorHeader', ns)
+                    if header is None:
+                        validation_errors.append(f"Missing StorHeader in Command {identifier}")
+                    else:
+                        for field in ['Source', 'StoreTo', 'Identifier']:
+                            elem = header.find(f'ns:{field}', ns)
+                            if elem is None or not elem.text:
+                                validation_errors.append(f"Missing {field} in StorHeader for Command {identifier}")
 
             validation_results = {
                 'is_valid': len(validation_errors) == 0,
@@ -988,72 +928,101 @@ def validate_xml_file(request):
 def resolve_all_batch(request):
     if request.method == 'POST':
         batch_id = request.POST.get('batch_id')
-        print(f"Debug - Processing batch: {batch_id}")
-        
-        try:
-            with transaction.atomic():
-                # First try to get the batch record
-                batch = BatchHistory.objects.filter(batch_identifier=batch_id).first()
-                if not batch:
-                    messages.error(request, f"Batch {batch_id} not found")
-                    return redirect('batch_history')
-                
-                print(f"Debug - Found batch: {batch.batch_identifier}")
-                
-                # Get all pending errors for this batch
-                pending_errors = CustomerError.objects.filter(
-                    batch=batch,
-                    status='pending'  # Make sure this matches your status choices
-                )
-                
-                print(f"Debug - Found {pending_errors.count()} pending errors")
-                
-                if pending_errors.exists():
-                    now = timezone.now()
-                    
-                    # Update all pending errors
-                    update_count = pending_errors.update(
-                        status='resolved',  # Make sure this matches your status choices
-                        resolved_at=now,
-                        resolved_by=request.user
-                    )
-                    
-                    # Update batch status
-                    batch.status = 'resolved'
-                    batch.resolved_date = now
-                    batch.save()
-                    
-                    messages.success(
-                        request, 
-                        f"Successfully resolved {update_count} errors from batch {batch_id}"
-                    )
-                    print(f"Debug - Updated {update_count} errors to resolved")
-                else:
-                    # Get all errors for this batch to check their statuses
-                    all_errors = CustomerError.objects.filter(batch=batch)
-                    status_counts = all_errors.values('status').annotate(
-                        count=models.Count('status')
-                    )
-                    
-                    print(f"Debug - Error status distribution: {list(status_counts)}")
-                    
-                    if all_errors.exists():
-                        messages.warning(
-                            request,
-                            f"Found {all_errors.count()} errors but none are pending. "
-                            f"Current status distribution: "
-                            f"{', '.join([f'{s['status']}: {s['count']}' for s in status_counts])}"
-                        )
-                    else:
-                        messages.warning(request, f"No errors found for batch {batch_id}")
+        new_status = request.POST.get('status', 'resolved')
+        notes = request.POST.get('notes', '')
+
+        batch = BatchHistory.objects.filter(batch_identifier=batch_id).first()
+        if not batch:
+            messages.error(request, f"Batch {batch_id} not found")
+            return redirect('batch_history')
+        if new_status not in ('resolved', 'ignored'):
+            messages.error(request, f"Cannot move batch errors to {new_status}")
+            return redirect('batch_history')
 
+        try:
+            result = transition_batch(batch, new_status, user=request.user, notes=notes)
         except Exception as e:
+            logger.error(f"Error resolving batch {batch_id}: {str(e)}", exc_info=True)
             messages.error(request, f"Error resolving batch: {str(e)}")
-            import traceback
-            print(f"Debug - Exception: {traceback.format_exc()}")
+            return redirect('batch_history')
+
+        if result.updated:
+            messages.success(
+                request,
+                f"Successfully marked {result.updated} errors from batch {batch_id} as {new_status}"
+            )
+        elif result.total:
+            messages.warning(
+                request,
+                f"Found {result.total} errors but none are pending. "
+                f"Current status distribution: {result.display(result.before)}"
+            )
+        else:
+            messages.warning(request, f"No errors found for batch {batch_id}")
 
     return redirect('batch_history')
 
+MAX_BULK_IDS = 10000
+
+
+@login_required
+def bulk_update_error_status(request):
+    """
+    JSON endpoint for multi-select triage on the error dashboard.
+
+    POST {"ids": [1, 2, ...] | "filter": {"batch": ..., "error_code": ...},
+          "status": "resolved" | "ignored" | "pending", "notes": "..."}
+    Changes are applied set-based with ErrorHistory rows (see
+    core/error_status.py); the response only carries counts.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'POST required'}, status=405)
+    try:
+        payload = json.loads(request.body or b'{}')
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({'success': False, 'error': 'Expected a JSON object'}, status=400)
+
+    new_status = payload.get('status')
+    notes = payload.get('notes') or ''
+    ids = payload.get('ids')
+    filters = payload.get('filter')
+    if new_status not in TARGET_STATUSES:
+        return JsonResponse({'success': False,
+                             'error': f"status must be one of {', '.join(TARGET_STATUSES)}"}, status=400)
+    if not isinstance(notes, str):
+        return JsonResponse({'success': False, 'error': 'notes must be a string'}, status=400)
+    if (ids is None) == (filters is None):
+        return JsonResponse({'success': False, 'error': 'Pass either ids or filter'}, status=400)
+
+    try:
+        if ids is not None:
+            if (not isinstance(ids, list) or not ids
+                    or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids)):
+                raise ValueError("ids must be a non-empty list of integers")
+            if len(ids) > MAX_BULK_IDS:
+                raise ValueError(f"At most {MAX_BULK_IDS} ids per request, use a filter for more")
+            queryset = CustomerError.objects.filter(id__in=ids)
+        else:
+            queryset = filter_errors(filters)
+        result = transition_errors(queryset, new_status, user=request.user, notes=notes)
+    except (ValueError, ValidationError) as e:
+        message = '; '.join(e.messages) if isinstance(e, ValidationError) else str(e)
+        return JsonResponse({'success': False, 'error': message}, status=400)
+    except Exception as e:
+        logger.error(f"Bulk status update failed: {str(e)}", exc_info=True)
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+    # Dashboard counters in one aggregate so the page can update without a reload
+    totals = CustomerError.objects.aggregate(
+        total=Count('id'),
+        pending=Count('id', filter=Q(status='pending')),
+        resolved=Count('id', filter=Q(status='resolved')),
+        ignored=Count('id', filter=Q(status='ignored')),
+    )
+    return JsonResponse({'success': True, **result.as_dict(), 'error_stats': totals})
+
 @login_required
 def batch_history(request):
     batches = BatchHistory.objects.all().order_by('-upload_date')
@@ -1082,25 +1051,25 @@ def upload_report(request):
     
     # Get batch filter if present
     batch_id = request.GET.get('batch')
-    errors = CustomerError.objects.all()
+    errors = CustomerError.objects.select_related('customer__submission')
     
     if batch_id:
         errors = errors.filter(xml_file_name__contains(batch_id))
     
     # Write error data
     for error in errors:
-        submitted_data = SubmittedCustomerData.objects.filter(identifier=error.identifier).first()
+        submitted_data = submission_of(error)
         
         # First try to get trade name, if not available use birth surname
         customer_name = (submitted_data.trade_name if submitted_data and submitted_data.trade_name 
                         else (submitted_data.birth_surname if submitted_data and submitted_data.birth_surname 
-                        else error.customer_name))
+                        else (error.customer.name if error.customer else '')))
         
         writer.writerow([
             error.xml_file_name,
             error.identifier,
             customer_name,  # Modified to use the fallback logic
-            submitted_data.customer_code if submitted_data else error.customer_code,
+            error.customer.customer_code if error.customer else '',
             error.error_code,
             error.message,
             error.get_status_display(),
@@ -1113,23 +1082,19 @@ def upload_report(request):
 @login_required
 def delete_batch(request, batch_id):
     if request.method == 'POST':
+        batch = BatchHistory.objects.filter(batch_identifier=batch_id).first()
+        if batch is None:
+            messages.warning(request, "Batch not found")
+            return redirect('batch_history')
         try:
-            with transaction.atomic():
-                # Fix: Change the filter to use correct lookup syntax
-                CustomerError.objects.filter(
-                    identifier__contains=batch_id
-                ).delete()
-                
-                deleted = BatchHistory.objects.filter(
-                    batch_identifier=batch_id
-                ).delete()
-                
-                if deleted[0] > 0:
-                    messages.success(request, f"Successfully deleted batch {batch_id}")
-                else:
-                    messages.warning(request, "Batch not found")
-                
+            summary = purge_batch(batch)
+            messages.success(
+                request,
+                f"Successfully deleted batch {batch_id} ({summary['errors']} errors, "
+                f"{summary['clean_entries']} clean entries)"
+            )
         except Exception as e:
+            logger.error(f"Error deleting batch {batch_id}: {str(e)}", exc_info=True)
             messages.error(request, f"Error deleting batch: {str(e)}")
     
     return redirect('batch_history')
@@ -1147,7 +1112,7 @@ def extract_clean_entries(request, batch_id, format_type='xml'):
         clean_entries = CustomerError.objects.filter(
             batch=batch,
             status='ok'
-        )
+        ).select_related('customer')
 
         if not clean_entries.exists():
             messages.warning(request, "No clean entries found in this batch")
@@ -1165,7 +1130,7 @@ def extract_clean_entries(request, batch_id, format_type='xml'):
             for entry in clean_entries:
                 writer.writerow([
                     entry.identifier,
-                    entry.customer_name,
+                    entry.customer.name if entry.customer else '',
                     entry.account_number,
                     entry.amount,
                     entry.national_id
@@ -1177,11 +1142,11 @@ def extract_clean_entries(request, batch_id, format_type='xml'):
             for entry in clean_entries:
                 customer = ET.SubElement(root, 'customer')
                 ET.SubElement(customer, 'identifier').text = entry.identifier
-                ET.SubElement(customer, 'customerName').text = entry.customer_name
+                ET.SubElement(customer, 'customerName').text = entry.customer.name if entry.customer else ''
                 ET.SubElement(customer, 'accountNumber').text = entry.account_number
                 ET.SubElement(customer, 'amount').text = str(entry.amount)
                 ET.SubElement(customer, 'nationalId').text = entry.national_id
-                ET.SubElement(customer, 'customerCode').text = entry.customer_code
+                ET.SubElement(customer, 'customerCode').text = entry.customer.customer_code if entry.customer else ''
 
             xml_str = ET.tostring(root, encoding='unicode', method='xml')
             response = HttpResponse(
@@ -1255,71 +1220,21 @@ def validate_personal_data(data):
     return errors
 
 def get_header_identifier(xml_content):
-    """Extract identifier from XML header with proper namespace handling"""
-    try:
-        root = ET.fromstring(xml_content.decode('utf-8'))
-        
-        # Try with namespace first
-        ns = {'ns': 'http://cb4.creditinfosolutions.com/BatchUploader/Batch'}
-        identifier = root.findtext('.//ns:Header/ns:Identifier', '', ns)
-        
-        # If not found, try without namespace
-        if not identifier:
-            identifier = root.findtext('.//Header/Identifier', '')
-        
-        return identifier.strip() if identifier else None
-    except Exception as e:
-        print(f"Error extracting header identifier: {e}")
-        return None
+    """Extract identifier from the XML Header (customer batch or BOT report)"""
+    return probe_header(xml_content).identifier
 
 def get_batch_identifier(content, is_customer_file=False):
-    """Extract batch identifier from XML content based on file type"""
-    try:
-        # Handle UTF-8 BOM if present
-        if content.startswith(b'\xef\xbb\xbf'):
-            content = content[3:]
-            
-        root = ET.fromstring(content.decode('utf-8'))
-        
-        if is_customer_file:
-            # Customer XML with namespace
-            ns = {'ns': 'http://cb4.creditinfosolutions.com/BatchUploader/Batch'}
-            
-            # Try different paths for customer file
-            paths = [
-                './/ns:Header/ns:Identifier',  # With namespace
-                './/Header/Identifier',        # Without namespace
-            ]
-            
-            for path in paths:
-                try:
-                    identifier = root.findtext(path, '', namespaces=ns if 'ns:' in path else None)
-                    if identifier:
-                        return identifier.strip()
-                except:
-                    continue
-        else:
-            # BOT report XML - try multiple possible paths
-            paths = [
-                './/Header/Identifier',
-                './/BatchResponse/Header/Identifier',
-                './/Header/BatchId'
-            ]
-            
-            for path in paths:
-                try:
-                    identifier = root.findtext(path)
-                    if identifier:
-                        return identifier.strip()
-                except:
-                    continue
-        
-        return None
-        
-    except Exception as e:
-        print(f"XML Parsing Error: {str(e)}")
-        print(f"Content start: {content[:200]}")  # Debug first 200 chars
+    """
+    Extract batch identifier from the Header block. Only the Header is
+    parsed; BOT reports without an Identifier fall back to their BatchId.
+    """
+    header = probe_header(content)
+    if header.kind is None:
+        logger.warning("No customer batch or BOT report Header found")
         return None
+    if is_customer_file:
+        return header.identifier
+    return header.identifier or header.batch_id
 @login_required
 def upload_customer_xml(request):
     if request.method == 'POST':
@@ -1327,7 +1242,8 @@ def upload_customer_xml(request):
         bot_report = request.FILES.get('bot_report')
         customer_count = 0
         error_count = 0
-        current_errors = []
+        # Id range of the errors created by this upload
+        first_error_id = last_error_id = None
         
         # Add this block to extract batch ID
         customer_batch_id = None  # Initialize batch ID
@@ -1375,7 +1291,7 @@ def upload_customer_xml(request):
 
         # ...rest of your existing code continues...
 
-        # Clear session data
+        # Clear session data left by uploads that stored error id lists
         if 'current_upload_errors' in request.session:
             del request.session['current_upload_errors']
 
@@ -1389,6 +1305,7 @@ def upload_customer_xml(request):
             ns = {'ns': 'http://cb4.creditinfosolutions.com/BatchUploader/Batch'}
 
             # Process customer data and store it
+            customers = []
             for command in customer_root.findall('.//ns:Command', ns):
                 identifier = command.attrib.get('identifier', '')
                 company = command.find('.//ns:Company', ns)
@@ -1400,18 +1317,18 @@ def upload_customer_xml(request):
                 phone = company.findtext('.//ns:CellularPhone', default='', namespaces=ns)
                 amount = command.findtext('.//ns:TotalLoanAmount', default='0', namespaces=ns)
 
-                # Store customer data
-                SubmittedCustomerData.objects.update_or_create(
+                customers.append(SubmittedCustomerData(
                     identifier=identifier,
-                    defaults={
-                        'birth_surname': birth_surname,
-                        'customer_code': customer_code,
-                        'phone': phone,
-                        'total_loan_amount': float(amount),
-                        'submitted_by': request.user,
-                    }
-                )
+                    birth_surname=birth_surname,
+                    customer_code=customer_code,
+                    phone=phone,
+                    total_loan_amount=float(amount),
+                    submitted_by=request.user,
+                ))
                 customer_count += 1
+            # Store customer data
+            upsert_submitted_customers(customers, update_fields=[
+                'birth_surname', 'customer_code', 'phone', 'total_loan_amount', 'submitted_by'])
 
             # Process BOT report XML
             bot_content = bot_report.read()
@@ -1429,14 +1346,19 @@ def upload_customer_xml(request):
             )
 
             # Process errors from BOT report
-            for command in bot_root.findall('.//Command'):
+            error_parameters = []
+            error_codes = {}
+            commands = bot_root.findall('.//Command')
+            # Customer ids resolved once for the whole report
+            customer_ids = ensure_customers({command.attrib.get('identifier', ''): ('', '', '') for command in commands})
+            for command in commands:
                 identifier = command.attrib.get('identifier', '')
                 
                 for ex in command.findall('Exception'):
                     error_code = ex.findtext('ErrorCode') or 'UNKNOWN'
                     message = ''
                     line_number = ''
-                    customer_details = {}
+                    parameters = {}
                     
                     # Extract error details from Parameters
                     params_element = ex.find('Parameters')
@@ -1449,54 +1371,43 @@ def upload_customer_xml(request):
                                     message = val
                                 elif key == 'LineNumber':
                                     line_number = val
-                                customer_details[key] = val
-
-                    # Set severity based on error code
-                    severity = 'medium'
-                    if error_code.startswith('E'):
-                        severity = 'high'
-                    elif error_code.startswith('W'):
-                        severity = 'low'
-                    elif error_code.startswith('C'):
-                        severity = 'critical'
+                                parameters[key] = val
 
-                    # Get submitted customer data
-                    submitted_data = SubmittedCustomerData.objects.filter(identifier=identifier).first()
+                    # Severity comes from the code catalogue, looked up once per code
+                    if error_code not in error_codes:
+                        error_codes[error_code] = get_error_code(error_code)
+                    code = error_codes[error_code]
 
                     # Create error record
                     error = CustomerError.objects.create(
                         batch=batch_history,
+                        customer_id=customer_ids.get(identifier),
                         identifier=identifier,
-                        customer_name=submitted_data.birth_surname if submitted_data else '',
-                        customer_code=submitted_data.customer_code if submitted_data else '',
-                        phone=submitted_data.phone if submitted_data else '',
                         error_code=error_code,
+                        code=code,
                         message=message,
                         line_number=line_number,
-                        severity=severity,
+                        severity=code.severity,
                         status='pending',
                         uploaded_by=request.user,
                         xml_file_name=bot_report.name,
-                        customer_details={
-                            **customer_details,
-                            'birth_surname': submitted_data.birth_surname if submitted_data else '',
-                            'phone': submitted_data.phone if submitted_data else '',
-                        }
                     )
+                    error_parameters.append((error, parameters))
                     error_count += 1
-                    current_errors.append(error.id)
+                    if first_error_id is None:
+                        first_error_id = error.id
+                    last_error_id = error.id
 
             # Update batch history
             batch_history.error_count = error_count
             batch_history.save()
+            save_parameters(error_parameters)
 
             # Update session data
-            request.session['current_upload_errors'] = current_errors
             request.session['recent_upload'] = {
                 'timestamp': timezone.now().isoformat(),
                 'error_count': error_count,
                 'customer_count': customer_count,
-                'error_ids': current_errors,
                 'filename': bot_report.name
             }
 
@@ -1506,7 +1417,9 @@ def upload_customer_xml(request):
                 filename=bot_report.name,
                 customer_count=customer_count,
                 error_count=error_count,
-                error_ids=current_errors,
+                batch=batch_history,
+                first_error_id=first_error_id,
+                last_error_id=last_error_id,
                 is_active=True
             )
 
@@ -1566,7 +1479,7 @@ from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import HttpResponse
-from django.core.files.storage import FileSystemStorage
+from django.core.files.storage import FileSystemStorage, default_storage
 from django.utils import timezone
 from .bot_validator import BOTValidator
 from .models import BatchHistory
@@ -1615,8 +1528,8 @@ def validate_xml_pair(request):
                 # Store corrections in session
                 request.session['xml_corrections'] = corrections
                 
-                # Save clean XML to FileSystemStorage
-                fs = FileSystemStorage()
+                # Save clean XML to content-addressed storage
+                fs = default_storage
                 timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
                 clean_xml_name = f'clean_data_{timestamp}.xml'
                 clean_xml_path = fs.save(f'clean_xml/{clean_xml_name}', clean_xml)
@@ -1653,13 +1566,19 @@ def validate_xml_pair(request):
             return redirect('upload_customer')
 
     return render(request, 'validate_xml.html')
-from django.shortcuts import render, redirect
+from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponse
-from django.core.files.storage import FileSystemStorage
+from django.http import HttpResponse, StreamingHttpResponse
+from django.core.files.storage import FileSystemStorage, default_storage
 from django.utils import timezone
 from .bot_validator import BOTValidator
+from .storage import stream_file
+from .result_cache import ValidationResultCache
+from .fingerprints import customer_timeline
+from . import profiling
+from .metrics import render_prometheus
+from django.contrib.admin.views.decorators import staff_member_required
 from .models import BatchHistory, CustomerError, SubmittedCustomerData
 from .forms import XMLUploadForm
 import logging
@@ -1669,6 +1588,23 @@ from io import BytesIO  # Added import
 
 logger = logging.getLogger(__name__)
 
+def render_cached_validation(request, cached):
+    """Render coop_validator from a memoised ValidationResult."""
+    corrections = cached.corrections
+    request.session['xml_corrections'] = corrections
+    context = {
+        'form': XMLUploadForm(),
+        'corrections': corrections,
+        'batch': cached.batch,
+    }
+    if cached.clean_xml_file:
+        with default_storage.open(cached.clean_xml_file, 'rb') as f:
+            context['clean_xml_content'] = f.read().decode('utf-8')
+        messages.success(request, 'Files validated successfully! (same files as an earlier upload, stored result reused)')
+    else:
+        messages.warning(request, 'No valid data remained after cleaning. (stored result reused)')
+    return render(request, 'core/coop_validator.html', context)
+
 @login_required
 def coop_validator(request):
     """Handle Coop Validator view"""
@@ -1691,13 +1627,22 @@ def coop_validator(request):
                     messages.error(request, 'Original file must be an XML file.')
                     return render(request, 'core/coop_validator.html', {'form': form})
                 
+                # Same pair validated before? Return the stored result without
+                # parsing or writing any CustomerError/CleanEntry rows.
+                result_cache = ValidationResultCache()
+                customer_sha256, report_sha256 = result_cache.key_for(source_file, error_file)
+                cached = result_cache.get(customer_sha256, report_sha256)
+                if cached:
+                    return render_cached_validation(request, cached)
+
                 # Process files
                 batch = process_validation_files(request, error_file, source_file)
                 
                 if batch:
                     # Process XML pair to generate clean XML
                     validator = BOTValidator()
-                    with open(batch.xml_file.path, 'rb') as xml_file, open(batch.report_file.path, 'rb') as report_file:
+                    # Read through storage so compressed blobs are decompressed
+                    with default_storage.open(batch.xml_file.name, 'rb') as xml_file, default_storage.open(batch.report_file.name, 'rb') as report_file:
                         customer_content = xml_file.read()
                         bot_content = report_file.read()
                         # Remove BOM if present
@@ -1716,26 +1661,28 @@ def coop_validator(request):
                         clean_xml, corrections = validator.process_xml_pair(
                             customer_content,
                             bot_content,
-                            batch=batch
+                            batch=batch,
+                            incremental=getattr(settings, 'INCREMENTAL_REVALIDATION', True)
                         )
                     
                     if clean_xml:
-                        fs = FileSystemStorage()
+                        fs = default_storage
                         timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
                         clean_xml_name = f'clean_data_{timestamp}.xml'
-                        # Wrap clean_xml in BytesIO for FileSystemStorage
+                        # Wrap clean_xml in BytesIO for storage
                         clean_xml_file = BytesIO(clean_xml)
                         logger.debug("Wrapped clean_xml in BytesIO for storage")
                         clean_xml_path = fs.save(f'clean_xml/{clean_xml_name}', clean_xml_file)
                         batch.clean_xml_file = clean_xml_path
                         batch.status = 'completed'
                         batch.save()
+                        result_cache.put(customer_sha256, report_sha256, batch, corrections, clean_xml_path)
                         request.session['xml_corrections'] = corrections
                         messages.success(request, 'Files validated successfully!')
                         
-                        # Read clean XML content for preview
-                        with open(fs.path(clean_xml_path), 'r', encoding='utf-8') as f:
-                            clean_xml_content = f.read()
+                        # Clean XML content for preview (already in memory, the
+                        # stored blob may be compressed)
+                        clean_xml_content = clean_xml.decode('utf-8')
                         
                         return render(request, 'core/coop_validator.html', {
                             'form': XMLUploadForm(),
@@ -1746,6 +1693,7 @@ def coop_validator(request):
                     else:
                         batch.status = 'failed'
                         batch.save()
+                        result_cache.put(customer_sha256, report_sha256, batch, corrections)
                         messages.warning(request, corrections.get('error', 'No valid data remained after cleaning.'))
                         return render(request, 'core/coop_validator.html', {
                             'form': XMLUploadForm(),
@@ -1791,7 +1739,7 @@ def upload_report(request):
     try:
         latest_batch = BatchHistory.objects.latest('upload_date')
         # Filter CustomerError using the batch ForeignKey
-        errors = CustomerError.objects.filter(batch=latest_batch)
+        errors = CustomerError.objects.filter(batch=latest_batch).select_related('batch', 'customer__submission')
         if not errors.exists():
             logger.warning(f"No errors found for batch {latest_batch.batch_identifier}")
             writer.writerow([f'No errors found for batch {latest_batch.batch_identifier}'])
@@ -1802,18 +1750,18 @@ def upload_report(request):
     
     # Write error data
     for error in errors:
-        submitted_data = SubmittedCustomerData.objects.filter(identifier=error.identifier).first()
+        submitted_data = submission_of(error)
         
         # First try to get trade name, if not available use birth surname
         customer_name = (submitted_data.trade_name if submitted_data and submitted_data.trade_name 
                         else (submitted_data.birth_surname if submitted_data and submitted_data.birth_surname 
-                        else error.customer_name))
+                        else (error.customer.name if error.customer else '')))
         
         writer.writerow([
             error.batch.batch_identifier,  # Use batch.batch_identifier instead of xml_file_name
             error.identifier,
             customer_name,
-            submitted_data.customer_code if submitted_data else error.customer_code,
+            error.customer.customer_code if error.customer else '',
             error.error_code,
             error.message,
             error.get_status_display(),
@@ -1824,7 +1772,9 @@ def upload_report(request):
     return response
 def process_validation_files(request, error_file, source_file):
     try:
-        fs = FileSystemStorage()
+        # Content-addressed: identical uploads resolve to the existing blob
+        # and are not written again.
+        fs = default_storage
         timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
         error_file_name = f'bot_report_{timestamp}_{error_file.name}'
         source_file_name = f'original_{timestamp}_{source_file.name}'
@@ -1847,14 +1797,15 @@ def process_validation_files(request, error_file, source_file):
 def download_clean_xml(request, batch_id):
     try:
         batch = BatchHistory.objects.get(id=batch_id)
-        fs = FileSystemStorage()
+        fs = default_storage
         if not batch.clean_xml_file:
             messages.error(request, "No clean XML file available for this batch.")
             return redirect('coop_validator')
-        with fs.open(batch.clean_xml_file) as xml_file:
-            response = HttpResponse(xml_file.read(), content_type='application/xml')
-            response['Content-Disposition'] = f'attachment; filename=clean_{batch.filename}'
-            return response
+        # Stream the file; compressed blobs are decompressed while sending
+        xml_file = fs.open(batch.clean_xml_file, 'rb')
+        response = StreamingHttpResponse(stream_file(xml_file), content_type='application/xml')
+        response['Content-Disposition'] = f'attachment; filename=clean_{batch.filename}'
+        return response
     except BatchHistory.DoesNotExist:
         messages.error(request, "Batch not found.")
         return redirect('coop_validator')
@@ -1863,4 +1814,94 @@ def download_clean_xml(request, batch_id):
         messages.error(request, f"Error downloading file: {str(e)}")
         return redirect('coop_validator')
     
-    
\ No newline at end of file
+    
+@login_required
+def customer_history(request):
+    """Timeline of one Command identifier or CustomerCode across every batch"""
+    identifier = request.GET.get('identifier', '').strip()
+    customer_code = request.GET.get('customer_code', '').strip()
+    timeline = list(customer_timeline(identifier=identifier, customer_code=customer_code))
+
+    summary = {
+        'batches': len({entry.batch_id for entry in timeline}),
+        'ok': sum(1 for entry in timeline if entry.outcome == 'ok'),
+        'error': sum(1 for entry in timeline if entry.outcome == 'error'),
+        'versions': len({entry.content_hash for entry in timeline}),
+    }
+    return render(request, 'customer_history.html', {
+        'identifier': identifier,
+        'customer_code': customer_code,
+        'timeline': timeline,
+        'summary': summary,
+    })
+
+
+@staff_member_required
+def profiling_stats(request):
+    """Per-view totals collected by ProfilingMiddleware and dashboard cache hit rates; POST reset=1 clears them"""
+    if request.method == 'POST' and request.POST.get('reset'):
+        profiling.stats.reset()
+        dashboard_cache.stats.reset()
+    return JsonResponse({
+        'profiling_enabled': getattr(settings, 'REQUEST_PROFILING', False),
+        'slow_request_ms': getattr(settings, 'SLOW_REQUEST_MS', 1000),
+        'views': profiling.stats.snapshot(),
+        'dashboard_cache': dashboard_cache.stats.snapshot(),
+    })
+
+
+def reconcile_metrics(request):
+    """Reconciliation phase metrics in Prometheus text format (local scrapers and staff only)"""
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+    if request.META.get('REMOTE_ADDR') not in allowed and not request.user.is_staff:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    # Only a bounded window of batches is read per scrape
+    window = getattr(settings, 'METRICS_WINDOW_BATCHES', 100)
+    batches = (BatchHistory.objects.exclude(phase_metrics={})
+               .order_by('-upload_date')
+               .values_list('batch_identifier', 'phase_metrics')[:window])
+    return HttpResponse(render_prometheus(batches) + dashboard_cache.render_prometheus(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@login_required
+def batch_archive(request, batch_id):
+    """Archived errors of a batch as JSON (?identifier=, ?error_code=, ?status=, ?offset=, ?limit=)"""
+    archive = get_object_or_404(ErrorArchive.objects.select_related('batch'), batch__batch_identifier=batch_id)
+    try:
+        offset = max(0, int(request.GET.get('offset', 0)))
+        limit = min(5000, max(1, int(request.GET.get('limit', 500))))
+    except ValueError:
+        return JsonResponse({'error': 'offset and limit must be integers'}, status=400)
+    errors = archived_errors(
+        archive,
+        identifier=request.GET.get('identifier'),
+        error_code=request.GET.get('error_code'),
+        status=request.GET.get('status'),
+        offset=offset,
+        limit=limit,
+    )
+    prefetch_related_objects(errors, 'customer')
+    fields = ['id', 'identifier', 'account_number', 'error_code', 'message', 'status', 'notes',
+              'created_at', 'resolved_at']
+    return JsonResponse({
+        'batch': archive.batch.batch_identifier,
+        'archived_at': archive.archived_at,
+        'error_count': archive.error_count,
+        'status_counts': archive.status_counts,
+        'offset': offset,
+        'errors': [
+            {
+                **{name: getattr(error, name) for name in fields},
+                'customer_name': error.customer.name if error.customer else '',
+                'customer_code': error.customer.customer_code if error.customer else '',
+                'history': [
+                    {'previous_status': h.previous_status, 'new_status': h.new_status,
+                     'changed_at': h.changed_at, 'notes': h.notes}
+                    for h in error.archived_history
+                ],
+                'parameters': error.get_parameters(),
+            }
+            for error in errors
+        ],
+    })